@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.path.join("DataBase", "ip_cache.sqlite")
+
+DAY = 24 * 60 * 60
+# How long a result stays valid, per source: GeoLite2 is republished weekly, API data moves faster,
+# and an address the API failed on is retried after an hour
+DEFAULT_TTLS = {"mmdb": 7 * DAY, "api": 1 * DAY, "api-error": 60 * 60}
+DEFAULT_MAX_ENTRIES = 100000
+# Stores between two checks of the table size, as a fraction of max_entries
+EVICTION_CHECK_FRACTION = 0.01
+
+
+class IPInfoCache:
+    """Persistent cache of IP enrichment results, keyed by address.
+
+    Every entry remembers its source ("mmdb", "api", or "api-error" for a
+    failed lookup, whose info is None) and when it was
+    fetched; get() ignores entries older than that source's TTL. Once the
+    table holds more than max_entries rows (checked every 1% of that many
+    stores), the oldest fetches are evicted.
+    One connection is shared by all threads, behind a lock.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stores_until_check = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ip_info ("
+            " ip TEXT PRIMARY KEY, source TEXT NOT NULL, info TEXT, fetched REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ip_info_fetched ON ip_info (fetched)")
+        self.conn.commit()
+
+    def _fresh(self, source, fetched):
+        return self.clock() - fetched < self.ttls.get(source, 0)
+
+    def get(self, ip):
+        """(source, info) cached for ip, or None if there is no entry or it has expired."""
+        with self._lock:
+            row = self.conn.execute("SELECT source, info, fetched FROM ip_info WHERE ip = ?", (ip,)).fetchone()
+        if row is None or not self._fresh(row[0], row[2]):
+            return None
+        return row[0], json.loads(row[1])
+
+    def get_many(self, ips):
+        """Dict mapping each of ips that has a fresh entry to its (source, info)."""
+        ips = list(dict.fromkeys(ips))
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for first in range(0, len(ips), 500):
+                chunk = ips[first:first + 500]
+                rows = self.conn.execute(
+                    f"SELECT ip, source, info, fetched FROM ip_info WHERE ip IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for ip, source, info, fetched in rows:
+                    if self._fresh(source, fetched):
+                        found[ip] = (source, json.loads(info))
+        return found
+
+    def put(self, ip, source, info):
+        self.put_many([(ip, source, info)])
+
+    def put_many(self, entries):
+        """Store (ip, source, info) entries, replacing older ones, then evict down to max_entries."""
+        now = self.clock()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ip_info VALUES (?, ?, ?, ?)",
+                [(ip, source, json.dumps(info), now) for ip, source, info in entries]
+            )
+            self._stores_until_check -= len(entries)
+            if self._stores_until_check <= 0:
+                self._stores_until_check = max(int(self.max_entries * EVICTION_CHECK_FRACTION), 1)
+                excess = self.conn.execute("SELECT COUNT(*) FROM ip_info").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self.conn.execute(
+                        "DELETE FROM ip_info WHERE ip IN (SELECT ip FROM ip_info ORDER BY fetched LIMIT ?)", (excess,)
+                    )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_default_cache = None
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+
+def get_ip_cache():
+    """The process-wide cache at CACHE_PATH, opened on first use; None if it cannot be opened."""
+    global _default_cache, _default_cache_failed
+    with _default_cache_lock:
+        if _default_cache is None and not _default_cache_failed:
+            try:
+                _default_cache = IPInfoCache()
+            except sqlite3.Error as e:
+                _default_cache_failed = True
+                print(f"IP cache disabled, cannot open {CACHE_PATH}: {str(e)}")
+        return _default_cache
@@ -0,0 +1,169 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ip_cache import get_ip_cache
+from know_provider import lookup_many
+
+API_URL = "https://ipinfo.io/{ip}/json"
+
+# Requests in flight at once, and the sustained / burst request rate allowed against the API
+DEFAULT_API_WORKERS = 8
+DEFAULT_API_RATE = 10.0
+DEFAULT_API_BURST = 10
+# (connect, read) timeout of one request, and the budget for resolving a whole batch
+DEFAULT_API_TIMEOUT = (3.05, 5)
+DEFAULT_API_DEADLINE = 60.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until one of burst tokens, refilled at rate per second, is free."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Take a token; returns False without taking one if none is free before deadline (a clock() value)."""
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_time = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+
+
+class ApiResolver:
+    """Resolves many addresses against API_URL with bounded concurrency and a shared rate limit.
+
+    Each worker thread keeps its own keep-alive session, so connections are
+    reused across lookups. resolve_many stops starting requests once its
+    deadline has passed, so one slow endpoint costs at most that long.
+    """
+
+    def __init__(self, workers=DEFAULT_API_WORKERS, rate=DEFAULT_API_RATE, burst=DEFAULT_API_BURST,
+                 timeout=DEFAULT_API_TIMEOUT, deadline=DEFAULT_API_DEADLINE):
+        self.workers = workers
+        self.timeout = timeout
+        self.deadline = deadline
+        self.bucket = TokenBucket(rate, burst)
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._local.session = session
+        return session
+
+    def fetch(self, ip, deadline=None):
+        """(ip, info) on success, (ip, None) on a failure worth remembering, or (ip, False) to retry later."""
+        if not self.bucket.acquire(deadline):
+            return ip, False
+        try:
+            response = self._session().get(API_URL.format(ip=ip), timeout=self.timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                # Throttled or a server hiccup: says nothing about the address
+                print(f"API Error for {ip}: HTTP {response.status_code}")
+                return ip, False
+            response.raise_for_status()
+            return ip, response.json()
+        except Exception as e:
+            print(f"API Error for {ip}: {str(e)}")
+            return ip, None
+
+    def resolve_many(self, ips):
+        """Dict mapping each address that was tried to its info, or None when the API had nothing for it.
+
+        Addresses left over at the deadline, or throttled, are missing from the result.
+        """
+        ips = list(dict.fromkeys(ips))
+        if not ips:
+            return {}
+        deadline = time.monotonic() + self.deadline
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(ips)))
+        try:
+            pending = {executor.submit(self.fetch, ip, deadline) for ip in ips}
+            while pending:
+                done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    ip, info = future.result()
+                    if info is not False:
+                        results[ip] = info
+                if not done:
+                    print(f"API enrichment deadline reached, {len(pending)} address(es) left unresolved")
+                    break
+        finally:
+            # Requests already running finish in the background; queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+
+_default_resolver = None
+_default_resolver_lock = threading.Lock()
+
+
+def get_api_resolver():
+    """The process-wide ApiResolver, so every report shares one rate limit."""
+    global _default_resolver
+    with _default_resolver_lock:
+        if _default_resolver is None:
+            _default_resolver = ApiResolver()
+        return _default_resolver
+
+
+def enrich_ips(ips, resolver=None):
+    """Dict mapping every distinct address in ips to its enrichment info.
+
+    Fresh cache entries are used as they are; the rest go to the GeoLite2
+    database in one batch, and what it cannot place to the API in one
+    concurrent, rate-limited batch. Addresses the API failed on are cached
+    as failures (see ip_cache) so they are not retried on every report; for
+    those the database's {'Error': ...} result is returned.
+    """
+    ips = list(dict.fromkeys(ips))
+    cache = get_ip_cache()
+    cached = cache.get_many(ips) if cache else {}
+    results = {ip: info for ip, (source, info) in cached.items() if info is not None}
+    failed_before = {ip for ip, (source, info) in cached.items() if info is None}
+
+    missing = [ip for ip in ips if ip not in results]
+    db_results = lookup_many(missing)
+    fresh = []
+    for ip in missing:
+        info = db_results[ip]
+        if info and "Error" not in info:
+            results[ip] = info
+            fresh.append((ip, "mmdb", info))
+
+    to_fetch = [ip for ip in missing if ip not in results and ip not in failed_before]
+    for ip, info in (resolver or get_api_resolver()).resolve_many(to_fetch).items():
+        if info:
+            results[ip] = info
+            fresh.append((ip, "api", info))
+        else:
+            fresh.append((ip, "api-error", None))
+
+    for ip in missing:
+        if ip not in results:
+            results[ip] = db_results[ip]
+    if cache and fresh:
+        cache.put_many(fresh)
+    return results
@@ -1,24 +1,83 @@
+import os
+import threading
+
 import geoip2.database
-import platform
+import maxminddb
+
+DATABASE_PATH = os.path.join("DataBase", "GeoLite2-City.mmdb")
+
+
+def _city_info(response):
+    return {
+        'Country': response.country.name,
+        'Region': response.subdivisions.most_specific.name,
+        'City': response.city.name,
+        'Location': f"{response.location.latitude}, {response.location.longitude}",
+        'Organization': response.traits.isp
+    }
+
+
+class GeoIPLookup:
+    """One GeoLite2 reader for the whole process, memory-mapped and opened on first use.
+
+    maxminddb readers are safe for concurrent lookups, so threads share the
+    handle and only opening and closing it take the lock.
+    """
+
+    def __init__(self, database=DATABASE_PATH):
+        self.database = database
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def reader(self):
+        reader = self._reader
+        if reader is None:
+            with self._lock:
+                if self._reader is None:
+                    try:
+                        self._reader = geoip2.database.Reader(self.database, mode=maxminddb.MODE_MMAP_EXT)
+                    except ValueError:
+                        # C extension not installed: the pure Python reader maps the file too
+                        self._reader = geoip2.database.Reader(self.database, mode=maxminddb.MODE_MMAP)
+                reader = self._reader
+        return reader
+
+    def lookup(self, ip):
+        """Location and ISP of ip, or {'Error': ...} when it cannot be looked up."""
+        try:
+            return _city_info(self.reader().city(ip))
+        except Exception as e:
+            return {'Error': str(e)}
+
+    def lookup_many(self, ips):
+        """Dict mapping every distinct address in ips to its lookup() result."""
+        try:
+            reader = self.reader()
+        except Exception as e:
+            return {ip: {'Error': str(e)} for ip in ips}
+        results = {}
+        for ip in ips:
+            if ip in results:
+                continue
+            try:
+                results[ip] = _city_info(reader.city(ip))
+            except Exception as e:
+                results[ip] = {'Error': str(e)}
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+
+geoip_lookup = GeoIPLookup()
+
 
 def get_ip_info(ip):
-    
-    try:
-        if platform.system() == "Windows":
-            Database = "DataBase\\GeoLite2-City.mmdb"
-        else:
-            Database = "DataBase/GeoLite2-City.mmdb"
-        with geoip2.database.Reader(Database) as reader:
-            response = reader.city(ip)
-            ip_info = {
-                'Country': response.country.name,
-                'Region': response.subdivisions.most_specific.name,
-                'City': response.city.name,
-                'Location': f"{response.location.latitude}, {response.location.longitude}",
-                'Organization': response.traits.isp
-            }
-            return ip_info
-    except Exception as e:
-        return {'Error': str(e)}
+    return geoip_lookup.lookup(ip)
 
 
+def lookup_many(ips):
+    return geoip_lookup.lookup_many(ips)
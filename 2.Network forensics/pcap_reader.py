@@ -0,0 +1,286 @@
+"""Streaming pcap/pcapng reader for the bulk statistics of a report.
+
+Record headers, Ethernet (with VLAN tags), Linux cooked, loopback and raw
+IP frames, IPv4/IPv6 and the TCP/UDP protocol numbers are decoded straight
+from a memory-mapped capture, without starting tshark. read_packets yields
+the same dicts as report_generator.process_packet, so deep dissection (a
+protocol filter above TCP/UDP) can still fall back to pyshark.
+"""
+import mmap
+import socket
+import struct
+from datetime import datetime
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_EPB = 0x00000006
+# if_tsresol and if_tsoffset options of an Interface Description Block
+IDB_TSRESOL = 9
+IDB_TSOFFSET = 14
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+SUPPORTED_LINKTYPES = {LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LOOP, LINKTYPE_LINUX_SLL,
+                       LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL2}
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+VLAN_ETHERTYPES = {0x8100, 0x88A8, 0x9100}
+# BSD loopback address families that mean IPv6 (NetBSD/Linux, FreeBSD, macOS)
+NULL_AF_INET = 2
+NULL_AF_INET6 = {10, 24, 28, 30}
+
+IP_PROTOCOLS = {6: "TCP", 17: "UDP"}
+# IPv6 extension headers walked to find the transport protocol (fragment and AH handled apart)
+IPV6_EXTENSION_HEADERS = {0, 43, 60}
+IPV6_FRAGMENT = 44
+IPV6_AH = 51
+
+# Layer names, as pyshark reports them, that the reader decodes itself
+NATIVE_LAYERS = {"ETH", "SLL", "NULL", "IP", "IPV6", "TCP", "UDP"}
+
+
+def handles_filter(filter_protocol):
+    """Whether read_packets can apply filter_protocol, or pyshark is needed to dissect deeper."""
+    return not filter_protocol or filter_protocol.upper() in NATIVE_LAYERS
+
+
+def _network_offset(linktype, data, byte_order):
+    """(offset of the IP header in data, IP version) or None for a frame without IP."""
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        if len(data) < 14:
+            return None
+        ethertype = int.from_bytes(data[12:14], "big")
+        while ethertype in VLAN_ETHERTYPES and len(data) >= offset + 6:
+            offset += 4
+            ethertype = int.from_bytes(data[offset:offset + 2], "big")
+        offset += 2
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16:
+            return None
+        ethertype = int.from_bytes(data[14:16], "big")
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20:
+            return None
+        ethertype = int.from_bytes(data[0:2], "big")
+        offset = 20
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(data) < 4:
+            return None
+        # DLT_NULL stores the family in the capturing host's byte order, DLT_LOOP in network order
+        family = int.from_bytes(data[0:4], "big" if linktype == LINKTYPE_LOOP else byte_order)
+        ethertype = ETHERTYPE_IPV4 if family == NULL_AF_INET else ETHERTYPE_IPV6 if family in NULL_AF_INET6 else None
+        offset = 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not data:
+            return None
+        version = data[0] >> 4
+        return (0, version) if version in (4, 6) else None
+    else:
+        return None
+    if ethertype == ETHERTYPE_IPV4:
+        return offset, 4
+    if ethertype == ETHERTYPE_IPV6:
+        return offset, 6
+    return None
+
+
+def _decode_ip(data, offset, version):
+    """(IP layer name, src, dst, transport protocol or None) of the IP packet at offset, or None if it is cut short."""
+    if version == 4:
+        if len(data) < offset + 20:
+            return None
+        header_length = (data[offset] & 0x0F) * 4
+        src = socket.inet_ntop(socket.AF_INET, data[offset + 12:offset + 16])
+        dst = socket.inet_ntop(socket.AF_INET, data[offset + 16:offset + 20])
+        # Only the first fragment carries the transport header
+        fragment_offset = int.from_bytes(data[offset + 6:offset + 8], "big") & 0x1FFF
+        protocol = IP_PROTOCOLS.get(data[offset + 9]) if fragment_offset == 0 else None
+        if protocol and len(data) < offset + header_length + 8:
+            protocol = None
+        return "IP", src, dst, protocol
+    if len(data) < offset + 40:
+        return None
+    src = socket.inet_ntop(socket.AF_INET6, data[offset + 8:offset + 24])
+    dst = socket.inet_ntop(socket.AF_INET6, data[offset + 24:offset + 40])
+    next_header = data[offset + 6]
+    position = offset + 40
+    while len(data) >= position + 8:
+        if next_header in IPV6_EXTENSION_HEADERS:
+            length = (data[position + 1] + 1) * 8
+        elif next_header == IPV6_AH:
+            length = (data[position + 1] + 2) * 4
+        elif next_header == IPV6_FRAGMENT:
+            if int.from_bytes(data[position + 2:position + 4], "big") >> 3:
+                return "IPV6", src, dst, None
+            length = 8
+        else:
+            break
+        next_header = data[position]
+        position += length
+    protocol = IP_PROTOCOLS.get(next_header)
+    if protocol and len(data) < position + 8:
+        protocol = None
+    return "IPV6", src, dst, protocol
+
+
+def _packet_details(timestamp, length, linktype, data, byte_order, filter_protocol):
+    """process_packet's dict for one frame, or None when filter_protocol does not match it."""
+    network = _network_offset(linktype, data, byte_order)
+    decoded = _decode_ip(data, *network) if network else None
+    ip_layer, src, dst, protocol = decoded or (None, None, None, None)
+    if filter_protocol:
+        layers = {ip_layer, protocol}
+        layers.add({LINKTYPE_ETHERNET: "ETH", LINKTYPE_LINUX_SLL: "SLL", LINKTYPE_LINUX_SLL2: "SLL",
+                    LINKTYPE_NULL: "NULL", LINKTYPE_LOOP: "NULL"}.get(linktype))
+        if filter_protocol.upper() not in layers:
+            return None
+    return {
+        "time": datetime.fromtimestamp(timestamp),
+        "length": length,
+        # pyshark only exposes IPv4 as packet.ip; IPv6 addresses are reported too
+        "src_ip": src,
+        "dst_ip": dst,
+        "protocol": protocol,
+    }
+
+
+def _pcap_header(mapped):
+    """(struct byte order, seconds per timestamp unit, link type) of a pcap file, or None if it is not one."""
+    for endian, byte_order in (("<", "little"), (">", "big")):
+        magic = int.from_bytes(mapped[0:4], byte_order)
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            # The upper bits of the link type field hold FCS information in newer files
+            linktype = struct.unpack_from(endian + "I", mapped, 20)[0] & 0xFFFF
+            return endian, 1e-9 if magic == PCAP_MAGIC_NSEC else 1e-6, linktype
+    return None
+
+
+def _read_pcap(mapped, filter_protocol):
+    endian, scale, linktype = _pcap_header(mapped)
+    record = struct.Struct(endian + "IIII")
+    byte_order = "little" if endian == "<" else "big"
+    position = 24
+    size = len(mapped)
+    while position + record.size <= size:
+        seconds, fraction, captured, original = record.unpack_from(mapped, position)
+        position += record.size
+        if position + captured > size:
+            print(f"Capture truncated at offset {position - record.size}")
+            return
+        details = _packet_details(seconds + fraction * scale, original, linktype,
+                                  mapped[position:position + captured], byte_order, filter_protocol)
+        position += captured
+        if details:
+            yield details
+
+
+def _interface(body, endian, byte_order):
+    """(link type, seconds per timestamp unit, timestamp offset in seconds) of an IDB body."""
+    linktype = struct.unpack_from(endian + "H", body, 0)[0]
+    scale = 1e-6
+    offset = 0
+    position = 8
+    while position + 4 <= len(body):
+        code, length = struct.unpack_from(endian + "HH", body, position)
+        if code == 0:
+            break
+        value = body[position + 4:position + 4 + length]
+        if code == IDB_TSRESOL and length >= 1:
+            scale = 2.0 ** -(value[0] & 0x7F) if value[0] & 0x80 else 10.0 ** -value[0]
+        elif code == IDB_TSOFFSET and length >= 8:
+            offset = int.from_bytes(value[:8], byte_order, signed=True)
+        position += 4 + (length + 3) // 4 * 4
+    return linktype, scale, offset
+
+
+def _read_pcapng(mapped, filter_protocol):
+    size = len(mapped)
+    endian = "<"
+    byte_order = "little"
+    interfaces = []
+    position = 0
+    while position + 12 <= size:
+        block_type = int.from_bytes(mapped[position:position + 4], byte_order)
+        if block_type == PCAPNG_SHB:
+            # A new section may switch byte order and restarts interface numbering
+            byte_order = "little" if int.from_bytes(mapped[position + 8:position + 12], "little") \
+                == PCAPNG_BYTE_ORDER_MAGIC else "big"
+            endian = "<" if byte_order == "little" else ">"
+            interfaces = []
+        block_length = int.from_bytes(mapped[position + 4:position + 8], byte_order)
+        if block_length < 12 or position + block_length > size:
+            print(f"Capture truncated at offset {position}")
+            return
+        body = position + 8
+        body_end = position + block_length - 4
+        position += block_length
+        if block_type == PCAPNG_IDB:
+            interfaces.append(_interface(mapped[body:body_end], endian, byte_order))
+            continue
+        if block_type == PCAPNG_EPB:
+            interface_id, high, low, captured, original = struct.unpack_from(endian + "IIIII", mapped, body)
+        elif block_type == PCAPNG_OPB:
+            interface_id, _, high, low, captured, original = struct.unpack_from(endian + "HHIIII", mapped, body)
+        else:
+            # Simple Packet Blocks carry no timestamp and are left out; other blocks hold no packets
+            continue
+        if interface_id >= len(interfaces):
+            continue
+        linktype, scale, offset = interfaces[interface_id]
+        data = mapped[body + 20:min(body + 20 + captured, body_end)]
+        details = _packet_details(offset + ((high << 32) | low) * scale, original, linktype, data,
+                                  byte_order, filter_protocol)
+        if details:
+            yield details
+
+
+def _capture_format(mapped):
+    header = _pcap_header(mapped) if len(mapped) >= 24 else None
+    if header:
+        linktype = header[2]
+        if linktype not in SUPPORTED_LINKTYPES:
+            raise ValueError(f"unsupported link type {linktype}")
+        return _read_pcap
+    if len(mapped) >= 28 and int.from_bytes(mapped[0:4], "little") == PCAPNG_SHB:
+        return _read_pcapng
+    raise ValueError("not a pcap or pcapng capture")
+
+
+def read_packets(file_path, filter_protocol=None):
+    """Iterator over the packet dicts of the capture at file_path, keeping only those with filter_protocol.
+
+    The file format is checked before returning: ValueError means the capture
+    has to be dissected by pyshark instead. Packets on pcapng interfaces with
+    a link type the reader does not know are reported without addresses.
+    """
+    if not handles_filter(filter_protocol):
+        raise ValueError(f"{filter_protocol} needs deep dissection")
+    with open(file_path, "rb") as capture_file:
+        try:
+            mapped = mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError("empty capture file")
+    try:
+        reader = _capture_format(mapped)
+    except ValueError:
+        mapped.close()
+        raise
+    return _stream(reader, mapped, filter_protocol)
+
+
+def _stream(reader, mapped, filter_protocol):
+    with mapped:
+        yield from reader(mapped, filter_protocol)
@@ -1,61 +1,54 @@
 import pyshark
+import ipaddress
 import json
-import requests
-from know_provider import get_ip_info
+from ip_enrichment import enrich_ips, get_api_resolver
+from pcap_reader import handles_filter, read_packets
 from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
 from collections import defaultdict
 import os
+# Private-use ranges and the RFC that assigns them
+PRIVATE_RANGES = {
+    ipaddress.ip_network("10.0.0.0/8"): "RFC 1918",
+    ipaddress.ip_network("172.16.0.0/12"): "RFC 1918",
+    ipaddress.ip_network("192.168.0.0/16"): "RFC 1918",
+    ipaddress.ip_network("fc00::/7"): "RFC 4193",
+}
+
 def is_reserved_ip(ip):
-    """Check if an IP address is in reserved/non-public ranges."""
+    """Check if an IPv4 or IPv6 address is in reserved/non-public ranges."""
     try:
-        octets = list(map(int, ip.split('.')))
-        
-        # IPv4 reserved ranges
-        if octets[0] == 10:  # 10.0.0.0/8
-            return ("Private", "RFC 1918")
-        if octets[0] == 172 and 16 <= octets[1] <= 31:  # 172.16.0.0/12
-            return ("Private", "RFC 1918")
-        if octets[0] == 192 and octets[1] == 168:  # 192.168.0.0/16
-            return ("Private", "RFC 1918")
-        if octets[0] == 127:  # Loopback
-            return ("Reserved", "Loopback")
-        if octets[0] == 169 and octets[1] == 254:  # Link-local
-            return ("Reserved", "Link-local")
-        if 224 <= octets[0] <= 239:  # Multicast
-            return ("Reserved", "Multicast")
-        if octets[0] == 255 and octets[1] == 255:  # Broadcast
-            return ("Reserved", "Broadcast")
-            
-        return None
-    except (ValueError, IndexError):
+        address = ipaddress.ip_address(ip)
+    except ValueError:
         return None
+    # Classify IPv4-mapped IPv6 addresses (::ffff:10.0.0.1) by the IPv4 address they carry
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+
+    if address.is_loopback:
+        return ("Reserved", "Loopback")
+    if address.is_link_local:
+        return ("Reserved", "Link-local")
+    if address.is_multicast:
+        return ("Reserved", "Multicast")
+    if address.version == 4 and address == ipaddress.IPv4Address("255.255.255.255"):
+        return ("Reserved", "Broadcast")
+    if address.is_unspecified:
+        return ("Reserved", "Unspecified")
+    for network, description in PRIVATE_RANGES.items():
+        if address in network:
+            return ("Private", description)
+    # Anything else not globally routable: documentation, shared address space (RFC 6598), 240/4, ...
+    if address.is_reserved or not address.is_global:
+        return ("Reserved", "Special-purpose")
+    return None
 
 def fetch_ip_from_api(ip):
     """Retrieve IP information from external API."""
-    try:
-        response = requests.get(f"https://ipinfo.io/{ip}/json", timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"API Error for {ip}: {str(e)}")
-        return None
+    return get_api_resolver().fetch(ip)[1] or None
 
-@lru_cache(maxsize=1000)
 def cached_get_ip_info(ip):
-    """Fetch IP information with caching, fallback to API if not in database."""
-    # First try local database
-    db_info = get_ip_info(ip)
-    if db_info:
-        return db_info
-    
-    # If not found, try API
-    api_info = fetch_ip_from_api(ip)
-    if api_info:
-        # soon....
-        # For example: store_ip_info(ip, api_info)
-        pass
-    return api_info
+    """Fetch IP information through the persistent cache, fallback to API if not in database."""
+    return enrich_ips([ip])[ip]
 
 def process_packet(packet, filter_protocol=None):
     """Process a single packet and return its details."""
@@ -69,7 +62,6 @@ def process_packet(packet, filter_protocol=None):
             "src_ip": packet.ip.src if "IP" in packet else None,
             "dst_ip": packet.ip.dst if "IP" in packet else None,
             "protocol": None,
-            "ip_info": None,
         }
 
         if "TCP" in packet:
@@ -81,23 +73,30 @@ def process_packet(packet, filter_protocol=None):
         elif "HTTP" in packet:
             packet_details["protocol"] = "HTTP"
 
-        if packet_details["dst_ip"]:
-            reserved_info = is_reserved_ip(packet_details["dst_ip"])
-            if reserved_info:
-                ip_type, description = reserved_info
-                packet_details["ip_info"] = {
-                    "type": ip_type,
-                    "description": description,
-                    "note": "Non-routable address"
-                }
-            else:
-                packet_details["ip_info"] = cached_get_ip_info(packet_details["dst_ip"])
-        
+        # dst_ip is the key of the destination's entry in enrich_hosts()
         return packet_details
 
     except Exception as e:
         return {"error": str(e)}
 
+def enrich_hosts(ips):
+    """Details of every distinct address in ips: its reserved range, or GeoIP/API enrichment."""
+    hosts = {}
+    public_ips = []
+    for ip in set(ips):
+        reserved_info = is_reserved_ip(ip)
+        if reserved_info:
+            ip_type, description = reserved_info
+            hosts[ip] = {
+                "type": ip_type,
+                "description": description,
+                "note": "Non-routable address"
+            }
+        else:
+            public_ips.append(ip)
+    hosts.update(enrich_ips(public_ips))
+    return hosts
+
 def generate_report(file_path, output_file, filter_protocol=None):
     """Analyzes the pcap file and generates an HTML report with enhanced visualization."""
     try:
@@ -107,11 +106,27 @@ def generate_report(file_path, output_file, filter_protocol=None):
         if not os.path.isfile(file_path):
             raise ValueError(f"Invalid file path: {file_path}")
 
-        # Initialize capture with error handling
-        try:
-            capture = pyshark.FileCapture(file_path, use_json=True)
-        except Exception as e:
-            raise RuntimeError(f"Failed to open PCAP file: {str(e)}")
+        # Read pcap/pcapng straight from the file; tshark is only started for deep dissection
+        packet_results = None
+        if handles_filter(filter_protocol):
+            try:
+                packet_results = read_packets(file_path, filter_protocol)
+            except ValueError as e:
+                print(f"Native reader unavailable ({str(e)}), dissecting with tshark")
+
+        if packet_results is None:
+            # Initialize capture with error handling
+            try:
+                capture = pyshark.FileCapture(file_path, use_json=True)
+            except Exception as e:
+                raise RuntimeError(f"Failed to open PCAP file: {str(e)}")
+
+            # Process packets in parallel
+            with ThreadPoolExecutor() as executor:
+                packet_results = list(executor.map(
+                    lambda p: process_packet(p, filter_protocol),
+                    capture
+                ))
 
         # Initialize tracking variables
         protocol_counts = defaultdict(int)
@@ -121,13 +136,6 @@ def generate_report(file_path, output_file, filter_protocol=None):
         ip_counts = defaultdict(int)
         timeline_data = []
 
-        # Process packets in parallel
-        with ThreadPoolExecutor() as executor:
-            packet_results = list(executor.map(
-                lambda p: process_packet(p, filter_protocol),
-                capture
-            ))
-
         # Filter and count valid packets
         processed_count = 0
         for result in packet_results:
@@ -150,6 +158,9 @@ def generate_report(file_path, output_file, filter_protocol=None):
                     "size": result["length"]
                 })
 
+        # Enrich every distinct destination once; packets refer to it by address
+        host_info = enrich_hosts(result["dst_ip"] for result in results if result["dst_ip"])
+
         # Calculate statistics
         avg_packet_size = total_size / processed_count if processed_count else 0
         top_ips = sorted(ip_counts.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -429,6 +440,25 @@ def generate_report(file_path, output_file, filter_protocol=None):
         </div>
     </div>
 
+    <h2 style="margin:3rem 0 1.5rem 0;"><i class="icon ion-md-globe" style="color: var(--text-secondary);"></i>Destination Hosts</h2>
+    {'\n'.join([f'''
+    <div class="packet-card" id="host-{ip}">
+        <div style="opacity:0.9;font-family:monospace;font-size:1.1em">{ip}</div>
+        <div class="ip-info">
+            <h3 style="margin:0 0 1rem 0;font-size:1.1em">
+                <i class="icon ion-md-information-circle-outline"></i>
+                GeoIP Intelligence
+            </h3>
+            {'\n'.join([f'''
+            <div style="display:flex; justify-content: space-between; align-items: center; padding: 0.5rem 0; border-bottom: 1px solid rgba(139, 92, 246, 0.1);">
+                <span style="opacity:0.8">{k}:</span>
+                <span style="font-weight:500;color: var(--accent)">{v}</span>
+            </div>
+            ''' for k, v in info.items() if v])}
+        </div>
+    </div>
+    ''' for ip, info in sorted(host_info.items()) if info])}
+
     <h2 style="margin:3rem 0 1.5rem 0;"><i class="icon ion-md-list" style="color: var(--text-secondary);"></i>Packet Details</h2>
     {'\n'.join([f'''
     <div class="packet-card">
@@ -463,23 +493,8 @@ def generate_report(file_path, output_file, filter_protocol=None):
                     <i class="icon ion-md-pin" style="color: #ef4444;"></i>
                     Destination Address
                 </h3>
-                <div style="opacity:0.9;font-family:monospace">{p['dst_ip'] or 'N/A'}</div>
-            </div>
-            
-            {f'''
-            <div class="ip-info">
-                <h3 style="margin:0 0 1rem 0;font-size:1.1em">
-                    <i class="icon ion-md-information-circle-outline"></i>
-                    GeoIP Intelligence
-                </h3>
-                {'\n'.join([f'''
-                <div style="display:flex; justify-content: space-between; align-items: center; padding: 0.5rem 0; border-bottom: 1px solid rgba(139, 92, 246, 0.1);">
-                    <span style="opacity:0.8">{k}:</span>
-                    <span style="font-weight:500;color: var(--accent)">{v}</span>
-                </div>
-                ''' for k, v in p['ip_info'].items() if v])}
+                <div style="opacity:0.9;font-family:monospace">{f'<a href="#host-{p['dst_ip']}" style="color:inherit">{p['dst_ip']}</a>' if host_info.get(p['dst_ip']) else p['dst_ip'] or 'N/A'}</div>
             </div>
-            ''' if p.get('ip_info') else ''}
         </div>
     </div>
     ''' for p in results])}
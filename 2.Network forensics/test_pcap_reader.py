@@ -0,0 +1,143 @@
+"""Regression tests for pcap_reader on small synthetic pcap and pcapng captures."""
+import socket
+import struct
+from datetime import datetime
+
+import pytest
+
+from pcap_reader import (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, PCAP_MAGIC_NSEC, PCAP_MAGIC_USEC,
+                         PCAPNG_BYTE_ORDER_MAGIC, PCAPNG_EPB, PCAPNG_IDB, PCAPNG_SHB, handles_filter, read_packets)
+
+TIMESTAMP = 1700000000
+
+
+def ipv4(src, dst, protocol, payload=bytes(8), fragment_offset=0):
+    header = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, fragment_offset, 64, protocol, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return header + payload
+
+
+def ipv6(src, dst, next_header, payload=bytes(8)):
+    header = struct.pack(">IHBB16s16s", 6 << 28, len(payload), next_header, 64,
+                         socket.inet_pton(socket.AF_INET6, src), socket.inet_pton(socket.AF_INET6, dst))
+    return header + payload
+
+
+def ethernet(packet, ethertype, vlan=False):
+    frame = bytes(6) + bytes(6)
+    if vlan:
+        frame += struct.pack(">HH", 0x8100, 42)
+    return frame + struct.pack(">H", ethertype) + packet
+
+
+def pcap(frames, linktype=LINKTYPE_ETHERNET, endian="<", magic=PCAP_MAGIC_USEC):
+    """frames are (seconds, fraction, data); fraction is in µs or ns depending on magic."""
+    records = [struct.pack(endian + "IHHiIII", magic, 2, 4, 0, 0, 65535, linktype)]
+    for seconds, fraction, data in frames:
+        records.append(struct.pack(endian + "IIII", seconds, fraction, len(data), len(data)) + data)
+    return b"".join(records)
+
+
+def pcapng_block(block_type, body):
+    body += bytes(-len(body) % 4)
+    length = 12 + len(body)
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def pcapng(frames, linktype=LINKTYPE_ETHERNET, tsresol=None):
+    """frames are (interface timestamp units, data) on a single interface."""
+    blocks = [pcapng_block(PCAPNG_SHB, struct.pack("<IHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1))]
+    options = b""
+    if tsresol is not None:
+        options = struct.pack("<HHB3x", 9, 1, tsresol) + struct.pack("<HH", 0, 0)
+    blocks.append(pcapng_block(PCAPNG_IDB, struct.pack("<HHI", linktype, 0, 65535) + options))
+    for units, data in frames:
+        blocks.append(pcapng_block(PCAPNG_EPB, struct.pack("<IIIII", 0, units >> 32, units & 0xFFFFFFFF,
+                                                           len(data), len(data)) + data))
+    return b"".join(blocks)
+
+
+def capture(tmp_path, data, name="capture.pcap"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_ethernet_ipv4_and_vlan_ipv6(tmp_path):
+    frames = [
+        (TIMESTAMP, 250000, ethernet(ipv4("10.0.0.1", "93.184.216.34", 6), 0x0800)),
+        (TIMESTAMP + 1, 0, ethernet(ipv6("fe80::1", "2001:db8::2", 17), 0x86DD, vlan=True)),
+        (TIMESTAMP + 2, 0, ethernet(b"\x00" * 28, 0x0806)),  # ARP: no IP layer
+    ]
+
+    packets = list(read_packets(capture(tmp_path, pcap(frames))))
+
+    assert packets[0] == {"time": datetime.fromtimestamp(TIMESTAMP + 0.25), "length": len(frames[0][2]),
+                          "src_ip": "10.0.0.1", "dst_ip": "93.184.216.34", "protocol": "TCP"}
+    assert (packets[1]["src_ip"], packets[1]["dst_ip"], packets[1]["protocol"]) == ("fe80::1", "2001:db8::2", "UDP")
+    assert (packets[2]["src_ip"], packets[2]["protocol"]) == (None, None)
+
+
+def test_big_endian_nanosecond_pcap_with_linux_cooked_frames(tmp_path):
+    sll = struct.pack(">HHH8sH", 0, 1, 6, bytes(8), 0x0800)
+    data = pcap([(TIMESTAMP, 500000000, sll + ipv4("192.168.1.2", "8.8.8.8", 17))],
+                LINKTYPE_LINUX_SLL, ">", PCAP_MAGIC_NSEC)
+
+    packet, = read_packets(capture(tmp_path, data))
+
+    assert packet["time"] == datetime.fromtimestamp(TIMESTAMP + 0.5)
+    assert (packet["src_ip"], packet["dst_ip"], packet["protocol"]) == ("192.168.1.2", "8.8.8.8", "UDP")
+
+
+def test_transport_only_from_first_fragment_and_past_ipv6_extension_headers(tmp_path):
+    hop_by_hop = struct.pack(">BB6x", 6, 0) + bytes(8)
+    fragment = struct.pack(">BBHI", 17, 0, 100 << 3, 1)
+    frames = [
+        (TIMESTAMP, 0, ipv4("10.0.0.1", "10.0.0.2", 6, fragment_offset=185)),
+        (TIMESTAMP, 0, ipv6("::1", "::2", 0, hop_by_hop)),
+        (TIMESTAMP, 0, ipv6("::1", "::2", 44, fragment + bytes(8))),
+    ]
+
+    protocols = [packet["protocol"] for packet in read_packets(capture(tmp_path, pcap(frames, LINKTYPE_RAW)))]
+
+    assert protocols == [None, "TCP", None]
+
+
+def test_pcapng_interface_timestamp_resolution(tmp_path):
+    frames = [(TIMESTAMP * 1000 + 125, ethernet(ipv4("172.16.0.9", "1.1.1.1", 6), 0x0800))]
+
+    packet, = read_packets(capture(tmp_path, pcapng(frames, tsresol=3), "capture.pcapng"))
+
+    assert packet["time"] == datetime.fromtimestamp(TIMESTAMP + 0.125)
+    assert (packet["src_ip"], packet["dst_ip"], packet["protocol"]) == ("172.16.0.9", "1.1.1.1", "TCP")
+
+
+def test_filter_keeps_matching_layers(tmp_path):
+    frames = [
+        (TIMESTAMP, 0, ethernet(ipv4("10.0.0.1", "10.0.0.2", 6), 0x0800)),
+        (TIMESTAMP, 0, ethernet(ipv6("::1", "::2", 17), 0x86DD)),
+    ]
+    path = capture(tmp_path, pcap(frames))
+
+    assert [packet["protocol"] for packet in read_packets(path, "udp")] == ["UDP"]
+    assert [packet["src_ip"] for packet in read_packets(path, "IP")] == ["10.0.0.1"]
+    assert len(list(read_packets(path, "ETH"))) == 2
+
+
+def test_truncated_capture_stops_at_last_whole_record(tmp_path):
+    frame = ethernet(ipv4("10.0.0.1", "10.0.0.2", 6), 0x0800)
+    data = pcap([(TIMESTAMP, 0, frame), (TIMESTAMP, 0, frame)])
+
+    assert len(list(read_packets(capture(tmp_path, data[:-10])))) == 1
+
+
+def test_captures_pyshark_has_to_dissect(tmp_path):
+    assert handles_filter(None) and handles_filter("tcp") and not handles_filter("HTTP")
+    with pytest.raises(ValueError):
+        read_packets(capture(tmp_path, pcap([])), "HTTP")
+    with pytest.raises(ValueError):
+        read_packets(capture(tmp_path, b""))
+    with pytest.raises(ValueError):
+        read_packets(capture(tmp_path, b"not a capture file at all, just text"))
+    with pytest.raises(ValueError):
+        read_packets(capture(tmp_path, pcap([], linktype=147)))  # a user DLT
@@ -1,130 +1,61 @@
 import os
+import queue
 import threading
-from concurrent.futures import ThreadPoolExecutor
 import ctypes
 import sys
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
 from tkinter import filedialog
+from carve_progress import format_progress
+from carve_session import session_file_name
+from carver import DEFAULT_BLOCK_SIZE, carve_device
+from signatures import file_signatures
+from uncached_io import open_source
+
+# Milliseconds between two refreshes of the log box and progress line
+UI_REFRESH_MS = 200
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 
-# Ensure the script runs as administrator
-if not ctypes.windll.shell32.IsUserAnAdmin():
-    ctypes.windll.shell32.ShellExecuteW(None, "runas", sys.executable, " ".join(sys.argv), None, 1)
-    sys.exit()
-
-# Signatures for various file types
-file_signatures = {
-    "jpg": [b'\xff\xd8\xff\xe0', b'\xff\xd8\xff\xe1', b'\xff\xd9'],  # JPEG files
-    "pdf": [b'%PDF-', b'%%EOF'],  # PDF files
-    "png": [b'\x89PNG\r\n\x1a\n', b'\x49\x45\x4e\x44\xae\x42\x60\x82'],  # PNG files
-    "gif": [b'GIF87a', b'GIF89a'],  # GIF files
-    "mp3": [b'\x49\x44\x33', b'\xff\xf3'],  # MP3 files
-    "zip": [b'PK\x03\x04', b'PK\x05\x06', b'PK\x07\x08'],  # ZIP files
-    "rar": [b'Rar!\x1a\x07\x00', b'Rar!\x1a\x07\x01'],  # RAR files
-    "7z": [b'7z\xbc\xaf\x27\x1c'],  # 7z archive files
-    "doc": [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],  # Microsoft Office pre-2007 files
-    "docx": [b'PK\x03\x04'],  # Microsoft Office 2007+ files (ZIP container)
-    "xls": [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],  # Microsoft Excel pre-2007 files
-    "xlsx": [b'PK\x03\x04'],  # Microsoft Excel 2007+ files (ZIP container)
-    "exe": [b'MZ'],  # Executable files
-    "dll": [b'MZ'],  # Dynamic Link Libraries (same signature as EXE)
-    "bmp": [b'BM'],  # Bitmap image files
-    "wav": [b'RIFF', b'WAVE'],  # WAV audio files
-    "avi": [b'RIFF', b'AVI '],  # AVI video files
-    "mov": [b'\x00\x00\x00\x14ftypqt'],  # MOV video files
-    "mp4": [b'\x00\x00\x00\x18ftypmp4'],  # MP4 video files
-    "flv": [b'FLV\x01'],  # Flash video files
-    "webp": [b'RIFF', b'WEBP'],  # WEBP image files
-    "iso": [b'\x43\x44\x30\x30\x31'],  # ISO disc image files
-    "tar": [b'ustar'],  # TAR archive files
-    "gz": [b'\x1f\x8b'],  # Gzip compressed files
-    "json": [b'{', b'[' ],  # JSON files (starts with "{" or "[")
-    "xml": [b'<?xml'],  # XML files
-    "html": [b'<!DOCTYPE html', b'<html'],  # HTML files
-    "css": [b'/*', b'@import'],  # CSS files
-    "js": [b'//', b'function', b'var'],  # JavaScript files
-    "py": [b'#', b'import ', b'def '],  # Python files
-    "txt": [b''],  # Plain text files (no specific signature)
-    "sqlite": [b'SQLite format 3\x00'],  # SQLite database files
-    "tar.gz": [b'\x1f\x8b\x08'],  # Tarball gzip files
-    "class": [b'\xca\xfe\xba\xbe'],  # Java class files
-    "jar": [b'PK\x03\x04'],  # Java archive files
-    "psd": [b'8BPS'],  # Photoshop files
-    "tiff": [b'II*\x00', b'MM\x00*'],  # TIFF image files
-    "epub": [b'PK\x03\x04'],  # EPUB files (ZIP container)
-}
-
 
 def check_drive_access(drive):
     """Check if we can access the drive."""
     try:
-        with open(drive, "rb") as test_file:
+        # Raw volumes only accept whole-sector reads, which open_source takes care of
+        with open_source(drive) as test_file:
             test_file.read(1024)
         return True
     except Exception as e:
         print(f"Error accessing the drive: {str(e)}")
         return False
 
-def recover_file(drive, file_type, signature, save_path, size=512, stop_event=None,log_callback=None):
-    try:
-        with open(drive, "rb") as fileD:
-            byte = fileD.read(size)
-            offs = 0
-            drec = False
-            rcvd = 0
-
-            while byte and not (stop_event and stop_event.is_set()):
-                found = byte.find(signature[0])
-                if found >= 0:
-                    drec = True
-                    recovery_start_offset = found + (size * offs)
-
-                    if log_callback:
-                        log_callback(f'==== Found {file_type.upper()} at location: {hex(recovery_start_offset)} ====')
-
-                    file_name = os.path.join(save_path, f'{file_type}_{rcvd}.{file_type}')
-                    with open(file_name, "wb") as fileN:
-                        fileN.write(byte[found:])
-
-                        while drec and not (stop_event and stop_event.is_set()):
-                            byte = fileD.read(size)
-                            if not byte:
-                                break
-                            bfind = byte.find(signature[-1])  # Use last element as end marker
-                            if bfind >= 0:
-                                # Write up to the END of the end marker (critical fix)
-                                fileN.write(byte[:bfind + len(signature[-1])])
-                                if log_callback:
-                                    log_callback(f'==== Found {file_type.upper()} at location: {hex(recovery_start_offset)} ====')
-                                rcvd += 1
-                                drec = False
-                            else:
-                                fileN.write(byte)
-                byte = fileD.read(size)
-                offs += 1
-
-            if log_callback:
-                log_callback(f'==== Found {file_type.upper()} at location: {hex(recovery_start_offset)} ====')
-            
+def recover_file(drive, file_type, signature, save_path, size=DEFAULT_BLOCK_SIZE, stop_event=None,log_callback=None):
+    """Recover a single file type, scanning the drive in size-byte windows."""
+    return carve_device(drive, [file_type], {file_type: signature}, save_path, size, stop_event, log_callback)
 
-    except Exception as e:
-        if log_callback:
-            log_callback(f'==== Found {file_type.upper()} at location: {hex(recovery_start_offset)} ====')
 
+def recover_files(drive, selected_file_types, save_path, size=DEFAULT_BLOCK_SIZE, stop_event=None,log_callback=None, workers=1,
+                  max_sizes=None, discard_oversize=False, session_path=None, index_only=False,
+                  dedupe=False, io_mode="buffered", progress_callback=None, log_batch_callback=None):
+    """Main function to recover multiple file types in a single pass over the drive.
 
-def recover_files(drive, selected_file_types, save_path, size=512, stop_event=None,log_callback=None):
-    """Main function to recover multiple file types."""
+    Set workers above 1 to split the scan across that many processes.
+    max_sizes maps file types to a carve size cap in bytes, overriding carver.MAX_CARVE_SIZES.
+    session_path journals the run so that recovering again with the same path resumes it.
+    With index_only, candidates are only recorded at session_path; carver.extract_hits writes the chosen ones.
+    With dedupe, identical carves are stored once under their SHA-256 and listed in manifest.csv.
+    io_mode "direct" (O_DIRECT) or "fadvise" reads a raw device without evicting the page cache.
+    progress_callback and log_batch_callback receive rate-limited progress snapshots and log line batches.
+    """
     if not check_drive_access(drive):
         messagebox.showerror("Error", f"Cannot access drive {drive}. Please ensure proper permissions.")
         return
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for file_type in selected_file_types:
-            signature = file_signatures[file_type]
-            executor.submit(recover_file, drive, file_type, signature, save_path, size, stop_event,log_callback)
+    return carve_device(drive, selected_file_types, file_signatures, save_path, size, stop_event, log_callback,
+                        workers=workers, max_sizes=max_sizes, discard_oversize=discard_oversize,
+                        session_path=session_path, index_only=index_only, dedupe=dedupe, io_mode=io_mode,
+                        progress_callback=progress_callback, log_batch_callback=log_batch_callback)
 
 def get_available_drives():
     """Get a list of available drives."""
@@ -181,17 +112,46 @@ class FileRecoveryApp(ctk.CTk):
         self.stop_button = ctk.CTkButton(self, text="Stop", command=self.stop_recovery)
         self.stop_button.pack(pady=5)
 
+        self.progress_label = ctk.CTkLabel(self, text="")
+        self.progress_label.pack(pady=5)
+
         self.log_text = ctk.CTkTextbox(self, height=100, width=550)
         self.log_text.pack(pady=(10, 20))
 
+        # Filled by the recovery thread, drained on the Tk thread every UI_REFRESH_MS
+        self.log_queue = queue.SimpleQueue()
+        self.latest_progress = None
+        self.after(UI_REFRESH_MS, self.refresh_ui)
+
         # Initialize save path and recovery thread variable
         self.save_path = None
         self.recovery_thread = None
 
     def append_log(self, message):
-        # Schedule the GUI update on the main thread
-        self.after(0, lambda: self.log_text.insert("end", message + "\n"))
-        self.after(0, lambda: self.log_text.see("end"))  # Auto-scroll
+        # Safe from any thread; refresh_ui writes it on the main thread
+        self.log_queue.put(message)
+
+    def append_log_batch(self, lines):
+        self.log_queue.put("\n".join(lines))
+
+    def update_progress(self, snapshot):
+        self.latest_progress = snapshot
+
+    def refresh_ui(self):
+        """Write everything logged since the last refresh in one insert and show the latest progress."""
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            self.log_text.insert("end", "\n".join(lines) + "\n")
+            self.log_text.see("end")  # Auto-scroll
+        snapshot, self.latest_progress = self.latest_progress, None
+        if snapshot:
+            self.progress_label.configure(text=format_progress(snapshot))
+        self.after(UI_REFRESH_MS, self.refresh_ui)
 
     def select_save_path(self):
         """Open a directory dialog to select the save path."""
@@ -222,11 +182,20 @@ class FileRecoveryApp(ctk.CTk):
         self.log_text.insert("end", f"Starting recovery on {raw_drive_path} for {selected_file_types}\n")
 
         # Start recovery in a separate thread
-        self.recovery_thread = threading.Thread(target=recover_files, args=(raw_drive_path, selected_file_types, self.save_path, 512, self.stop_event,self.append_log))
+        # Journal next to the output, one per drive and type selection, so repeating a stopped run resumes it
+        session_path = os.path.join(self.save_path, session_file_name(raw_drive_path, selected_file_types))
+        self.recovery_thread = threading.Thread(target=self.run_recovery, args=(raw_drive_path, selected_file_types, self.save_path, DEFAULT_BLOCK_SIZE, self.stop_event,self.append_log), kwargs={"session_path": session_path, "progress_callback": self.update_progress, "log_batch_callback": self.append_log_batch})
         self.recovery_thread.daemon = True  # Make sure the thread stops when the main program exits
         self.recovery_thread.start()
 
 
+    def run_recovery(self, *args, **kwargs):
+        """Recovery thread body: report a failure in the log box instead of letting it end the thread silently."""
+        try:
+            recover_files(*args, **kwargs)
+        except Exception as e:
+            self.append_log(f"Recovery failed: {e}")
+
     def stop_recovery(self):
         """Stop the recovery process."""
         if self.recovery_thread and self.recovery_thread.is_alive():
@@ -238,5 +207,10 @@ class FileRecoveryApp(ctk.CTk):
 
 
 if __name__ == "__main__":
+    # Ensure the script runs as administrator
+    if not ctypes.windll.shell32.IsUserAnAdmin():
+        ctypes.windll.shell32.ShellExecuteW(None, "runas", sys.executable, " ".join(sys.argv), None, 1)
+        sys.exit()
+
     app = FileRecoveryApp()
     app.mainloop()
@@ -0,0 +1,188 @@
+"""Unallocated space of an ext2/3/4 or FAT filesystem, read from its allocation map.
+
+Live files are still reachable through the filesystem, so a recovery scan
+only needs the blocks the filesystem considers free. unallocated_extents
+reads the ext block group bitmaps or the FAT through read(offset, size) ->
+bytes, like fs_geometry, and returns the free space as sorted, merged
+(start, end) byte ranges. Anything past the end of the filesystem (e.g. the
+rest of a larger partition image) counts as unallocated too.
+"""
+import re
+import struct
+from collections import namedtuple
+
+from fs_geometry import EXT_MAGIC, EXT_SUPERBLOCK_OFFSET, _power_of_two
+
+AllocationMap = namedtuple("AllocationMap", ["filesystem", "extents"])
+
+# Allocated runs shorter than this between two free extents are scanned through rather than skipped
+DEFAULT_MERGE_GAP = 64 * 1024
+
+EXT_INCOMPAT_META_BG = 0x10
+EXT_INCOMPAT_64BIT = 0x80
+EXT_RO_COMPAT_GDT_CSUM = 0x10
+EXT_RO_COMPAT_METADATA_CSUM = 0x400
+EXT_BG_BLOCK_UNINIT = 0x2
+
+FAT12_MAX_CLUSTERS = 4085
+FAT16_MAX_CLUSTERS = 65525
+
+# Byte runs holding at least one free block in an ext bitmap (clear bits are free)
+_FREE_BITMAP_BYTES = re.compile(rb'\x00+|[^\x00\xff]')
+_ZERO_RUNS = re.compile(rb'\x00+')
+# FAT32 entries are 28 bits: the high nibble of every fourth byte is reserved
+_LOW_NIBBLE = bytes(value & 0x0F for value in range(256))
+
+
+def _bit_runs(bitmap, count):
+    """(first, end) runs of clear bits among the first count bits of an LSB-first bitmap."""
+    for match in _FREE_BITMAP_BYTES.finditer(bitmap, 0, -(-count // 8)):
+        first, end = match.start(), match.end()
+        if bitmap[first]:
+            byte = bitmap[first]
+            for bit in range(8):
+                if not byte >> bit & 1:
+                    yield first * 8 + bit, min(first * 8 + bit + 1, count)
+        else:
+            yield first * 8, min(end * 8, count)
+
+
+def _merge(runs, gap=0):
+    """Sorted runs with overlapping, touching or closer-than-gap neighbours joined."""
+    merged = []
+    for start, end in runs:
+        if start >= end:
+            continue
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _ext(read):
+    superblock = read(EXT_SUPERBLOCK_OFFSET, 1024)
+    if len(superblock) < 1024 or struct.unpack("<H", superblock[56:58])[0] != EXT_MAGIC:
+        return None
+    blocks_lo, _, _, _, first_data_block, log_block_size, _, blocks_per_group = \
+        struct.unpack("<IIIIIIII", superblock[4:36])
+    incompat, ro_compat = struct.unpack("<II", superblock[96:104])
+    if log_block_size > 6 or not blocks_per_group or incompat & EXT_INCOMPAT_META_BG:
+        return None
+    block_size = 1024 << log_block_size
+    blocks = blocks_lo
+    desc_size = 32
+    if incompat & EXT_INCOMPAT_64BIT:
+        blocks |= struct.unpack("<I", superblock[0x150:0x154])[0] << 32
+        desc_size = max(struct.unpack("<H", superblock[0xFE:0x100])[0], 32)
+    uninit_valid = ro_compat & (EXT_RO_COMPAT_GDT_CSUM | EXT_RO_COMPAT_METADATA_CSUM)
+
+    groups = -(-(blocks - first_data_block) // blocks_per_group)
+    table = read((first_data_block + 1) * block_size, groups * desc_size)
+    if len(table) < groups * desc_size:
+        return None
+
+    runs = []
+    for group in range(groups):
+        descriptor = table[group * desc_size:(group + 1) * desc_size]
+        first_block = first_data_block + group * blocks_per_group
+        count = min(blocks_per_group, blocks - first_block)
+        bitmap_block, = struct.unpack("<I", descriptor[0:4])
+        if desc_size >= 64:
+            bitmap_block |= struct.unpack("<I", descriptor[0x20:0x24])[0] << 32
+        flags, = struct.unpack("<H", descriptor[0x12:0x14])
+        bitmap = None
+        if not (uninit_valid and flags & EXT_BG_BLOCK_UNINIT) and 0 < bitmap_block < blocks:
+            bitmap = read(bitmap_block * block_size, block_size)
+        if not bitmap or len(bitmap) * 8 < count:
+            # Uninitialised (or unreadable) bitmap: nothing in the group can be relied on, scan all of it
+            runs.append((first_block * block_size, (first_block + count) * block_size))
+            continue
+        for first, end in _bit_runs(bitmap, count):
+            runs.append(((first_block + first) * block_size, (first_block + end) * block_size))
+    return "ext", runs, blocks * block_size
+
+
+def _fat_free_clusters(table, clusters, fat_type):
+    """(first, end) runs of free cluster numbers, clusters 2 .. clusters + 1 of a FAT."""
+    last = clusters + 2
+    if fat_type == "fat12":
+        free = []
+        for cluster in range(2, last):
+            pair, = struct.unpack("<H", table[cluster * 3 // 2:cluster * 3 // 2 + 2])
+            if not (pair >> 4 if cluster & 1 else pair & 0x0FFF):
+                free.append((cluster, cluster + 1))
+        return _merge(free)
+    entry_size = 2 if fat_type == "fat16" else 4
+    table = bytearray(table[:last * entry_size])
+    if entry_size == 4:
+        table[3::4] = table[3::4].translate(_LOW_NIBBLE)
+    runs = []
+    for match in _ZERO_RUNS.finditer(table, 2 * entry_size):
+        # An entry is free when all its bytes lie inside one run of zero bytes
+        first = -(-match.start() // entry_size)
+        end = match.end() // entry_size
+        if first < end:
+            runs.append((first, end))
+    return runs
+
+
+def _fat(read):
+    boot = read(0, 512)
+    if len(boot) < 512 or boot[510:512] != b'\x55\xaa' or boot[0] not in (0xEB, 0xE9):
+        return None
+    if boot[3:11] in (b'NTFS    ', b'EXFAT   '):
+        return None
+    bytes_per_sector, sectors_per_cluster, reserved, num_fats, root_entries, total16, _, fat_size16 = \
+        struct.unpack("<HBHBHHBH", boot[11:24])
+    if not _power_of_two(bytes_per_sector) or not _power_of_two(sectors_per_cluster) or not num_fats:
+        return None
+    fat_size = fat_size16 or struct.unpack("<I", boot[36:40])[0]
+    total_sectors = total16 or struct.unpack("<I", boot[32:36])[0]
+    root_dir_sectors = -(-(root_entries * 32) // bytes_per_sector)
+    data_sector = reserved + num_fats * fat_size + root_dir_sectors
+    if not fat_size or total_sectors <= data_sector:
+        return None
+    clusters = (total_sectors - data_sector) // sectors_per_cluster
+    if clusters < FAT12_MAX_CLUSTERS:
+        fat_type = "fat12"
+    elif clusters < FAT16_MAX_CLUSTERS:
+        fat_type = "fat16"
+    else:
+        fat_type = "fat32"
+
+    table = read(reserved * bytes_per_sector, fat_size * bytes_per_sector)
+    entry_bits = {"fat12": 12, "fat16": 16, "fat32": 32}[fat_type]
+    # Clusters the FAT is too short to describe cannot hold a file
+    clusters = min(clusters, len(table) * 8 // entry_bits - 2)
+    if clusters <= 0:
+        return None
+    cluster_size = bytes_per_sector * sectors_per_cluster
+    data_offset = data_sector * bytes_per_sector
+    runs = [
+        (data_offset + (first - 2) * cluster_size, data_offset + (end - 2) * cluster_size)
+        for first, end in _fat_free_clusters(table, clusters, fat_type)
+    ]
+    return fat_type, runs, data_offset + clusters * cluster_size
+
+
+def unallocated_extents(read, source_size, merge_gap=DEFAULT_MERGE_GAP):
+    """AllocationMap of the free space of the filesystem at offset 0, or None if it is not ext or FAT.
+
+    extents are (start, end) byte ranges clipped to source_size; allocated
+    runs shorter than merge_gap between two of them are folded in.
+    """
+    for parse in (_ext, _fat):
+        try:
+            parsed = parse(read)
+        except struct.error:
+            parsed = None
+        if parsed:
+            break
+    else:
+        return None
+    filesystem, runs, fs_end = parsed
+    if fs_end < source_size:
+        runs.append((fs_end, source_size))
+    runs = [(start, min(end, source_size)) for start, end in sorted(runs) if start < source_size]
+    return AllocationMap(filesystem, _merge(runs, merge_gap))
@@ -0,0 +1,187 @@
+"""Background writer threads for carved output, so a slow destination never stalls the source read.
+
+The carving loop posts (offset, buffer) extents to a WriterPool and goes
+straight back to reading; writer threads write them at their offsets. Each
+output file is owned by one thread, so it is only closed after all its
+extents are down, and the bytes in flight are capped: a post that would
+exceed max_pending blocks until the writers catch up.
+"""
+import os
+import queue
+import threading
+
+DEFAULT_WRITER_THREADS = 2
+DEFAULT_MAX_PENDING = 64 * 1024 * 1024
+
+OUTPUT_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+# Queue items are (output, offset, buffer) to write, (output, None, None) to close, or _STOP
+_STOP = None
+
+
+class AsyncOutput:
+    """File-like handle whose write() queues the buffer for a writer thread.
+
+    Buffers may be memoryviews into an mmap: they are written as they are,
+    without a copy, and must stay valid until the pool has drained.
+    """
+
+    def __init__(self, pool, file_name, lane):
+        self.pool = pool
+        self.name = file_name
+        self.lane = lane
+        self.offset = 0
+        self.fd = None
+        self.done = threading.Event()
+
+    def write(self, data):
+        size = len(data)
+        if size:
+            self.pool._post(self, self.offset, data, size)
+            self.offset += size
+        return size
+
+    def close(self):
+        """Queue the close; returns at once, wait() blocks until the file is complete."""
+        self.pool._post(self, None, None, 0)
+
+    def wait(self):
+        self.done.wait()
+        self.pool.raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class WriterPool:
+    """Writer threads fed through per-thread queues with a shared byte budget (the backpressure)."""
+
+    def __init__(self, threads=DEFAULT_WRITER_THREADS, max_pending=DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.budget = threading.Condition()
+        self.error = None
+        self.next_lane = 0
+        # Outputs not yet closed on disk, by file name, for wait_for()
+        self.open_outputs = {}
+        self.queues = [queue.SimpleQueue() for _ in range(max(threads, 1))]
+        self.threads = [
+            threading.Thread(target=self._run, args=(lane,), name=f"carve-writer-{index}", daemon=True)
+            for index, lane in enumerate(self.queues)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def open(self, file_name):
+        """Open file_name for writing on the next writer thread, round robin."""
+        self.raise_error()
+        lane = self.queues[self.next_lane]
+        self.next_lane = (self.next_lane + 1) % len(self.queues)
+        output = AsyncOutput(self, file_name, lane)
+        self.open_outputs[file_name] = output
+        return output
+
+    def wait_for(self, file_name):
+        """Block until file_name is completely written, e.g. before renaming or deleting it."""
+        output = self.open_outputs.get(file_name)
+        if output is not None:
+            output.wait()
+        self.raise_error()
+
+    def written(self, file_name):
+        """Whether file_name, once opened here, has been completely written and closed."""
+        return file_name not in self.open_outputs
+
+    def drain(self):
+        """Block until every file opened so far is completely written."""
+        for output in list(self.open_outputs.values()):
+            output.wait()
+        self.raise_error()
+
+    def _post(self, output, offset, data, size):
+        with self.budget:
+            # A single extent larger than the whole budget still goes through once the queue is empty
+            while self.pending and self.pending + size > self.max_pending and self.error is None:
+                self.budget.wait()
+            self.raise_error()
+            self.pending += size
+        output.lane.put((output, offset, data))
+
+    def _release(self, size):
+        with self.budget:
+            self.pending -= size
+            self.budget.notify_all()
+
+    @staticmethod
+    def _write_extent(output, offset, data):
+        if output.fd is None:
+            output.fd = os.open(output.name, OUTPUT_FLAGS, 0o666)
+        pwrite = getattr(os, "pwrite", None)
+        if pwrite is None:
+            # Windows has no pwrite; an output is only written by its own thread, so seek + write is safe
+            os.lseek(output.fd, offset, os.SEEK_SET)
+        with memoryview(data) as view:
+            while view:
+                written = os.write(output.fd, view) if pwrite is None else pwrite(output.fd, view, offset)
+                offset += written
+                view = view[written:]
+
+    def _close_output(self, output):
+        try:
+            if output.fd is None:
+                # Nothing was written: still leave an (empty) file behind, as open() would
+                output.fd = os.open(output.name, OUTPUT_FLAGS, 0o666)
+            os.close(output.fd)
+        finally:
+            output.fd = -1
+            if self.open_outputs.get(output.name) is output:
+                del self.open_outputs[output.name]
+
+    def _run(self, lane):
+        while True:
+            item = lane.get()
+            if item is _STOP:
+                return
+            output, offset, data = item
+            item = None
+            try:
+                if data is not None:
+                    if self.error is None:
+                        self._write_extent(output, offset, data)
+                else:
+                    self._close_output(output)
+            except Exception as e:
+                # Stored for raise_error; done and the budget are still released below, so nobody hangs
+                with self.budget:
+                    if self.error is None:
+                        self.error = e
+                    self.budget.notify_all()
+            finally:
+                if data is not None:
+                    size = len(data)
+                    data = None  # drop the buffer (and any mmap export) before freeing its budget
+                    self._release(size)
+                else:
+                    output.done.set()
+
+    def raise_error(self):
+        """Re-raise, on the carving thread, the first error a writer thread hit."""
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Write everything still queued, stop the threads and re-raise any writer error."""
+        for lane in self.queues:
+            lane.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,412 @@
+"""Benchmark the carving scanners on reproducible synthetic disk images.
+
+The image is filled with a seeded mix of random, zeroed and text blocks, and
+samples of every selected type from file_signatures are planted at random
+offsets: a third sector aligned, a third straddling a 512-byte sector and a
+third straddling a 1 MiB window edge. Every scanner is scored on MB/s, hit
+recall (planted headers reported at their offset with their type) and
+false-positive rate (reported hits where nothing was planted). --carve also
+times carve_device end to end and counts carves identical to what was planted.
+--type-scaling rescans the warmed image for the first 1, 2, 4, ... selected
+types to show how scan throughput changes with the number of types.
+
+Usage: python benchmark.py [--size-mb 256] [--window-mb 4] [--seed 1337] [--workers N]
+                            [--types jpg png ...] [--files-per-type 8] [--per-type] [--carve]
+                            [--type-scaling]
+                            [--cluster-size 4096]
+                            [--skip-legacy] [--io-modes buffered fadvise direct]
+                            [--image PATH] [--scan-path /dev/loopN]
+
+To benchmark against a loopback device, keep the image and attach it first:
+    losetup --find --show synthetic.img    # prints e.g. /dev/loop0
+    python benchmark.py --image synthetic.img --scan-path /dev/loop0 --io-modes buffered fadvise direct
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import os
+import random
+import sqlite3
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import Counter, namedtuple
+from functools import partial
+
+from carver import HEADER_OFFSETS, MB, SignatureMatcher, carve_device, map_image, read_at, scan_device, scan_mapped, scan_parallel
+from fs_geometry import ClusterGeometry
+from hit_validators import validate_hit
+from signatures import file_signatures
+from uncached_io import IO_MODES
+
+LEGACY_READ_SIZE = 512
+
+TEXT_WORDS = b"the quick brown fox jumps over lazy dog evidence disk sector cluster report case".split()
+
+ZIP_FIRST_ENTRIES = {
+    "zip": "content.bin", "docx": "[Content_Types].xml", "xlsx": "[Content_Types].xml",
+    "jar": "META-INF/MANIFEST.MF", "epub": "mimetype",
+}
+# (after header, before footer) around the text body of text formats
+TEXT_SAMPLES = {
+    "json": (b'"data": "', b'"}'),
+    "xml": (b' version="1.0"?>\n', b'\n'),
+    "html": (b'>\n', b'\n'),
+    "css": (b' style ', b' */\n'),
+    "js": (b' script\n', b'\n'),
+    "py": (b' module\nimport os\n', b'\n'),
+}
+
+Planted = namedtuple("Planted", ["offset", "file_type", "size", "sha256"])
+
+
+def body_alphabet(signatures):
+    """Bytes that start no header or footer, so planted bodies cannot fake a signature."""
+    banned = {marker[0] for signature in signatures.values() for marker in signature if marker}
+    return bytes(value for value in range(256) if value not in banned)
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def build_sample(file_type, signature, body):
+    """A plantable file of file_type wrapped around body.
+
+    Samples carry the structure that length_resolvers and hit_validators
+    check for, so both paths are measured; types neither of them knows are
+    plain header + body + footer. Text types expect a text body.
+    """
+    footer = signature[-1] if len(signature) > 1 else b''
+    if file_type == "png":
+        ihdr = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+        return signature[0] + _png_chunk(b'IHDR', ihdr) + _png_chunk(b'IDAT', body) + _png_chunk(b'IEND', b'')
+    if file_type in ZIP_FIRST_ENTRIES:
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zipped:
+            zipped.writestr(ZIP_FIRST_ENTRIES[file_type], body)
+        return archive.getvalue()
+    if file_type in ("wav", "avi", "webp"):
+        form = {"wav": b'WAVE', "avi": b'AVI ', "webp": b'WEBP'}[file_type]
+        payload = form + b'data' + struct.pack("<I", len(body)) + body + b'\x00' * (len(body) & 1)
+        return b'RIFF' + struct.pack("<I", len(payload)) + payload
+    if file_type == "sqlite" and hasattr(sqlite3.Connection, "serialize"):
+        database = sqlite3.connect(":memory:")
+        database.execute("CREATE TABLE blobs (data BLOB)")
+        database.execute("INSERT INTO blobs VALUES (?)", (body,))
+        database.commit()
+        return database.serialize()
+    if file_type in ("exe", "dll"):
+        characteristics = 0x2102 if file_type == "dll" else 0x0102
+        dos = b'MZ' + b'\x00' * 58 + struct.pack("<I", 64)
+        coff = b'PE\x00\x00' + struct.pack("<HHIIIHH", 0x14C, 1, 0, 0, 0, 224, characteristics)
+        optional = struct.pack("<H", 0x10B) + b'\x00' * 222
+        section = b'.text\x00\x00\x00' + struct.pack("<IIII", len(body), 0x1000, len(body), 512) + b'\x00' * 16
+        headers = dos + coff + optional + section
+        return headers + b'\x00' * (512 - len(headers)) + body
+    if file_type == "bmp":
+        pixels = 54
+        return (b'BM' + struct.pack("<IIII", pixels + len(body), 0, pixels, 40)
+                + struct.pack("<iiHHIIiiII", 1, 1, 1, 24, 0, len(body), 0, 0, 0, 0) + body)
+    if file_type == "jpg":
+        app0 = b'\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+        return signature[0] + app0 + body + footer
+    if file_type == "mp3":
+        size = bytes((len(body) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+        return signature[0] + b'\x03\x00\x00' + size + body + footer
+    if file_type in ("gz", "tar.gz"):
+        return gzip.compress(body, mtime=0)
+    if file_type == "class":
+        return signature[0] + b'\x00\x00\x00\x34' + body
+    if file_type == "psd":
+        return signature[0] + b'\x00\x01' + b'\x00' * 6 + b'\x00\x03' + body
+    if file_type == "tiff":
+        return signature[0] + struct.pack("<I", 8) + body + footer
+    if file_type == "tar":
+        return b'sample.bin'.ljust(HEADER_OFFSETS["tar"], b'\x00') + signature[0] + b'\x0000' + body
+    if file_type == "iso":
+        return bytes(HEADER_OFFSETS["iso"] - 1) + b'\x01' + signature[0] + b'\x01' + body
+    if file_type in TEXT_SAMPLES:
+        prefix, suffix = TEXT_SAMPLES[file_type]
+        return signature[0] + prefix + body + suffix + footer
+    return signature[0] + body + footer
+
+
+def write_filler(image, size, rng):
+    """Fill the image with a seeded mix of random, zeroed and text 1 MiB blocks."""
+    for _ in range(0, size, MB):
+        kind = rng.random()
+        if kind < 0.5:
+            block = rng.randbytes(MB)
+        elif kind < 0.8:
+            block = bytes(MB)
+        else:
+            block = b' '.join(rng.choice(TEXT_WORDS) for _ in range(MB // 5))[:MB].ljust(MB, b'\n')
+        image.write(block)
+
+
+def make_image(path, size_mb, seed, file_types, signatures=file_signatures, files_per_type=8, cluster_size=None):
+    """Write a synthetic image with files_per_type samples of every type in file_types.
+
+    With cluster_size every file starts on a cluster boundary, as on a
+    filesystem, instead of straddling sector and window edges.
+
+    Returns the planted files as a list of Planted sorted by offset.
+    """
+    rng = random.Random(seed)
+    size = size_mb * MB
+    alphabet = body_alphabet(signatures)
+    text_alphabet = bytes(value for value in alphabet if 0x20 <= value < 0x7F) + b'\n'
+    count = files_per_type * len(file_types)
+    slot = size // count // LEGACY_READ_SIZE * LEGACY_READ_SIZE
+    planted = []
+
+    with open(path, "wb") as image:
+        write_filler(image, size, rng)
+
+        for index in range(count):
+            file_type = file_types[index % len(file_types)]
+            signature = signatures[file_type]
+            body = bytes(rng.choices(text_alphabet if file_type in TEXT_SAMPLES else alphabet,
+                                     k=rng.randrange(256, 4096)))
+            sample = build_sample(file_type, signature, body)
+            # Everything before the header (tar and ISO put theirs deeper in) is planted but not carved
+            lead = sample.find(signature[0])
+            slot_start = index * slot
+            room = slot - len(sample) - max(LEGACY_READ_SIZE, cluster_size or 0)
+            if room <= 0:
+                raise ValueError("Too many planted files for the image size; raise --size-mb")
+
+            offset = slot_start + rng.randrange(room)
+            half_header = max(len(signature[0]) // 2, 1)
+            if cluster_size:
+                offset = -(-(offset - lead) // cluster_size) * cluster_size + lead
+            elif index % 3 == 1:
+                offset = -(-offset // LEGACY_READ_SIZE) * LEGACY_READ_SIZE - half_header
+            elif index % 3 == 2:
+                edge = -(-offset // MB) * MB - half_header
+                if edge + len(sample) <= slot_start + slot:
+                    offset = edge
+                else:
+                    offset = -(-offset // LEGACY_READ_SIZE) * LEGACY_READ_SIZE - half_header
+            offset = max(offset, slot_start + lead)
+
+            image.seek(offset - lead)
+            image.write(sample)
+            carved = sample[lead:]
+            planted.append(Planted(offset, file_type, len(carved), hashlib.sha256(carved).hexdigest()))
+
+    return sorted(planted)
+
+
+def legacy_scan(path, signatures):
+    """Replicates the original per-type recover_file search: one pass per type, 512 bytes per read."""
+    hits = []
+    for file_type, signature in signatures.items():
+        with open(path, "rb") as fileD:
+            offs = 0
+            byte = fileD.read(LEGACY_READ_SIZE)
+            while byte:
+                found = byte.find(signature[0])
+                if found >= 0:
+                    hits.append((found + LEGACY_READ_SIZE * offs, file_type))
+                byte = fileD.read(LEGACY_READ_SIZE)
+                offs += 1
+    return sorted(hits)
+
+
+def windowed_scan(path, signatures, window_size, io_mode="buffered"):
+    matcher = SignatureMatcher(signatures, list(signatures))
+    return list(scan_device(path, matcher, window_size, io_mode=io_mode))
+
+
+def validated_scan(path, signatures, window_size, io_mode="buffered"):
+    """windowed_scan with every hit passed through hit_validators, as carve_device does."""
+    hits = windowed_scan(path, signatures, window_size, io_mode)
+    with open(path, "rb") as fileD:
+        read = partial(read_at, fileD)
+        return [(location, file_type) for location, file_type in hits if validate_hit(read, file_type, location)]
+
+
+def aligned_scan(path, signatures, window_size, cluster_size):
+    matcher = SignatureMatcher(signatures, list(signatures), ClusterGeometry(cluster_size, 0, "supplied"))
+    return list(scan_device(path, matcher, window_size))
+
+
+def mapped_scan(path, signatures, window_size):
+    matcher = SignatureMatcher(signatures, list(signatures))
+    with open(path, "rb") as fileD:
+        mapped = map_image(fileD)
+        try:
+            return list(scan_mapped(mapped, matcher, window_size))
+        finally:
+            mapped.close()
+
+
+def drop_cache(path):
+    """Evict path from the page cache so every scanner starts cold."""
+    if hasattr(os, "posix_fadvise"):
+        with open(path, "rb") as fileD:
+            os.posix_fadvise(fileD.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def page_cache_kb():
+    """Cached + Buffers from /proc/meminfo (block devices are cached under Buffers), or None."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            fields = dict(line.split(":", 1) for line in meminfo)
+        return int(fields["Cached"].split()[0]) + int(fields["Buffers"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def score(hits, planted):
+    """(recall, false-positive rate, wrong-type hits on planted offsets) of a list of (offset, type) hits."""
+    expected = {(entry.offset, entry.file_type) for entry in planted}
+    offsets = {entry.offset for entry in planted}
+    reported = set(hits)
+    recall = len(expected & reported) / len(expected) if expected else 1.0
+    false_positives = sum(1 for offset, _ in reported if offset not in offsets)
+    wrong_type = sum(1 for hit in reported if hit[0] in offsets and hit not in expected)
+    return recall, false_positives / len(reported) if reported else 0.0, wrong_type
+
+
+def recall_per_type(hits, planted):
+    reported = set(hits)
+    totals, found = Counter(), Counter()
+    for entry in planted:
+        totals[entry.file_type] += 1
+        found[entry.file_type] += (entry.offset, entry.file_type) in reported
+    return {file_type: found[file_type] / totals[file_type] for file_type in sorted(totals)}
+
+
+def run(label, planted, size_mb, scan, per_type=False):
+    started = time.perf_counter()
+    cached_before = page_cache_kb()
+    hits = scan()
+    elapsed = time.perf_counter() - started
+    recall, fp_rate, wrong_type = score(hits, planted)
+    line = (f"{label:<28} {size_mb / elapsed:8.1f} MB/s   recall {recall:7.2%}   "
+            f"false positives {fp_rate:7.2%} of {len(set(hits))} hits   wrong type {wrong_type}")
+    if cached_before is not None:
+        line += f"   page cache {(page_cache_kb() - cached_before) / 1024:+.0f} MB"
+    print(line)
+    if per_type:
+        for file_type, type_recall in recall_per_type(hits, planted).items():
+            print(f"    {file_type:<8} recall {type_recall:7.2%}")
+
+
+def run_type_scaling(path, planted, size_mb, file_types, window_size):
+    """Time the scanner on the cached image for a growing prefix of file_types."""
+    counts = sorted({min(2 ** power, len(file_types)) for power in range(len(file_types).bit_length() + 1)})
+    scan = partial(mapped_scan, path) if os.path.isfile(path) else partial(windowed_scan, path)
+    scan(file_signatures, window_size)  # warm the cache so every count reads from memory
+    for count in counts:
+        signatures = {file_type: file_signatures[file_type] for file_type in file_types[:count]}
+        matcher = SignatureMatcher(signatures, list(signatures))
+        selected = [entry for entry in planted if entry.file_type in signatures]
+        started = time.perf_counter()
+        hits = scan(signatures, window_size)
+        elapsed = time.perf_counter() - started
+        recall, _, _ = score(hits, selected)
+        print(f"{count:3} types {len(matcher.dispatch):3} headers ({'keyed regex' if matcher.pattern else 'find':>11})"
+              f" {size_mb / elapsed:8.1f} MB/s   recall {recall:7.2%}   {len(hits)} hits")
+
+
+def run_carve(path, planted, size_mb, file_types, window_size, workers):
+    """Time carve_device end to end and count carves byte-identical to a planted file."""
+    with tempfile.TemporaryDirectory() as out_dir:
+        started = time.perf_counter()
+        carve_device(path, file_types, file_signatures, out_dir, window_size, workers=workers)
+        elapsed = time.perf_counter() - started
+
+        carved = Counter()
+        written = 0
+        for name in os.listdir(out_dir):
+            digest = hashlib.sha256()
+            with open(os.path.join(out_dir, name), "rb") as carve:
+                for block in iter(lambda: carve.read(MB), b''):
+                    digest.update(block)
+                    written += len(block)
+            carved[digest.hexdigest()] += 1
+
+    expected = Counter(entry.sha256 for entry in planted)
+    exact = sum(min(count, carved[digest]) for digest, count in expected.items())
+    planted_bytes = sum(entry.size for entry in planted)
+    print(f"{'carve_device end to end':<28} {size_mb / elapsed:8.1f} MB/s   exact carves {exact}/{len(planted)}   "
+          f"{sum(carved.values())} files, {written / MB:.1f} MB written for {planted_bytes / MB:.1f} MB planted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--window-mb", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--types", nargs="+", help="types to plant and scan for (default: every type with a header)")
+    parser.add_argument("--files-per-type", type=int, default=8)
+    parser.add_argument("--per-type", action="store_true", help="also print recall per file type")
+    parser.add_argument("--cluster-size", type=int,
+                        help="plant files on cluster boundaries and also time the cluster-aligned scanner")
+    parser.add_argument("--carve", action="store_true", help="also time carve_device end to end")
+    parser.add_argument("--type-scaling", action="store_true",
+                        help="also time the scanner for 1, 2, 4, ... of the selected types")
+    parser.add_argument("--skip-legacy", action="store_true", help="skip the legacy loop, which reads once per type")
+    parser.add_argument("--image", help="write the synthetic image here and keep it (e.g. to attach with losetup)")
+    parser.add_argument("--scan-path", help="scan this path instead of the image, e.g. the loop device backing it")
+    parser.add_argument("--io-modes", nargs="+", choices=IO_MODES, default=["buffered"],
+                        help="read the device through each of these modes (see uncached_io)")
+    args = parser.parse_args()
+
+    file_types = args.types or [file_type for file_type, signature in file_signatures.items() if signature[0]]
+    unknown = [file_type for file_type in file_types if file_type not in file_signatures]
+    if unknown:
+        parser.error(f"unknown file types: {', '.join(unknown)}")
+    signatures = {file_type: file_signatures[file_type] for file_type in file_types}
+    window_size = args.window_mb * MB
+
+    with tempfile.TemporaryDirectory() as workdir:
+        image = args.image or os.path.join(workdir, "synthetic.img")
+        planted = make_image(image, args.size_mb, args.seed, file_types, files_per_type=args.files_per_type,
+                             cluster_size=args.cluster_size)
+        path = args.scan_path or image
+        print(f"Synthetic image: {args.size_mb} MB, {len(planted)} planted files of {len(file_types)} types, "
+              f"scanning {path}\n")
+
+        if not args.skip_legacy:
+            drop_cache(path)
+            run(f"legacy {LEGACY_READ_SIZE}-byte loop", planted, args.size_mb,
+                lambda: legacy_scan(path, signatures), args.per_type)
+        for io_mode in args.io_modes:
+            drop_cache(path)
+            run(f"windowed {args.window_mb} MB {io_mode}", planted, args.size_mb,
+                lambda: windowed_scan(path, signatures, window_size, io_mode), args.per_type)
+        drop_cache(path)
+        run(f"windowed {args.window_mb} MB validated", planted, args.size_mb,
+            lambda: validated_scan(path, signatures, window_size), args.per_type)
+        if os.path.isfile(path):
+            drop_cache(path)
+            run("mmap scanner", planted, args.size_mb,
+                lambda: mapped_scan(path, signatures, window_size), args.per_type)
+        if args.cluster_size:
+            drop_cache(path)
+            run(f"aligned {args.cluster_size}-byte clusters", planted, args.size_mb,
+                lambda: aligned_scan(path, signatures, window_size, args.cluster_size), args.per_type)
+        if args.workers > 1:
+            drop_cache(path)
+            run(f"parallel x{args.workers} scanner", planted, args.size_mb,
+                lambda: list(scan_parallel(path, signatures, file_types, args.workers, window_size)),
+                args.per_type)
+        if args.type_scaling:
+            print("\nScan throughput by number of selected types (page cache warm):")
+            run_type_scaling(path, planted, args.size_mb, file_types, window_size)
+        if args.carve:
+            drop_cache(path)
+            run_carve(path, planted, args.size_mb, file_types, window_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
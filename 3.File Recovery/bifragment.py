@@ -0,0 +1,237 @@
+"""Bifragment gap carving: recover a JPEG or ZIP that was split in two around a gap.
+
+A file written onto a fragmented filesystem often lies in two pieces, the
+second starting some whole number of clusters after the first ends. Every
+resolver takes read(offset, size) -> bytes, the absolute header offset, the
+carve limit and the ClusterGeometry, and returns Fragments(split, gap,
+length): the file is [start, split) followed by [split + gap, ...), length
+bytes in total. None means the file is contiguous, or no split that makes it
+valid again was found, and the caller carves it as usual.
+"""
+import struct
+import zlib
+from collections import namedtuple
+
+from length_resolvers import zip_length
+
+Fragments = namedtuple("Fragments", ["split", "gap", "length"])
+
+# Largest gap tried, in clusters
+DEFAULT_MAX_GAP_CLUSTERS = 1024
+# How many clusters before the point where a JPEG stops validating the split may lie
+JPEG_BACKTRACK_CLUSTERS = 4
+JPEG_READ_SIZE = 64 * 1024
+# Scan data stuffs a 0xFF byte every few hundred bytes; after a gap, this many clusters
+# without one rule the gap out instead of scanning on to the carve limit
+JPEG_RESUME_CLUSTERS = 4
+# JPEG markers that carry no length field
+JPEG_STANDALONE = set(range(0xD0, 0xD8)) | {0x01, 0xD8}
+
+
+def spliced_reader(read, split, gap):
+    """read(offset, size) over the file with the gap after split cut out."""
+    def spliced(offset, size):
+        if offset >= split:
+            return read(offset + gap, size)
+        head = read(offset, min(size, split - offset))
+        if offset + size <= split or len(head) < split - offset:
+            return head
+        return head + read(split + gap, offset + size - split)
+    return spliced
+
+
+def _cluster_boundaries(geometry, low, high):
+    """Cluster boundaries b with low < b <= high, nearest to high first."""
+    cluster = geometry.cluster_size
+    top = high - (high - geometry.data_offset) % cluster
+    return range(top, low, -cluster)
+
+
+def _jpeg_scan(read, pos, limit, entropy=False, max_run=None):
+    """Walk JPEG markers and entropy-coded data from pos.
+
+    Returns ("eoi", end) after the EOI marker, ("bad", offset) at the first
+    byte sequence no JPEG can contain, or ("eof", offset) at limit. With
+    max_run, max_run bytes of entropy-coded data without a 0xFF are bad too.
+    """
+    read_size = JPEG_READ_SIZE if max_run is None else min(JPEG_READ_SIZE, max_run)
+    while pos < limit:
+        if entropy:
+            block = read(pos, min(read_size, limit - pos))
+            if len(block) < 2:
+                return "eof", pos
+            found = block.find(b'\xff')
+            if found < 0 and len(block) == max_run:
+                return "bad", pos
+            while 0 <= found < len(block) - 1:
+                follower = block[found + 1]
+                if follower == 0x00 or 0xD0 <= follower <= 0xD7 or follower == 0xFF:
+                    found = block.find(b'\xff', found + 1 if follower == 0xFF else found + 2)
+                    continue
+                if follower == 0xD9:
+                    return "eoi", pos + found + 2
+                if follower < 0xC0:
+                    return "bad", pos + found
+                break  # another marker segment (progressive scans, DHT, DRI, ...)
+            if found < 0 or found >= len(block) - 1:
+                pos += len(block) - 1
+                continue
+            pos += found
+            entropy = False
+            continue
+
+        marker = read(pos, 4)
+        if len(marker) < 2:
+            return "eof", pos
+        if marker[0] != 0xFF or marker[1] < 0xC0 and marker[1] not in JPEG_STANDALONE:
+            return "bad", pos
+        code = marker[1]
+        if code == 0xFF:  # fill byte before a marker
+            pos += 1
+            continue
+        if code == 0xD9:
+            return "eoi", pos + 2
+        if code in JPEG_STANDALONE:
+            pos += 2
+            continue
+        if len(marker) < 4:
+            return "eof", pos
+        length, = struct.unpack(">H", marker[2:4])
+        if length < 2:
+            return "bad", pos
+        pos += 2 + length
+        entropy = code == 0xDA
+    return "eof", pos
+
+
+def jpeg_fragments(read, start, limit, geometry, max_gap_clusters=DEFAULT_MAX_GAP_CLUSTERS):
+    """Find where a JPEG stops being valid and a gap after which its scan data resumes to EOI.
+
+    Only splits inside entropy-coded data are tried; that is where almost all
+    of a JPEG's bytes lie. The nearest split and the smallest gap win. A gap
+    is dropped as soon as the data after it runs JPEG_RESUME_CLUSTERS
+    clusters without a 0xFF byte, so each try reads a few clusters, not the
+    rest of the carve.
+    """
+    state, bad = _jpeg_scan(read, start, limit)
+    if state != "bad":
+        return None
+    cluster = geometry.cluster_size
+    low = max(start, bad - JPEG_BACKTRACK_CLUSTERS * cluster)
+    for split in _cluster_boundaries(geometry, low, bad):
+        # The first fragment itself must validate up to the split
+        if _jpeg_scan(read, start, split)[0] != "eof":
+            continue
+        for gap in range(cluster, (max_gap_clusters + 1) * cluster, cluster):
+            if split + gap >= limit:
+                break
+            # Scan data is never a whole cluster of zeros, and zeroed space would validate for megabytes
+            if not read(split + gap, cluster).strip(b'\x00'):
+                continue
+            state, end = _jpeg_scan(spliced_reader(read, split, gap), split, limit - gap, entropy=True,
+                                    max_run=JPEG_RESUME_CLUSTERS * cluster)
+            if state == "eoi":
+                return Fragments(split, gap, end - start)
+    return None
+
+
+def _find_shifted_eocd(read, start, limit, geometry, max_gap_clusters):
+    """(eocd offset, gap) of the first end-of-central-directory record that sits a whole gap late."""
+    cluster = geometry.cluster_size
+    pos = start
+    tail = b''
+    while pos < limit:
+        block = read(pos, min(JPEG_READ_SIZE, limit - pos))
+        if not block:
+            return None
+        data = tail + block
+        base = pos - len(tail)
+        found = data.find(b'PK\x05\x06')
+        while found >= 0:
+            record = read(base + found, 22)
+            if len(record) == 22:
+                cd_size, cd_offset = struct.unpack("<II", record[12:20])
+                gap = base + found - start - cd_offset - cd_size
+                if 0 < gap <= max_gap_clusters * cluster and gap % cluster == 0:
+                    return base + found, gap
+            found = data.find(b'PK\x05\x06', found + 1)
+        tail = data[-3:]
+        pos += len(block)
+    return None
+
+
+def _zip_entry_crc_ok(read, header_pos):
+    """Decompress the local entry at header_pos and compare its CRC-32 (stored and deflate only)."""
+    header = read(header_pos, 30)
+    if len(header) < 30 or header[:4] != b'PK\x03\x04':
+        return False
+    flags, method = struct.unpack("<HH", header[6:10])
+    crc, compressed_size = struct.unpack("<II", header[14:22])
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    if flags & 0x09:  # data descriptor or encrypted: nothing to check against
+        return True
+    data = read(header_pos + 30 + name_len + extra_len, compressed_size)
+    if len(data) < compressed_size:
+        return False
+    if method == 8:
+        try:
+            data = zlib.decompressobj(-15).decompress(data)
+        except zlib.error:
+            return False
+    elif method != 0:
+        return True
+    return zlib.crc32(data) == crc
+
+
+def zip_fragments(read, start, limit, geometry, max_gap_clusters=DEFAULT_MAX_GAP_CLUSTERS):
+    """Recover a ZIP whose central directory sits a whole number of clusters later than it says.
+
+    The EOCD record gives the gap exactly. The split must lie after the last
+    local header still found in place; each cluster boundary there is tried
+    until the archive walks cleanly to its EOCD and the entry spanning the
+    split passes its CRC check.
+    """
+    if zip_length(read, start):
+        return None
+    shifted = _find_shifted_eocd(read, start, limit, geometry, max_gap_clusters)
+    if shifted is None:
+        return None
+    eocd, gap = shifted
+    comment_len, = struct.unpack("<H", read(eocd + 20, 2))
+    length = eocd + 22 + comment_len - gap - start
+
+    # Walk local headers in place to find the last record that is intact
+    last_intact = start
+    pos = start
+    upper = None
+    while pos < eocd:
+        header = read(pos, 30)
+        if header[:4] == b'PK\x01\x02':
+            upper = eocd - gap  # every entry is in place, so the split is inside the central directory
+            break
+        if len(header) < 30 or header[:4] != b'PK\x03\x04':
+            break
+        last_intact = pos
+        compressed_size, = struct.unpack("<I", header[18:22])
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        pos += 30 + name_len + extra_len + compressed_size
+
+    if upper is None:
+        upper = min(pos + 4, eocd - gap)
+    for split in reversed(_cluster_boundaries(geometry, last_intact, upper)):
+        spliced = spliced_reader(read, split, gap)
+        if zip_length(spliced, start) != length:
+            continue
+        if _zip_entry_crc_ok(spliced, last_intact):
+            return Fragments(split, gap, length)
+    return None
+
+
+BIFRAGMENT_RESOLVERS = {
+    "jpg": jpeg_fragments,
+    "zip": zip_fragments,
+    "docx": zip_fragments,
+    "xlsx": zip_fragments,
+    "jar": zip_fragments,
+    "epub": zip_fragments,
+}
@@ -0,0 +1,205 @@
+"""Per-block entropy and content class map of a device, to aim carving at the interesting regions.
+
+Every block gets its Shannon entropy (bits per byte) and a coarse class:
+zero (all 0x00), text (nearly all printable ASCII), high-entropy
+(compressed or encrypted: JPEG, ZIP, video, ...) or other. With NumPy the
+histograms of a whole window of blocks are computed at once; without it a
+per-block byte count is used, which gives the same map, only slower.
+
+A map file holds a header, one class byte per block and one entropy byte
+per block (entropy * ENTROPY_SCALE), so a 1 TB device at 4 KiB blocks maps
+into 512 MB. BlockMap.regions turns chosen classes back into byte extents
+for carver.carve_device.
+"""
+import math
+import mmap
+import re
+import struct
+from collections import Counter
+
+from hit_validators import TEXT_WHITESPACE
+from uncached_io import open_source, source_length
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BLOCK_CLASSES = ("zero", "text", "high-entropy", "other")
+ZERO, TEXT, HIGH_ENTROPY, OTHER = range(len(BLOCK_CLASSES))
+
+DEFAULT_MAP_BLOCK_SIZE = 4096
+# Bytes read per step; a multiple of any block size up to 1 MiB
+DEFAULT_MAP_WINDOW_SIZE = 64 * 1024 * 1024
+# Blocks classified by one NumPy histogram, to bound the temporary arrays
+NUMPY_CHUNK_BLOCKS = 1024
+
+# A 4 KiB block of random bytes measures about 7.95 bits; deflate and JPEG data stay above 7.5
+HIGH_ENTROPY_BITS = 7.5
+TEXT_MIN_FRACTION = 0.95
+ENTROPY_SCALE = 32
+
+MAP_MAGIC = b'BLKMAP01'
+MAP_HEADER = struct.Struct("<8sQQ")
+
+PRINTABLE = bytes(range(0x20, 0x7F)) + TEXT_WHITESPACE
+
+
+def _classify(entropy, size, zeros, printable):
+    if zeros == size:
+        return ZERO
+    if printable >= TEXT_MIN_FRACTION * size:
+        return TEXT
+    if entropy >= HIGH_ENTROPY_BITS:
+        return HIGH_ENTROPY
+    return OTHER
+
+
+def _entropy_code(entropy):
+    return min(round(entropy * ENTROPY_SCALE), 255)
+
+
+def _classify_python(data, block_size):
+    classes = bytearray()
+    codes = bytearray()
+    for offset in range(0, len(data), block_size):
+        block = data[offset:offset + block_size]
+        size = len(block)
+        entropy = -sum(count / size * math.log2(count / size) for count in Counter(block).values())
+        printable = size - len(block.translate(None, PRINTABLE))
+        classes.append(_classify(entropy, size, block.count(0), printable))
+        codes.append(_entropy_code(entropy))
+    return bytes(classes), bytes(codes)
+
+
+if numpy is not None:
+    _PRINTABLE_MASK = numpy.zeros(256, dtype=bool)
+    _PRINTABLE_MASK[list(PRINTABLE)] = True
+
+
+def _classify_numpy(data, block_size):
+    array = numpy.frombuffer(data, dtype=numpy.uint8)
+    full = len(array) // block_size
+    classes = []
+    codes = []
+    for first in range(0, full, NUMPY_CHUNK_BLOCKS):
+        rows = min(NUMPY_CHUNK_BLOCKS, full - first)
+        chunk = array[first * block_size:(first + rows) * block_size].reshape(rows, block_size)
+        # One bincount over (row, byte value) keys gives every row's histogram at once
+        keys = chunk + (numpy.arange(rows, dtype=numpy.int32) * 256)[:, None]
+        counts = numpy.bincount(keys.ravel(), minlength=rows * 256).reshape(rows, 256)
+        p = counts / block_size
+        logs = numpy.log2(p, out=numpy.zeros_like(p), where=p > 0)
+        entropy = -(p * logs).sum(axis=1)
+        printable = counts[:, _PRINTABLE_MASK].sum(axis=1)
+        block_classes = numpy.full(rows, OTHER, dtype=numpy.uint8)
+        block_classes[entropy >= HIGH_ENTROPY_BITS] = HIGH_ENTROPY
+        block_classes[printable >= TEXT_MIN_FRACTION * block_size] = TEXT
+        block_classes[counts[:, 0] == block_size] = ZERO
+        classes.append(block_classes.tobytes())
+        codes.append(numpy.minimum(numpy.rint(entropy * ENTROPY_SCALE), 255).astype(numpy.uint8).tobytes())
+    if full * block_size < len(array):
+        tail_classes, tail_codes = _classify_python(bytes(data[full * block_size:]), block_size)
+        classes.append(tail_classes)
+        codes.append(tail_codes)
+    return b''.join(classes), b''.join(codes)
+
+
+def classify_blocks(data, block_size=DEFAULT_MAP_BLOCK_SIZE):
+    """(classes, entropy codes) of every block of data, one byte each; a short last block is classified as it is."""
+    if numpy is not None:
+        return _classify_numpy(data, block_size)
+    return _classify_python(data, block_size)
+
+
+def build_block_map(drive, map_path, block_size=DEFAULT_MAP_BLOCK_SIZE, window_size=DEFAULT_MAP_WINDOW_SIZE,
+                    io_mode="buffered", stop_event=None, progress=None):
+    """Classify every block of drive into a map file at map_path.
+
+    progress(offset) is called after each window. Returns a dict mapping
+    each class name to the number of bytes in it (for the part mapped
+    before a stop).
+    """
+    window_size = max(window_size // block_size, 1) * block_size
+    totals = dict.fromkeys(BLOCK_CLASSES, 0)
+    with open_source(drive, io_mode) as fileD, open(map_path, "wb") as map_file:
+        size = source_length(fileD)
+        fileD.seek(0)
+        blocks = -(-size // block_size)
+        map_file.write(MAP_HEADER.pack(MAP_MAGIC, block_size, size))
+        map_file.truncate(MAP_HEADER.size + 2 * blocks)
+        offset = 0
+        while offset < size and not (stop_event and stop_event.is_set()):
+            data = fileD.read(min(window_size, size - offset))
+            if not data:
+                break
+            classes, codes = classify_blocks(data, block_size)
+            # Both regions are filled front to back, so a seek per window is all it takes (no pwrite on Windows)
+            index = offset // block_size
+            map_file.seek(MAP_HEADER.size + index)
+            map_file.write(classes)
+            map_file.seek(MAP_HEADER.size + blocks + index)
+            map_file.write(codes)
+            for code, name in enumerate(BLOCK_CLASSES):
+                totals[name] += classes.count(code) * block_size
+            offset += len(data)
+            if progress:
+                progress(offset)
+    return totals
+
+
+class BlockMap:
+    """Read-only view of a map file written by build_block_map."""
+
+    def __init__(self, map_path):
+        with open(map_path, "rb") as map_file:
+            self.mapped = mmap.mmap(map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.block_size, self.source_size = MAP_HEADER.unpack_from(self.mapped)
+        if magic != MAP_MAGIC:
+            self.mapped.close()
+            raise ValueError(f"{map_path} is not a block map")
+        self.blocks = -(-self.source_size // self.block_size)
+
+    def block_class(self, index):
+        return BLOCK_CLASSES[self.mapped[MAP_HEADER.size + index]]
+
+    def entropy(self, index):
+        return self.mapped[MAP_HEADER.size + self.blocks + index] / ENTROPY_SCALE
+
+    @property
+    def classes(self):
+        return self.mapped[MAP_HEADER.size:MAP_HEADER.size + self.blocks]
+
+    def regions(self, class_names, merge_gap=0):
+        """Sorted (start, end) byte extents of the blocks whose class is in class_names.
+
+        Runs of other blocks shorter than merge_gap bytes between two extents are folded in.
+        """
+        wanted = bytes(BLOCK_CLASSES.index(name) for name in class_names)
+        if not wanted:
+            return []
+        pattern = re.compile(b'[' + re.escape(wanted) + b']+')
+        first = MAP_HEADER.size
+        extents = []
+        for run in pattern.finditer(self.mapped, first, first + self.blocks):
+            start = (run.start() - first) * self.block_size
+            end = min((run.end() - first) * self.block_size, self.source_size)
+            if extents and start - extents[-1][1] <= merge_gap:
+                extents[-1] = (extents[-1][0], end)
+            else:
+                extents.append((start, end))
+        return extents
+
+    def summary(self):
+        """Bytes per class name."""
+        classes = self.classes
+        return {name: classes.count(code) * self.block_size for code, name in enumerate(BLOCK_CLASSES)}
+
+    def close(self):
+        self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
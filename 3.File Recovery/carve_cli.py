@@ -0,0 +1,178 @@
+"""Headless file carving: no Tk, no privilege prompt, usable from batch jobs.
+
+Examples:
+    python carve_cli.py carve /dev/sdb -t jpg png pdf -o recovered -w 8
+    python carve_cli.py carve case.img -t all -o recovered --session case.sqlite --dedupe
+    python carve_cli.py carve case.img -t jpg zip -o recovered --session case.idx --index-only
+    python carve_cli.py extract case.idx -o recovered -t zip
+    python carve_cli.py map case.img case.map
+    python carve_cli.py carve case.img -t jpg zip -o recovered --map case.map --map-classes high-entropy
+"""
+import argparse
+import os
+import sys
+
+from async_writer import DEFAULT_WRITER_THREADS
+from block_map import BLOCK_CLASSES, DEFAULT_MAP_BLOCK_SIZE, BlockMap, build_block_map
+from carve_progress import format_progress
+from carver import DEFAULT_BLOCK_SIZE, MB, carve_device, extract_hits
+from known_files import KnownFiles
+from signatures import file_signatures
+from uncached_io import IO_MODES
+
+
+def parse_max_sizes(values):
+    """TYPE=MB pairs from --max-size into a carver max_sizes dict (in bytes)."""
+    max_sizes = {}
+    for value in values or []:
+        file_type, _, size_mb = value.partition("=")
+        if file_type not in file_signatures or not size_mb:
+            raise argparse.ArgumentTypeError(f"--max-size expects TYPE=MB with a known type, got {value!r}")
+        max_sizes[file_type] = int(float(size_mb) * MB)
+    return max_sizes
+
+
+def print_progress(snapshot):
+    print(format_progress(snapshot), end="\n" if snapshot.done else "\r", file=sys.stderr, flush=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output", required=True, help="directory carved files are written to")
+    common.add_argument("-t", "--types", nargs="+", default=None,
+                        help="file types to carve, or 'all' (see signatures.py)")
+    common.add_argument("--block-size-mb", type=int, default=DEFAULT_BLOCK_SIZE // MB)
+    common.add_argument("--max-size", action="append", metavar="TYPE=MB",
+                        help="cap carves of TYPE at MB megabytes (repeatable)")
+    common.add_argument("--discard-oversize", action="store_true",
+                        help="delete carves that reach their cap instead of keeping them truncated")
+    common.add_argument("--dedupe", action="store_true",
+                        help="store identical carves once under their SHA-256 (see manifest.csv)")
+    common.add_argument("--known-hashes", nargs="+", metavar="FILE",
+                        help="skip carves whose MD5/SHA-1/SHA-256 is listed in these hash sets (e.g. NSRLFile.txt)")
+    common.add_argument("--io-mode", choices=IO_MODES, default="buffered")
+    common.add_argument("-q", "--quiet", action="store_true", help="only print the final summary")
+
+    carve = commands.add_parser("carve", parents=[common], help="scan a device or image and carve files")
+    carve.add_argument("source", help="block device or raw image to carve")
+    carve.add_argument("-w", "--workers", type=int, default=1, help="scan processes")
+    carve.add_argument("--writer-threads", type=int, default=DEFAULT_WRITER_THREADS,
+                       help="threads writing carved files in the background (0 writes inline)")
+    carve.add_argument("--session", help="journal the run here; rerunning with the same path resumes it "
+                                              "(a finished journal, or one of another run, is started over)")
+    carve.add_argument("--index-only", action="store_true",
+                       help="only record candidate offsets in --session, extract later")
+    carve.add_argument("--cluster-size", metavar="BYTES|auto",
+                       help="only check headers at cluster boundaries; 'auto' reads the size from the boot sector")
+    carve.add_argument("--cluster-offset", type=int, default=0,
+                       help="byte offset of cluster 0 when --cluster-size is given in bytes")
+    carve.add_argument("--bifragment", action="store_true",
+                       help="reassemble JPEG and ZIP files split in two around a gap of whole clusters")
+    carve.add_argument("--unallocated-only", action="store_true",
+                       help="scan only the space an ext or FAT filesystem on the source marks free")
+    carve.add_argument("--map", help="block map written by the map command; only its --map-classes regions are scanned")
+    carve.add_argument("--map-classes", nargs="+", choices=BLOCK_CLASSES,
+                       default=[name for name in BLOCK_CLASSES if name != "zero"],
+                       help="block classes to scan with --map (default: all but zero)")
+    carve.add_argument("--no-validate", action="store_true",
+                       help="carve every raw header match instead of only hits that pass hit_validators")
+    carve.add_argument("--progress", action="store_true",
+                       help="show offset, MB/s, ETA and hits on stderr while scanning")
+
+    extract = commands.add_parser("extract", parents=[common], help="carve chosen hits from an --index-only run")
+    extract.add_argument("index", help="journal written by carve --index-only")
+    extract.add_argument("--ids", nargs="+", type=int, help="journal ids of the hits to extract")
+
+    block_map = commands.add_parser("map", help="write a per-block entropy and content class map of a source")
+    block_map.add_argument("source", help="block device or raw image to map")
+    block_map.add_argument("map", help="map file to write")
+    block_map.add_argument("--block-size", type=int, default=DEFAULT_MAP_BLOCK_SIZE, help="bytes per map entry")
+    block_map.add_argument("--io-mode", choices=IO_MODES, default="buffered")
+    return parser
+
+
+def run_map(args):
+    """The map command: classify every block of the source and print bytes per class."""
+    try:
+        totals = build_block_map(args.source, args.map, args.block_size, io_mode=args.io_mode)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    for name, size in totals.items():
+        print(f"{name}\t{size}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "map":
+        return run_map(args)
+
+    if args.types is None or args.types == ["all"]:
+        file_types = list(file_signatures) if args.command == "carve" else None
+    else:
+        unknown = [file_type for file_type in args.types if file_type not in file_signatures]
+        if unknown:
+            parser.error(f"unknown file types: {', '.join(unknown)}")
+        file_types = args.types
+    try:
+        max_sizes = parse_max_sizes(args.max_size)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.command == "carve" and args.cluster_size not in (None, "auto") and not args.cluster_size.isdigit():
+        parser.error("--cluster-size expects a size in bytes or 'auto'")
+    if args.command == "carve" and args.index_only and not args.session:
+        parser.error("--index-only needs --session to record candidates in")
+
+    os.makedirs(args.output, exist_ok=True)
+    log_callback = None if args.quiet else print
+    options = dict(
+        block_size=args.block_size_mb * MB, log_callback=log_callback, max_sizes=max_sizes,
+        discard_oversize=args.discard_oversize, dedupe=args.dedupe, io_mode=args.io_mode,
+    )
+
+    try:
+        if args.known_hashes:
+            options["known_files"] = KnownFiles.load(args.known_hashes)
+            if log_callback:
+                log_callback(f"==== Loaded {len(options['known_files']):,} known file hash(es) ====")
+        if args.command == "carve":
+            with open(args.source, "rb"):
+                pass  # fail early with a readable error if the source cannot be opened
+            if args.map:
+                with BlockMap(args.map) as block_map:
+                    options["scan_extents"] = block_map.regions(args.map_classes)
+            counts = carve_device(
+                args.source, file_types, file_signatures, args.output, workers=args.workers,
+                session_path=args.session, index_only=args.index_only,
+                progress_callback=print_progress if args.progress else None,
+                validators={} if args.no_validate else None, cluster_size=args.cluster_size,
+                cluster_offset=args.cluster_offset, bifragment=args.bifragment,
+                writer_threads=args.writer_threads, unallocated_only=args.unallocated_only, **options
+            )
+        else:
+            counts = extract_hits(args.index, file_signatures, args.output, file_types, args.ids, **options)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        if args.command == "carve" and args.session:
+            print(f"Interrupted; run again with --session {args.session} to resume.", file=sys.stderr)
+        else:
+            print("Interrupted.", file=sys.stderr)
+        return 130
+
+    for file_type, count in counts.items():
+        print(f"{file_type}\t{count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
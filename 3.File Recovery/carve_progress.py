@@ -0,0 +1,91 @@
+import time
+from collections import namedtuple
+
+# Seconds between two progress snapshots delivered to the caller
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+ProgressSnapshot = namedtuple(
+    "ProgressSnapshot", ["offset", "total", "bytes_scanned", "rate", "eta", "hits", "elapsed", "done"]
+)
+ProgressSnapshot.__doc__ = """State of a carving run.
+
+offset is the current position on the source and total its size in bytes;
+bytes_scanned counts only what this run read (a resumed run starts past 0).
+rate is in bytes per second, eta in seconds (None until a rate is known),
+hits maps each file type to the headers found so far.
+"""
+
+
+class ProgressTracker:
+    """Collects scan position and hit counts, and hands them out at a fixed rate.
+
+    update() and hit() only store numbers; callback(snapshot) runs at most
+    once per interval, so a dense run of hits never turns into a dense run of
+    UI or log updates. Log lines passed to log() are buffered the same way and
+    delivered as one list to log_batch_callback.
+    """
+
+    def __init__(self, total, start=0, callback=None, log_batch_callback=None,
+                 interval=DEFAULT_PROGRESS_INTERVAL, clock=time.monotonic):
+        self.total = total
+        self.start = start
+        self.offset = start
+        self.callback = callback
+        self.log_batch_callback = log_batch_callback
+        self.interval = interval
+        self.clock = clock
+        self.hits = {}
+        self.pending_log = []
+        self.started = clock()
+        self.next_flush = self.started + interval
+
+    def begin(self, start, total):
+        """Restart the clock for a scan of total bytes that begins at start."""
+        self.start = self.offset = start
+        self.total = total
+        self.started = self.clock()
+        self.next_flush = self.started + self.interval
+
+    def update(self, offset):
+        """The scan has consumed everything before offset."""
+        self.offset = max(self.offset, offset)
+        self._maybe_flush()
+
+    def hit(self, file_type, location):
+        self.hits[file_type] = self.hits.get(file_type, 0) + 1
+        self.offset = max(self.offset, location)
+        self._maybe_flush()
+
+    def log(self, message):
+        self.pending_log.append(message)
+        self._maybe_flush()
+
+    def snapshot(self, done=False):
+        elapsed = self.clock() - self.started
+        scanned = self.offset - self.start
+        rate = scanned / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.offset) / rate if rate > 0 and not done else (0.0 if done else None)
+        return ProgressSnapshot(self.offset, self.total, scanned, rate, eta, dict(self.hits), elapsed, done)
+
+    def _maybe_flush(self):
+        if self.clock() >= self.next_flush:
+            self.flush()
+
+    def flush(self, done=False):
+        """Deliver pending log lines and a snapshot now, whatever the interval."""
+        self.next_flush = self.clock() + self.interval
+        if self.pending_log:
+            lines, self.pending_log = self.pending_log, []
+            if self.log_batch_callback:
+                self.log_batch_callback(lines)
+        if self.callback:
+            self.callback(self.snapshot(done))
+
+
+def format_progress(snapshot):
+    """One status line for a ProgressSnapshot, e.g. for a label or a terminal."""
+    percent = snapshot.offset / snapshot.total if snapshot.total else 1.0
+    eta = "--:--" if snapshot.eta is None else time.strftime("%H:%M:%S", time.gmtime(snapshot.eta))
+    found = sum(snapshot.hits.values())
+    return (f"{percent:6.1%} at {hex(snapshot.offset)}  {snapshot.rate / (1024 * 1024):7.1f} MB/s  "
+            f"ETA {eta}  {found} hit(s)")
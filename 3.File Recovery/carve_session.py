@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+
+class SessionMismatch(ValueError):
+    """The journal belongs to a different drive, set of file types or mode."""
+
+
+def session_file_name(drive, file_types, mode="carve"):
+    """Journal file name for one drive, set of file types and mode, so different runs sharing a folder never collide."""
+    key = json.dumps([drive, sorted(file_types), mode])
+    return f"recovery_session_{hashlib.sha1(key.encode()).hexdigest()[:12]}.sqlite"
+
+
+class CarveSession:
+    """SQLite journal of a carving run, so a stopped or crashed run can resume.
+
+    Every hit is recorded with its type, byte range and output path, together
+    with a watermark: the offset below which every hit has been handled. Hits
+    and the watermark are committed in the same transaction by advance(), so
+    after a crash the journal never holds a hit from beyond the watermark and
+    resuming rescans at most the last uncommitted window.
+
+    In "index" mode hits are only candidates: end and path stay NULL until
+    the hit is extracted later (see carver.extract_hits).
+    With restart, whatever the journal held before is dropped and a new run begins.
+    """
+
+    def __init__(self, path, drive, file_types, mode="carve", restart=False):
+        self.path = path
+        self._connect()
+
+        file_types = sorted(file_types)
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if meta and restart:
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("DELETE FROM hits")
+            meta = {}
+        if not meta:
+            self.conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("drive", drive),
+                ("file_types", json.dumps(file_types)),
+                ("mode", mode),
+                ("watermark", "0"),
+                ("complete", "0"),
+            ])
+            self.conn.commit()
+        elif (meta["drive"] != drive or json.loads(meta["file_types"]) != file_types
+              or meta.get("mode", "carve") != mode):
+            self.conn.close()
+            raise SessionMismatch(
+                f"{path} journals a {meta.get('mode', 'carve')} run of {meta['drive']} for "
+                f"{json.loads(meta['file_types'])}, not a {mode} run of {drive} for {file_types}"
+            )
+
+    @classmethod
+    def open_existing(cls, path):
+        """Open a journal written earlier without checking what it was created for."""
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No carving journal at {path}")
+        session = cls.__new__(cls)
+        session.path = path
+        session._connect()
+        return session
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hits ("
+            "id INTEGER PRIMARY KEY, file_type TEXT, start INTEGER, end INTEGER, path TEXT)"
+        )
+
+    def _meta(self, key):
+        return self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    @property
+    def drive(self):
+        return self._meta("drive")
+
+    @property
+    def watermark(self):
+        return int(self._meta("watermark"))
+
+    @property
+    def complete(self):
+        return self._meta("complete") == "1"
+
+    def recovered_counts(self):
+        """Number of files already carved per type, used to continue the output numbering."""
+        return dict(self.conn.execute(
+            "SELECT file_type, COUNT(*) FROM hits WHERE path IS NOT NULL GROUP BY file_type"
+        ))
+
+    def busy_until(self):
+        """End of the last carve per type, so hits inside an already-carved file stay skipped."""
+        return dict(self.conn.execute(
+            "SELECT file_type, MAX(end) FROM hits WHERE end IS NOT NULL GROUP BY file_type"
+        ))
+
+    def hits(self, file_types=None, hit_ids=None):
+        """Journaled hits as (id, file_type, start, end, path) in offset order, optionally filtered."""
+        rows = self.conn.execute("SELECT id, file_type, start, end, path FROM hits ORDER BY start, id")
+        return [
+            row for row in rows
+            if (file_types is None or row[1] in file_types) and (hit_ids is None or row[0] in hit_ids)
+        ]
+
+    def record_hit(self, file_type, start, end, path):
+        """Journal a hit; path is None for a discarded carve or an index-only candidate."""
+        self.conn.execute(
+            "INSERT INTO hits (file_type, start, end, path) VALUES (?, ?, ?, ?)",
+            (file_type, start, end, path)
+        )
+
+    def update_hit(self, hit_id, end, path):
+        """Store where an indexed candidate ended up once it has been extracted."""
+        self.conn.execute("UPDATE hits SET end = ?, path = ? WHERE id = ?", (end, path, hit_id))
+        self.conn.commit()
+
+    def advance(self, offset):
+        """Commit the hits recorded so far together with a new watermark."""
+        self.conn.execute("UPDATE meta SET value = ? WHERE key = 'watermark'", (str(offset),))
+        self.conn.commit()
+
+    def finish(self, offset):
+        self.conn.execute("UPDATE meta SET value = '1' WHERE key = 'complete'")
+        self.advance(offset)
+
+    def close(self):
+        # Anything not committed by advance() lies beyond the watermark and will be redone
+        self.conn.rollback()
+        self.conn.close()
@@ -0,0 +1,1086 @@
+import bisect
+import hashlib
+import heapq
+import mmap
+import os
+import re
+import struct
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+from allocation_map import unallocated_extents
+from async_writer import DEFAULT_WRITER_THREADS, WriterPool
+from bifragment import BIFRAGMENT_RESOLVERS
+from carve_progress import DEFAULT_PROGRESS_INTERVAL, ProgressTracker
+from carve_session import CarveSession, SessionMismatch
+from content_store import ContentStore
+from fs_geometry import ClusterGeometry, detect_geometry
+from hit_validators import validate_hit
+from length_resolvers import LENGTH_RESOLVERS
+from signatures import SIGNATURE_TABLE, SignatureTable, file_signatures, signature_footer
+from uncached_io import open_source, source_length
+
+# Bytes read from the source per scan step
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+# Largest byte range handed to one worker process in parallel mode
+DEFAULT_RANGE_SIZE = 256 * 1024 * 1024
+# Ranges queued in or held from the worker processes at once, per worker
+RANGES_IN_FLIGHT = 2
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# Largest file carved for one hit; a carve that reaches its cap is truncated or discarded.
+# Types with neither a footer nor a length resolver are written up to the next hit, or
+# whole to the cap when none follows, so theirs sit near a typical file, not the largest.
+DEFAULT_MAX_CARVE_SIZE = 64 * MB
+MAX_CARVE_SIZES = {
+    "jpg": 32 * MB, "png": 64 * MB, "gif": 32 * MB, "bmp": 32 * MB, "tiff": 512 * MB,
+    "psd": 64 * MB, "webp": 32 * MB,
+    "pdf": 512 * MB, "doc": 32 * MB, "docx": 256 * MB, "xls": 32 * MB, "xlsx": 256 * MB,
+    "epub": 256 * MB,
+    "zip": 4 * GB, "rar": 4 * GB, "7z": 64 * MB, "tar": 64 * MB, "gz": 64 * MB, "tar.gz": 64 * MB,
+    "jar": 256 * MB,
+    "mp3": 64 * MB, "wav": 1 * GB, "avi": 4 * GB, "mov": 64 * MB, "mp4": 64 * MB, "flv": 32 * MB,
+    "iso": 64 * MB,
+    "exe": 256 * MB, "dll": 256 * MB, "class": 1 * MB,
+    "json": 16 * MB, "xml": 16 * MB, "html": 16 * MB, "css": 16 * MB, "js": 16 * MB,
+    "py": 16 * MB, "txt": 16 * MB,
+    "sqlite": 2 * GB,
+}
+
+
+# Largest carve of known length hashed in memory against a known_files set before it is written
+KNOWN_BUFFER_SIZE = 1 * MB
+
+# Where the header lies inside the file, for types whose magic is not at byte 0
+HEADER_OFFSETS = {"tar": 257, "iso": 0x8001}
+
+# Header bytes the scan regex keys on, and the byte values it avoids keying on
+KEY_LENGTH = 3
+FILLER_BYTES = {0x00, 0x20, 0xFF}
+# Up to this many distinct headers, one bytes.find pass each beats the keyed regex
+FIND_MAX_HEADERS = 4
+
+
+def max_carve_size(file_type, overrides=None):
+    """Cap for one carve of file_type: a user override, else the per-type default."""
+    if overrides and file_type in overrides:
+        return overrides[file_type]
+    return MAX_CARVE_SIZES.get(file_type, DEFAULT_MAX_CARVE_SIZE)
+
+
+def _key_offset(header):
+    """Offset of the KEY_LENGTH bytes of header least likely to occur in filler (zeros, 0xFF, spaces)."""
+    best = None
+    for offset in range(len(header) - KEY_LENGTH + 1):
+        key = header[offset:offset + KEY_LENGTH]
+        score = 4 * sum(value not in FILLER_BYTES for value in key) + len(set(key))
+        if best is None or score > best[0]:
+            best = (score, offset)
+    return best[1]
+
+
+def _charset(values):
+    return b'[' + b''.join(re.escape(bytes([value])) for value in sorted(values)) + b']'
+
+
+class SignatureMatcher:
+    """Find the headers of every selected file type, in offset order.
+
+    Every header is keyed on KEY_LENGTH of its bytes (shorter headers on
+    all of theirs), and one regex of per-position byte classes finds the
+    offsets where some key may start, so the buffer is scanned once however
+    many headers are selected; the cost then grows only with the number of
+    candidates. Each candidate is resolved through the key dispatch table,
+    and types that share a header (e.g. zip/docx/jar) through the header
+    dispatch table. Up to FIND_MAX_HEADERS distinct headers, one bytes.find
+    pass per header is faster and is used instead.
+
+    With a fs_geometry.ClusterGeometry, files are assumed to start on a
+    cluster boundary: instead of searching, only the bytes at
+    data_offset + k * cluster_size (+ the type's HEADER_OFFSETS entry) are
+    compared, which skips all but one position per cluster.
+    Use compile_matcher to reuse matchers over the shared file_signatures.
+    """
+
+    def __init__(self, signatures, file_types, geometry=None):
+        table = SIGNATURE_TABLE if signatures is file_signatures else SignatureTable(signatures)
+        self.footers = {}
+        self.headers = {}
+        self.dispatch = {}
+        self.skipped = []
+        for file_type in file_types:
+            header = table.header(file_type)
+            if not header:
+                # Nothing to anchor a carve on (e.g. plain text)
+                self.skipped.append(file_type)
+                continue
+            self.headers[file_type] = header
+            self.footers[file_type] = table.footer(file_type)
+            self.dispatch.setdefault(header, []).append(file_type)
+
+        self.max_header_len = max((len(header) for header in self.dispatch), default=0)
+
+        # first key byte -> [(key, offset of the key in the header, header)]
+        self.keys = {}
+        self.pattern = None
+        if len(self.dispatch) > FIND_MAX_HEADERS:
+            classes = {}
+            for header in sorted(self.dispatch):
+                offset = _key_offset(header) if len(header) > KEY_LENGTH else 0
+                key = header[offset:offset + KEY_LENGTH]
+                self.keys.setdefault(key[0], []).append((key, offset, header))
+                positions = classes.setdefault(len(key), [set() for _ in key])
+                for position, value in enumerate(key):
+                    positions[position].add(value)
+            # One byte per match, so finditer reports overlapping candidates: any first key byte, then
+            # (checked by a lookbehind on that byte and a lookahead) the rest of a key of some length
+            branches = [b'(?<=' + _charset(positions[0]) + b')(?=' + b''.join(map(_charset, positions[1:])) + b')'
+                        for _, positions in sorted(classes.items(), reverse=True)]
+            first = set().union(*(positions[0] for positions in classes.values()))
+            self.pattern = re.compile(_charset(first) + b'(?:' + b'|'.join(branches) + b')')
+
+        # phase within a cluster -> first header byte -> [(header, types)]
+        self.geometry = geometry
+        self.aligned = {}
+        if geometry:
+            for header, types in self.dispatch.items():
+                for file_type in types:
+                    phase = (geometry.data_offset + HEADER_OFFSETS.get(file_type, 0)) % geometry.cluster_size
+                    candidates = self.aligned.setdefault(phase, {}).setdefault(header[0], [])
+                    for known_header, known_types in candidates:
+                        if known_header == header:
+                            known_types.append(file_type)
+                            break
+                    else:
+                        candidates.append((header, [file_type]))
+
+    def _find_keyed(self, buf, start, limit):
+        end = min(len(buf), limit + self.max_header_len - 1)
+        hits = []
+        keys = self.keys
+        for match in self.pattern.finditer(buf, start, end):
+            pos = match.start()
+            for key, offset, header in keys[buf[pos]]:
+                if buf[pos:pos + len(key)] != key:
+                    continue
+                header_pos = pos - offset
+                if start <= header_pos < limit and (
+                        key is header or buf[header_pos:header_pos + len(header)] == header):
+                    hits.append((header_pos, header))
+        # Keys sit at different depths in their headers, so candidates come slightly out of order
+        hits.sort()
+        return hits
+
+    @staticmethod
+    def _find_header(buf, header, start, limit):
+        end = min(len(buf), limit + len(header) - 1)
+        pos = buf.find(header, start, end)
+        while pos >= 0:
+            yield pos, header
+            pos = buf.find(header, pos + 1, end)
+
+    def _find_aligned(self, buf, start, limit, base):
+        cluster = self.geometry.cluster_size
+        hits = []
+        for phase, by_first_byte in self.aligned.items():
+            first = start + (phase - base - start) % cluster
+            for pos in range(first, min(limit, len(buf)), cluster):
+                candidates = by_first_byte.get(buf[pos])
+                if not candidates:
+                    continue
+                for header, types in candidates:
+                    if buf[pos:pos + len(header)] == header:
+                        hits.extend((pos, file_type) for file_type in types)
+        if len(self.aligned) > 1:
+            hits.sort()
+        return hits
+
+    def find_all(self, buf, start=0, limit=None, base=0):
+        """Yield (offset, file_type) for every header starting in buf[start:limit], in offset order.
+
+        buf can be anything with a bytes-like find(), including an mmap.
+        base is the absolute offset of buf[0], needed to place cluster boundaries.
+        """
+        if limit is None:
+            limit = len(buf)
+        if self.geometry:
+            yield from self._find_aligned(buf, start, limit, base)
+            return
+        if self.pattern is not None:
+            hits = self._find_keyed(buf, start, limit)
+        else:
+            hits = heapq.merge(*(self._find_header(buf, header, start, limit) for header in self.dispatch))
+        for pos, header in hits:
+            for file_type in self.dispatch[header]:
+                yield pos, file_type
+
+
+@lru_cache(maxsize=64)
+def _shared_matcher(file_types, geometry):
+    return SignatureMatcher(file_signatures, file_types, geometry)
+
+
+def compile_matcher(signatures, file_types, geometry=None):
+    """SignatureMatcher for file_types; matchers over file_signatures are built once per process and reused.
+
+    Matchers are read-only once built, so scans in several threads can share one.
+    """
+    file_types = tuple(file_types)
+    if all(signatures[file_type] == file_signatures.get(file_type) for file_type in file_types):
+        return _shared_matcher(file_types, geometry)
+    return SignatureMatcher(signatures, file_types, geometry)
+
+
+def iter_windows(fileD, window_size=DEFAULT_BLOCK_SIZE, overlap=0, stop_event=None, length=None):
+    """Yield (base, window, limit) tuples covering fileD from its current position.
+
+    Each window starts with the last overlap bytes of the previous one, so a
+    pattern up to overlap + 1 bytes long is found at any offset. Matches that
+    start at or after limit are left for the next window to report.
+    With length, no more than length bytes are read.
+    """
+    base = 0
+    window = b''
+    remaining = length
+    while not (stop_event and stop_event.is_set()):
+        if remaining is None:
+            block = fileD.read(window_size)
+        else:
+            block = fileD.read(min(window_size, remaining)) if remaining else b''
+            remaining -= len(block)
+        window = window[-overlap:] + block if overlap and window else block
+        # Leave the last overlap bytes for the next window unless this is EOF
+        limit = len(window) if not block else max(len(window) - overlap, 0)
+        yield base, window, limit
+        if not block:
+            return
+        base += limit
+
+
+def scan_device(drive, matcher, window_size=DEFAULT_BLOCK_SIZE, stop_event=None, start=0, end=None, progress=None,
+                io_mode="buffered", extents=None):
+    """Yield (location, file_type) for every header hit on drive, in offset order.
+
+    Only hits starting in [start, end) are reported, but reads run past end
+    far enough to complete a header that straddles it. After each window,
+    progress(offset) is called once every hit before offset has been consumed.
+    io_mode selects how the device is read (see uncached_io).
+    extents, sorted (start, end) byte ranges, replace [start, end) to scan
+    only those ranges (see allocation_map); the device is opened once for all.
+    """
+    overlap = max(matcher.max_header_len - 1, 0)
+    with open_source(drive, io_mode) as fileD:
+        for range_start, range_end in [(start, end)] if extents is None else extents:
+            fileD.seek(range_start)
+            length = None if range_end is None else range_end - range_start + overlap
+            for base, window, limit in iter_windows(fileD, window_size, overlap, stop_event, length):
+                scanned = range_start + base + limit
+                for pos, file_type in matcher.find_all(window, limit=limit, base=range_start + base):
+                    location = range_start + base + pos
+                    if range_end is not None and location >= range_end:
+                        break
+                    yield location, file_type
+                if range_end is not None and scanned >= range_end:
+                    if progress:
+                        progress(range_end)
+                    break
+                if progress:
+                    progress(scanned)
+            if stop_event and stop_event.is_set():
+                return
+
+
+def map_image(fileD):
+    """Memory-map fileD read-only if it is a regular, non-empty image file, else return None.
+
+    Block devices and anything that cannot be mapped fall back to the streaming reader.
+    """
+    try:
+        if not os.path.isfile(fileD.name) or os.path.getsize(fileD.name) == 0:
+            return None
+        return mmap.mmap(fileD.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, OverflowError):
+        return None
+
+
+def scan_mapped(mapped, matcher, window_size=DEFAULT_BLOCK_SIZE, stop_event=None, start=0, progress=None,
+                extents=None):
+    """Yield (location, file_type) for every header hit in a mapped image, in offset order.
+
+    Searches run directly against the mapping, so no window is ever copied
+    and no overlap is needed; window_size only sets how often stop_event is
+    checked and progress(offset) is reported, as in scan_device. With
+    extents only those (start, end) byte ranges are searched.
+    """
+    size = len(mapped)
+    for range_start, range_end in [(start, size)] if extents is None else extents:
+        range_end = min(range_end, size)
+        for window_start in range(range_start, range_end, window_size):
+            if stop_event and stop_event.is_set():
+                return
+            window_end = min(window_start + window_size, range_end)
+            yield from matcher.find_all(mapped, window_start, window_end)
+            if progress:
+                progress(window_end)
+
+
+def read_at(fileD, offset, size):
+    """Read size bytes at an absolute offset of fileD."""
+    fileD.seek(offset)
+    return fileD.read(size)
+
+
+def _bounded_read(read, limit, offset, size):
+    """read() that sees nothing at or past limit, so resolvers cannot walk beyond a carve cap."""
+    return read(offset, max(min(size, limit - offset), 0))
+
+
+def resolve_end(read, file_type, start, source_end):
+    """Absolute end offset of the file at start from its own structure, or None if unknown."""
+    resolver = LENGTH_RESOLVERS.get(file_type)
+    if resolver is None:
+        return None
+    try:
+        length = resolver(read, start)
+    except struct.error:
+        return None
+    if not length:
+        return None
+    return min(start + length, source_end)
+
+
+def source_size(drive):
+    """Size in bytes of an image file, block device or Windows raw volume."""
+    with open_source(drive) as fileD:
+        return source_length(fileD)
+
+
+def cluster_geometry(drive, cluster_size="auto", cluster_offset=0):
+    """ClusterGeometry for aligned carving: cluster_size in bytes, or "auto" to read it from the boot sector.
+
+    Returns None when "auto" finds no filesystem it recognises.
+    """
+    if cluster_size != "auto":
+        return ClusterGeometry(int(cluster_size), cluster_offset, "supplied")
+    with open_source(drive) as fileD:
+        return detect_geometry(partial(read_at, fileD))
+
+
+def unallocated_space(drive):
+    """allocation_map.AllocationMap of the free space on drive, or None if it holds no ext or FAT filesystem."""
+    with open_source(drive) as fileD:
+        return unallocated_extents(partial(read_at, fileD), source_length(fileD))
+
+
+def intersect_extents(extents, others):
+    """Byte ranges covered by both sorted, non-overlapping (start, end) lists."""
+    result = []
+    index = 0
+    for start, end in extents:
+        while index < len(others) and others[index][1] <= start:
+            index += 1
+        scan = index
+        while scan < len(others) and others[scan][0] < end:
+            overlap = (max(start, others[scan][0]), min(end, others[scan][1]))
+            if overlap[0] < overlap[1]:
+                result.append(overlap)
+            scan += 1
+    return result
+
+
+def _scan_range(drive, signatures, start, end, window_size, io_mode="buffered", geometry=None, validate=False,
+                validators=None):
+    """Worker process body: return every header hit that starts in [start, end).
+
+    With validate each hit is returned as (location, file_type, valid), valid
+    being validate_hit's verdict, so the checks run in the worker as well.
+    """
+    matcher = compile_matcher(signatures, signatures, geometry)
+    with open_source(drive, io_mode) as fileD:
+        mapped = map_image(fileD) if io_mode == "buffered" else None
+        try:
+            if mapped is None:
+                hits = list(scan_device(drive, matcher, window_size, start=start, end=end, io_mode=io_mode))
+                read = partial(read_at, fileD)
+            else:
+                hits = list(matcher.find_all(mapped, start, min(end, len(mapped))))
+                read = lambda offset, size: mapped[offset:offset + size]
+            if not validate:
+                return hits
+            return [(location, file_type, validate_hit(read, file_type, location, validators))
+                    for location, file_type in hits]
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+
+def scan_parallel(drive, signatures, file_types, workers, window_size=DEFAULT_BLOCK_SIZE,
+                  stop_event=None, range_size=DEFAULT_RANGE_SIZE, start=0, progress=None, io_mode="buffered",
+                  geometry=None, extents=None, validate=False, validators=None):
+    """Yield (location, file_type) hits in offset order, scanning byte ranges in worker processes.
+
+    Each range owns the hits that start inside it and reads across its end
+    edge only to finish a straddling header, so a hit in the overlap is
+    reported by exactly one range. Ranges complete in order and are streamed
+    back as soon as they are ready; progress(offset) follows each range.
+    At most RANGES_IN_FLIGHT ranges per worker are queued or held at once,
+    so memory stays bounded however large the drive is.
+    With a geometry only cluster-aligned headers are reported (see SignatureMatcher).
+    With extents only those (start, end) byte ranges are split up and scanned.
+    With validate hits are checked against validators in the workers and
+    yielded as (location, file_type, valid); validators must be picklable.
+    """
+    selected = {file_type: signatures[file_type] for file_type in file_types}
+    size = source_size(drive)
+    if extents is None:
+        extents = [(start, size)]
+    total = sum(min(end, size) - extent_start for extent_start, end in extents)
+    range_size = max(min(range_size, -(-total // workers)), window_size)
+    ranges = (
+        (range_start, min(range_start + range_size, end, size))
+        for extent_start, end in extents
+        for range_start in range(extent_start, min(end, size), range_size)
+    )
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for range_start, range_end in ranges:
+            pending.append((range_end, executor.submit(
+                _scan_range, drive, selected, range_start, range_end, window_size, io_mode, geometry, validate,
+                validators)))
+            if len(pending) < workers * RANGES_IN_FLIGHT:
+                continue
+            if not (yield from _collect_range(pending.popleft(), stop_event, progress)):
+                return
+        while pending:
+            if not (yield from _collect_range(pending.popleft(), stop_event, progress)):
+                return
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _collect_range(submitted, stop_event, progress):
+    """Yield the hits of one submitted range; False if stop_event was set before it was collected."""
+    range_end, future = submitted
+    if stop_event and stop_event.is_set():
+        return False
+    yield from future.result()
+    if progress:
+        progress(range_end)
+    return True
+
+
+class HashingWriter:
+    """Write-through wrapper that feeds every chunk written to a hashlib object."""
+
+    def __init__(self, fileN, hasher):
+        self.fileN = fileN
+        self.hasher = hasher
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.fileN.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.fileN.close()
+
+
+class NullOutput:
+    """Output that drops everything: a carve into it only measures (and with a hasher, hashes) the file."""
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_output(file_name, hasher=None, writer=None):
+    """Open a carve's output file, hashing it while it is written when hasher is given.
+
+    With a WriterPool the file is written by its threads (see async_writer).
+    A file_name of None writes nowhere (see NullOutput).
+    """
+    if file_name is None:
+        fileN = NullOutput()
+    elif writer is None:
+        fileN = open(file_name, "wb")
+    else:
+        fileN = writer.open(file_name)
+    return fileN if hasher is None else HashingWriter(fileN, hasher)
+
+
+def carve_file(src, start, header, footer, file_name, block_size=DEFAULT_BLOCK_SIZE, stop_event=None, end=None,
+               limit=None, hasher=None, writer=None):
+    """Copy src from start up to and including the first footer after the header.
+
+    When end is already known (see length_resolvers) exactly [start, end) is
+    copied and no footer is searched for; without a footer (None) the copy
+    runs to limit. Nothing at or past limit is read.
+    Returns the offset just past the last byte written.
+    """
+    if end is not None:
+        limit = end if limit is None else min(end, limit)
+    src.seek(start)
+    offset = start
+    pending = b''
+    search_from = len(header)
+
+    def read_block():
+        if limit is None:
+            return src.read(block_size)
+        return src.read(max(min(block_size, limit - offset - len(pending)), 0))
+
+    with open_output(file_name, hasher, writer) as fileN:
+        if end is not None or footer is None:
+            while not (stop_event and stop_event.is_set()):
+                block = read_block()
+                if not block:
+                    break
+                fileN.write(block)
+                offset += len(block)
+            return offset
+
+        while not (stop_event and stop_event.is_set()):
+            block = read_block()
+            if not block:
+                break
+            pending += block
+
+            found = pending.find(footer, search_from)
+            if found >= 0:
+                end = found + len(footer)
+                fileN.write(pending[:end])
+                return offset + end
+
+            # Hold back enough bytes to catch a footer split across reads
+            flush = max(len(pending) - len(footer) + 1, 0)
+            fileN.write(pending[:flush])
+            pending = pending[flush:]
+            offset += flush
+            search_from = max(search_from - flush, 0)
+
+        fileN.write(pending)
+        return offset + len(pending)
+
+
+def carve_mapped(mapped, start, header, footer, file_name, block_size=DEFAULT_BLOCK_SIZE, stop_event=None, end=None,
+                 limit=None, hasher=None, writer=None):
+    """carve_file for a mapped image: find the footer in place and write memoryview slices.
+
+    Returns the offset just past the last byte written.
+    """
+    limit = len(mapped) if limit is None else min(limit, len(mapped))
+    if end is None:
+        found = -1 if footer is None else mapped.find(footer, start + len(header), limit)
+        end = limit if found < 0 else found + len(footer)
+    end = min(end, limit)
+
+    with memoryview(mapped) as view, open_output(file_name, hasher, writer) as fileN:
+        for offset in range(start, end, block_size):
+            if stop_event and stop_event.is_set():
+                return offset
+            fileN.write(view[offset:min(offset + block_size, end)])
+    return end
+
+
+def carve_fragments(source, start, fragments, file_name, block_size=DEFAULT_BLOCK_SIZE, stop_event=None,
+                    hasher=None):
+    """Write both pieces of a bifragmented file (see bifragment) into file_name.
+
+    Returns the offset just past the last byte of the second piece.
+    """
+    resume = fragments.split + fragments.gap
+    pieces = ((start, fragments.split), (resume, resume + fragments.length - (fragments.split - start)))
+    with open_output(file_name, hasher, source.writer) as fileN:
+        for piece_start, piece_end in pieces:
+            for offset in range(piece_start, piece_end, block_size):
+                if stop_event and stop_event.is_set():
+                    return offset
+                fileN.write(source.read(offset, min(block_size, piece_end - offset)))
+    return pieces[-1][1]
+
+
+class CarveSource:
+    """The drive or image being carved, opened once for random-access extraction.
+
+    Regular image files are memory-mapped (see map_image) unless an uncached
+    io_mode is asked for; block devices are read through open_source.
+    With a WriterPool, carves are written by its threads while the next hit
+    is read; the pool is drained on close, before the mapping goes away.
+    """
+
+    def __init__(self, drive, io_mode="buffered", writer=None):
+        self.drive = drive
+        self.writer = writer
+        self.fileD = open_source(drive, io_mode)
+        self.mapped = map_image(self.fileD) if io_mode == "buffered" else None
+        if self.mapped is not None:
+            self.size = len(self.mapped)
+        else:
+            self.size = source_length(self.fileD)
+
+    def read(self, offset, size):
+        if self.mapped is not None:
+            return self.mapped[offset:offset + size]
+        return read_at(self.fileD, offset, size)
+
+    def carve(self, start, header, footer, file_name, block_size=DEFAULT_BLOCK_SIZE, stop_event=None, end=None,
+              limit=None, hasher=None):
+        if self.mapped is not None:
+            return carve_mapped(self.mapped, start, header, footer, file_name, block_size, stop_event, end, limit,
+                                hasher, self.writer)
+        return carve_file(self.fileD, start, header, footer, file_name, block_size, stop_event, end, limit, hasher,
+                          self.writer)
+
+    def wait_for(self, file_name):
+        """Block until file_name has been completely written."""
+        if self.writer is not None:
+            self.writer.wait_for(file_name)
+
+    def close(self):
+        try:
+            if self.writer is not None:
+                # Queued extents may still be views into the mapping
+                self.writer.close()
+        finally:
+            if self.mapped is not None:
+                self.mapped.close()
+            self.fileD.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# known names the hash algorithm that matched a KnownFiles set when the carve was dropped for it
+CarveResult = namedtuple("CarveResult", ["end", "path", "sha256", "duplicate", "known"], defaults=[None])
+
+
+def carve_hit(source, file_type, location, header, footer, file_name, block_size=DEFAULT_BLOCK_SIZE,
+              stop_event=None, max_sizes=None, discard_oversize=False, log_callback=None, store=None,
+              geometry=None, known=None, next_hit=None):
+    """Extract the file of file_type starting at location into file_name.
+
+    The length comes from the file's structure when a resolver knows it,
+    else from the first footer, and never exceeds the type's carve cap.
+    A type without a footer (None) is carved up to next_hit, the offset where
+    the next file starts, when given, else up to its cap.
+    With a cluster geometry, JPEG and ZIP files that do not validate in
+    place are first tried as two fragments around a gap (see bifragment).
+    With a ContentStore the carve is SHA-256 hashed as it is written and
+    kept once under its hash; identical carves only add a manifest row.
+    With a known_files.KnownFiles set a known file is skipped unwritten:
+    from a mapped image the carve is hashed in a first pass and written in a
+    second only if unknown. A device is read once instead: a carve of known
+    length up to KNOWN_BUFFER_SIZE is hashed in memory before it is written,
+    a longer one is hashed as it is written to a .part file, which is
+    deleted if the file is known.
+    A carve cut short by stop_event is never matched or stored: a .part
+    file is deleted, a plain output is left truncated for the caller.
+    Returns a CarveResult whose path is None when no output was kept.
+    """
+    cap = max_carve_size(file_type, max_sizes)
+    limit = min(location + cap, source.size)
+    end = resolve_end(partial(_bounded_read, source.read, limit), file_type, location, source.size)
+    if end is not None and end > limit:
+        end = None  # structure claims more than the cap allows
+
+    fragments = None
+    if geometry and file_type in BIFRAGMENT_RESOLVERS:
+        try:
+            fragments = BIFRAGMENT_RESOLVERS[file_type](
+                partial(_bounded_read, source.read, limit), location, limit, geometry
+            )
+        except struct.error:
+            fragments = None
+    if end is None and footer is None and next_hit is not None:
+        limit = min(limit, next_hit)
+
+    if known:
+        hasher = known.hasher(["sha256"] if store else [])
+    else:
+        hasher = hashlib.sha256() if store else None
+    matched = None
+    # A mapping is cheap to read twice, so it is hashed before anything is written; a device
+    # is read once: into memory when short, else hashed while written aside to a .part file
+    prehashed = known and source.mapped is not None
+    buffered = known and not prehashed and not fragments and end is not None and end - location <= KNOWN_BUFFER_SIZE
+    if prehashed:
+        if fragments:
+            end = carve_fragments(source, location, fragments, None, block_size, stop_event, hasher)
+        else:
+            end = source.carve(location, header, footer, None, block_size, stop_event, end, limit, hasher)
+        if stop_event and stop_event.is_set():
+            return CarveResult(end, None, None, False)
+        matched = known.match(hasher)
+    elif buffered:
+        data = source.read(location, end - location)
+        hasher.update(data)
+        matched = known.match(hasher)
+
+    # Written aside until its hash decides whether, or under which name, it is kept
+    out_name = file_name + ".part" if store or known and not prehashed else file_name
+    if not matched:
+        if buffered:
+            with open_output(out_name, None, source.writer) as fileN:
+                fileN.write(data)
+        elif fragments:
+            end = carve_fragments(source, location, fragments, out_name, block_size, stop_event,
+                                  None if prehashed else hasher)
+            if log_callback:
+                log_callback(f'==== {file_type.upper()} at {hex(location)} reassembled around a '
+                             f'{fragments.gap:,}-byte gap at {hex(fragments.split)} ====')
+        else:
+            end = source.carve(location, header, footer, out_name, block_size, stop_event, end, limit,
+                               None if prehashed else hasher)
+        if stop_event and stop_event.is_set():
+            # Cut short: its hash is not the file's, so it is neither matched nor stored
+            if out_name == file_name:
+                return CarveResult(end, file_name, None, False)
+            source.wait_for(out_name)
+            if os.path.exists(out_name):
+                os.remove(out_name)
+            return CarveResult(end, None, None, False)
+    size = fragments.length if fragments else end - location
+    if known and not (prehashed or buffered):
+        matched = known.match(hasher)
+        if matched:
+            source.wait_for(out_name)
+            os.remove(out_name)
+    if matched:
+        if log_callback:
+            log_callback(f'==== {file_type.upper()} at {hex(location)} matches a known {matched} hash, skipped ====')
+        return CarveResult(end, None, None, False, matched)
+
+    if size >= cap:
+        if discard_oversize:
+            source.wait_for(out_name)
+            os.remove(out_name)
+            if log_callback:
+                log_callback(f'==== {file_type.upper()} at {hex(location)} exceeds the {cap:,}-byte cap, discarded ====')
+            return CarveResult(end, None, None, False)
+        if log_callback:
+            log_callback(f'==== {file_type.upper()} at {hex(location)} exceeds the {cap:,}-byte cap, truncated ====')
+
+    if not store:
+        if out_name != file_name:
+            source.wait_for(out_name)
+            os.replace(out_name, file_name)
+        return CarveResult(end, file_name, None, False)
+    digest = hasher.hexdigest("sha256") if known else hasher.hexdigest()
+    source.wait_for(out_name)
+    path, duplicate = store.store(out_name, digest, file_type)
+    store.record(location, file_type, size, digest, path, duplicate)
+    if duplicate and log_callback:
+        log_callback(f'==== {file_type.upper()} at {hex(location)} duplicates {os.path.basename(path)} ====')
+    return CarveResult(end, path, digest, duplicate)
+
+
+def carve_device(drive, file_types, signatures, save_path, block_size=DEFAULT_BLOCK_SIZE, stop_event=None,
+                 log_callback=None, workers=1, max_sizes=None, discard_oversize=False, session_path=None,
+                 index_only=False, dedupe=False, io_mode="buffered", progress_callback=None,
+                 log_batch_callback=None, progress_interval=DEFAULT_PROGRESS_INTERVAL, validators=None,
+                 cluster_size=None, cluster_offset=0, bifragment=False, writer_threads=DEFAULT_WRITER_THREADS,
+                 unallocated_only=False, known_files=None, scan_extents=None):
+    """Read drive once and carve every selected file type from the same pass.
+
+    With workers > 1 the header scan and the hit checks are split across that
+    many processes while this process extracts the hits in offset order.
+    No carve grows past max_carve_size(file_type, max_sizes); one that reaches its cap is kept
+    truncated, or deleted when discard_oversize is set. A type without a
+    footer is carved up to the next validated hit of any selected type (see
+    carve_hit). With session_path the
+    run is journaled (see carve_session) and a rerun resumes from where the
+    previous one stopped. A journal that is complete, or belongs to another
+    drive, set of types or mode, is started over.
+
+    With index_only nothing is written: every candidate header is recorded in
+    the journal at session_path, to be extracted selectively by extract_hits.
+    With dedupe, outputs go to a ContentStore so identical carves are stored once.
+    io_mode "direct" or "fadvise" keeps a raw device scan out of the page cache.
+    Every hit must first pass its type's check in validators (by default
+    hit_validators.HIT_VALIDATORS; pass {} to carve every raw header match),
+    so false positives of loose signatures are neither carved nor indexed.
+
+    cluster_size (bytes, or "auto" to read it from the boot sector) makes the
+    scan check headers only at cluster boundaries, counted from cluster_offset
+    when given in bytes. bifragment additionally reassembles JPEG and ZIP
+    files split in two around a gap of whole clusters.
+    Carves are written by writer_threads background threads (0 writes inline)
+    so a slow destination does not hold up reading the source.
+    unallocated_only limits the header scan to the space the ext or FAT
+    filesystem on drive marks free (see allocation_map), skipping live files;
+    carves still read on into allocated space. Other sources are scanned whole.
+    scan_extents, sorted (start, end) byte ranges such as the regions of a
+    block_map.BlockMap, likewise restrict where headers are looked for.
+    Carves whose hash is in known_files (a known_files.KnownFiles set, e.g.
+    the NSRL) are dropped before anything is written.
+
+    progress_callback(snapshot) receives a carve_progress.ProgressSnapshot at
+    most every progress_interval seconds, and once more when the run ends.
+    With log_batch_callback, log lines are buffered and delivered as lists at
+    the same rate instead of one log_callback call per line.
+    Returns a dict mapping each file type to the number of files recovered
+    (or candidates indexed).
+    """
+    if index_only and not session_path:
+        raise ValueError("index_only needs a session_path to record candidates in")
+
+    tracker = None
+    if progress_callback or log_batch_callback:
+        tracker = ProgressTracker(0, callback=progress_callback, log_batch_callback=log_batch_callback,
+                                  interval=progress_interval)
+        if log_batch_callback:
+            log_callback = tracker.log
+
+    geometry = None
+    if cluster_size or bifragment:
+        geometry = cluster_geometry(drive, cluster_size or "auto", cluster_offset)
+        if log_callback:
+            if geometry:
+                log_callback(f'==== Using {geometry.cluster_size:,}-byte clusters from {hex(geometry.data_offset)} '
+                             f'({geometry.filesystem}) ====')
+            else:
+                log_callback('==== No filesystem recognised: scanning every offset without fragment recovery ====')
+
+    allocation = None
+    if unallocated_only:
+        allocation = unallocated_space(drive)
+        if log_callback:
+            if allocation:
+                free = sum(end - start for start, end in allocation.extents)
+                log_callback(f'==== Scanning {free:,} unallocated bytes in {len(allocation.extents):,} extent(s) '
+                             f'({allocation.filesystem}) ====')
+            else:
+                log_callback('==== No ext or FAT allocation map found: scanning the whole source ====')
+
+    matcher = compile_matcher(signatures, file_types, geometry if cluster_size else None)
+    recovered = {file_type: 0 for file_type in file_types}
+    busy_until = {file_type: 0 for file_type in file_types}
+    rejected = {file_type: 0 for file_type in file_types}
+    skipped_known = {file_type: 0 for file_type in file_types}
+
+    if log_callback:
+        for file_type in matcher.skipped:
+            log_callback(f'==== Skipping {file_type.upper()}: no header signature to search for ====')
+
+    session = None
+    start = 0
+    if session_path:
+        mode = "index" if index_only else "carve"
+        try:
+            session = CarveSession(session_path, drive, file_types, mode)
+        except SessionMismatch as e:
+            if log_callback:
+                log_callback(f'==== {e}: starting a fresh journal ====')
+            session = CarveSession(session_path, drive, file_types, mode, restart=True)
+        if session.complete:
+            session.close()
+            if log_callback:
+                log_callback(f'==== Session {session_path} already completed: starting a fresh run ====')
+            session = CarveSession(session_path, drive, file_types, mode, restart=True)
+        if index_only:
+            for _, file_type, _, _, _ in session.hits():
+                recovered[file_type] += 1
+        else:
+            recovered.update(session.recovered_counts())
+            busy_until.update(session.busy_until())
+        start = session.watermark
+        if start and log_callback:
+            log_callback(f'==== Resuming from location: {hex(start)} ====')
+
+    # Footerless hits (all at one location) waiting for the next validated hit to bound their carves,
+    # and the carve a stop cut short; the journal watermark never passes either
+    waiting = []
+    interrupted = []
+    # Carves as (file_type, start, end, path), in offset order, not journaled until their output is on disk
+    unwritten = deque()
+
+    def journal_written():
+        while unwritten:
+            path = unwritten[0][3]
+            if source.writer and path and not source.writer.written(path):
+                break
+            session.record_hit(*unwritten.popleft())
+
+    def progress(offset):
+        if session:
+            # Writers keep running: the watermark only stops short of the oldest carve still being written
+            if source.writer:
+                source.writer.raise_error()
+            journal_written()
+            held = [offset] + [location for location, _ in waiting[:1]] + interrupted[:1]
+            if unwritten:
+                held.append(unwritten[0][1])
+            session.advance(min(held))
+        if tracker:
+            tracker.update(offset)
+
+    store = ContentStore(save_path) if dedupe and not index_only else None
+    writer = WriterPool(writer_threads) if writer_threads and not index_only else None
+    extents = scan_extents
+    if allocation:
+        extents = allocation.extents if extents is None else intersect_extents(extents, allocation.extents)
+    if extents is not None:
+        # Resume inside the chosen regions: drop what lies before the journal watermark
+        extents = [(max(extent_start, start), end) for extent_start, end in extents if end > start]
+    if scan_extents is not None and log_callback:
+        log_callback(f'==== Scanning {sum(end - begin for begin, end in extents):,} bytes in {len(extents):,} '
+                     f'selected region(s) ====')
+
+    with CarveSource(drive, io_mode, writer) as source:
+        if tracker:
+            tracker.begin(start, source.size)
+        if workers > 1:
+            hits = scan_parallel(drive, signatures, matcher.headers, workers, block_size, stop_event,
+                                 start=start, progress=progress, io_mode=io_mode, geometry=matcher.geometry,
+                                 extents=extents, validate=True, validators=validators)
+        elif source.mapped is not None:
+            hits = scan_mapped(source.mapped, matcher, block_size, stop_event, start, progress, extents)
+        else:
+            hits = scan_device(drive, matcher, block_size, stop_event, start, progress=progress, io_mode=io_mode,
+                               extents=extents)
+
+        def carve(location, file_type, next_hit=None):
+            if log_callback:
+                log_callback(f'==== Found {file_type.upper()} at location: {hex(location)} ====')
+
+            file_name = os.path.join(save_path, f'{file_type}_{recovered[file_type]}.{file_type}')
+            result = carve_hit(
+                source, file_type, location, matcher.headers[file_type], matcher.footers[file_type],
+                file_name, block_size, stop_event, max_sizes, discard_oversize, log_callback, store,
+                geometry if bifragment else None, known_files, next_hit
+            )
+            if stop_event and stop_event.is_set():
+                # Left out of the journal, so a resumed run carves it again under the same name
+                interrupted.append(location)
+                return
+            busy_until[file_type] = result.end
+            if result.known:
+                skipped_known[file_type] += 1
+            if session:
+                unwritten.append((file_type, location, result.end, result.path))
+            if result.path:
+                recovered[file_type] += 1
+
+        completed = False
+        try:
+            for location, file_type, *checked in hits:
+                if stop_event and stop_event.is_set():
+                    break
+                if not index_only and location < busy_until[file_type]:
+                    continue  # inside a file of this type we already carved
+                # Parallel hits arrive already checked by the worker that found them
+                if not (checked[0] if checked else validate_hit(source.read, file_type, location, validators)):
+                    rejected[file_type] += 1
+                    continue
+                if tracker:
+                    tracker.hit(file_type, location)
+                if index_only:
+                    session.record_hit(file_type, location, None, None)
+                    recovered[file_type] += 1
+                    continue
+
+                if waiting and location > waiting[0][0]:
+                    for waiting_hit in waiting:
+                        carve(*waiting_hit, next_hit=location)
+                    waiting.clear()
+                if matcher.footers[file_type] is None:
+                    # No footer to stop at: wait for the next hit, where this file ends at the latest
+                    waiting.append((location, file_type))
+                else:
+                    carve(location, file_type)
+            else:
+                if not (stop_event and stop_event.is_set()):
+                    for waiting_hit in waiting:
+                        carve(*waiting_hit)
+                completed = not (stop_event and stop_event.is_set())
+        finally:
+            hits.close()
+            if store:
+                store.close()
+            if session:
+                if completed:
+                    if source.writer:
+                        source.writer.drain()
+                    journal_written()
+                    session.finish(source.size)
+                session.close()
+
+    if log_callback:
+        verb = "Indexed" if index_only else "Recovered"
+        for file_type, count in recovered.items():
+            log_callback(f'==== {verb} {count} {file_type.upper()} file(s) ====')
+            if rejected[file_type]:
+                log_callback(f'==== Rejected {rejected[file_type]} {file_type.upper()} candidate(s) '
+                             f'that failed validation ====')
+            if skipped_known[file_type]:
+                log_callback(f'==== Skipped {skipped_known[file_type]} known {file_type.upper()} file(s) ====')
+    if tracker:
+        tracker.flush(done=completed)
+    return recovered
+
+
+def extract_hits(index_path, signatures, save_path, file_types=None, hit_ids=None, block_size=DEFAULT_BLOCK_SIZE,
+                 stop_event=None, log_callback=None, max_sizes=None, discard_oversize=False, dedupe=False,
+                 io_mode="buffered", known_files=None):
+    """Second step of an index_only run: carve the selected candidates in sorted offset order.
+
+    Candidates can be narrowed by file type and/or by their journal ids.
+    Each output is named after its id, and its end and path are written back
+    to the index so repeated extractions never collide. Candidates whose
+    hash is in known_files are not extracted. A carve cut short by stop_event
+    is deleted and left unextracted in the index, to be carved again later.
+    Returns a dict mapping each file type to the number of files extracted.
+    """
+    index = CarveSession.open_existing(index_path)
+    store = ContentStore(save_path) if dedupe else None
+    extracted = {}
+    try:
+        selected = index.hits(file_types, set(hit_ids) if hit_ids is not None else None)
+        # Every candidate, selected or not, bounds the footerless carve before it
+        starts = [start for _, _, start, _, _ in index.hits()]
+        with CarveSource(index.drive, io_mode) as source:
+            for hit_id, file_type, location, _, _ in selected:
+                if stop_event and stop_event.is_set():
+                    break
+                if log_callback:
+                    log_callback(f'==== Extracting {file_type.upper()} #{hit_id} at location: {hex(location)} ====')
+
+                signature = signatures[file_type]
+                file_name = os.path.join(save_path, f'{file_type}_{hit_id}.{file_type}')
+                following = bisect.bisect_right(starts, location)
+                result = carve_hit(
+                    source, file_type, location, signature[0], signature_footer(signature), file_name,
+                    block_size, stop_event, max_sizes, discard_oversize, log_callback, store, known=known_files,
+                    next_hit=starts[following] if following < len(starts) else None
+                )
+                if stop_event and stop_event.is_set() and result.sha256 is None:
+                    # Cut short (a stored carve was finished first): left unextracted, with nothing half-written
+                    if result.path and os.path.exists(result.path):
+                        os.remove(result.path)
+                    break
+                index.update_hit(hit_id, result.end, result.path)
+                if result.path:
+                    extracted[file_type] = extracted.get(file_type, 0) + 1
+    finally:
+        if store:
+            store.close()
+        index.close()
+    return extracted
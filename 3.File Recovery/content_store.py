@@ -0,0 +1,37 @@
+import csv
+import os
+
+
+class ContentStore:
+    """Content-addressed output directory: every distinct carve is kept once, as <sha256>.<type>.
+
+    manifest.csv in the same directory maps every hit offset to the hash it
+    was stored under, so duplicate hits stay traceable to their location.
+    """
+
+    MANIFEST_FIELDS = ["offset", "file_type", "size", "sha256", "path", "duplicate"]
+
+    def __init__(self, save_path, manifest_name="manifest.csv"):
+        self.save_path = save_path
+        manifest_path = os.path.join(save_path, manifest_name)
+        is_new = not os.path.exists(manifest_path)
+        self.manifest = open(manifest_path, "a", newline="")
+        self.writer = csv.writer(self.manifest)
+        if is_new:
+            self.writer.writerow(self.MANIFEST_FIELDS)
+
+    def store(self, part_path, digest, file_type):
+        """Move a finished carve to its content address; returns (path, duplicate)."""
+        path = os.path.join(self.save_path, f'{digest}.{file_type}')
+        if os.path.exists(path):
+            os.remove(part_path)
+            return path, True
+        os.replace(part_path, path)
+        return path, False
+
+    def record(self, offset, file_type, size, digest, path, duplicate):
+        self.writer.writerow([hex(offset), file_type, size, digest, os.path.basename(path), int(duplicate)])
+        self.manifest.flush()
+
+    def close(self):
+        self.manifest.close()
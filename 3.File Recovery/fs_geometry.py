@@ -0,0 +1,75 @@
+"""Cluster geometry of the filesystem on a partition or partition image.
+
+Files start on a cluster boundary, so once the cluster size and the offset
+of cluster 0 are known, headers only need to be checked at
+data_offset + k * cluster_size. detect_geometry reads the boot sector (or the
+ext superblock) through read(offset, size) -> bytes, the same reader the
+length resolvers use.
+"""
+import struct
+from collections import namedtuple
+
+ClusterGeometry = namedtuple("ClusterGeometry", ["cluster_size", "data_offset", "filesystem"])
+
+EXT_SUPERBLOCK_OFFSET = 1024
+EXT_MAGIC = 0xEF53
+
+
+def _power_of_two(value):
+    return value > 0 and not value & (value - 1)
+
+
+def _ntfs(boot):
+    bytes_per_sector, sectors_per_cluster = struct.unpack("<HB", boot[11:14])
+    # Values above 0x80 encode the cluster size as a negative power of two
+    if sectors_per_cluster > 0x80:
+        cluster_size = 1 << (256 - sectors_per_cluster)
+    else:
+        cluster_size = bytes_per_sector * sectors_per_cluster
+    return ClusterGeometry(cluster_size, 0, "ntfs")
+
+
+def _exfat(boot):
+    cluster_heap_offset, = struct.unpack("<I", boot[88:92])
+    sector_shift, cluster_shift = boot[108], boot[109]
+    return ClusterGeometry(1 << (sector_shift + cluster_shift), cluster_heap_offset << sector_shift, "exfat")
+
+
+def _fat(boot):
+    bytes_per_sector, sectors_per_cluster, reserved, num_fats, root_entries, total16, _, fat_size16 = \
+        struct.unpack("<HBHBHHBH", boot[11:24])
+    if not _power_of_two(bytes_per_sector) or not _power_of_two(sectors_per_cluster) or not num_fats:
+        return None
+    fat_size = fat_size16 or struct.unpack("<I", boot[36:40])[0]
+    root_dir_sectors = -(-(root_entries * 32) // bytes_per_sector)
+    data_sector = reserved + num_fats * fat_size + root_dir_sectors
+    filesystem = "fat32" if not fat_size16 else "fat"
+    return ClusterGeometry(bytes_per_sector * sectors_per_cluster, data_sector * bytes_per_sector, filesystem)
+
+
+def _ext(superblock):
+    magic, = struct.unpack("<H", superblock[56:58])
+    if magic != EXT_MAGIC:
+        return None
+    log_block_size, = struct.unpack("<I", superblock[24:28])
+    if log_block_size > 6:
+        return None
+    return ClusterGeometry(1024 << log_block_size, 0, "ext")
+
+
+def detect_geometry(read):
+    """ClusterGeometry of the filesystem whose first sector is at offset 0, or None if unrecognised."""
+    boot = read(0, 512)
+    if len(boot) == 512:
+        if boot[3:11] == b'NTFS    ':
+            return _ntfs(boot)
+        if boot[3:11] == b'EXFAT   ':
+            return _exfat(boot)
+        if boot[510:512] == b'\x55\xaa' and boot[0] in (0xEB, 0xE9):
+            geometry = _fat(boot)
+            if geometry:
+                return geometry
+    superblock = read(EXT_SUPERBLOCK_OFFSET, 1024)
+    if len(superblock) == 1024:
+        return _ext(superblock)
+    return None
@@ -0,0 +1,265 @@
+"""Cheap plausibility checks that reject false-positive header hits before carving.
+
+Short headers such as b'MZ', b'BM', b'#' or b'{' occur all over any disk,
+and shared ones (PK\\x03\\x04, RIFF) fire for several types at once. Every
+validator takes read(offset, size) -> bytes and the absolute offset of the
+header, and returns True when the bytes around it look like the start of a
+real file of that type. Validators read a few hundred bytes at most; types
+without one are always accepted.
+"""
+import struct
+import zlib
+
+# Bytes of a text-like candidate inspected, and how much of it must be clean text
+# (a short file is followed by slack, so only its leading run has to be text)
+TEXT_PROBE_SIZE = 512
+TEXT_MIN_RUN = 64
+TEXT_WHITESPACE = b'\t\n\r\x0c'
+
+PE_MACHINES = {0x014C, 0x8664, 0x01C0, 0x01C4, 0xAA64, 0x0200}
+IMAGE_FILE_DLL = 0x2000
+
+BMP_DIB_SIZES = {12, 40, 52, 56, 64, 108, 124}
+BMP_BIT_COUNTS = {1, 4, 8, 16, 24, 32}
+
+PNG_BIT_DEPTHS = {1, 2, 4, 8, 16}
+PNG_COLOR_TYPES = {0, 2, 3, 4, 6}
+
+ZIP_METHODS = {0, 1, 6, 8, 9, 12, 14, 19, 93, 95, 96, 97, 98, 99}
+
+
+def _is_text(data):
+    """No NULs or control characters other than whitespace; bytes >= 0x80 pass as UTF-8/Latin-1."""
+    return bool(data) and len(_text_run(data)) == len(data)
+
+
+def _text_run(data):
+    """The leading part of data that is clean text."""
+    for index, byte in enumerate(data):
+        if byte < 0x20 and byte not in TEXT_WHITESPACE or byte == 0x7F:
+            return data[:index]
+    return data
+
+
+def _read_text(read, start):
+    """Leading text run at start, or None when it is too short to be a text file."""
+    data = read(start, TEXT_PROBE_SIZE)
+    run = _text_run(data)
+    return run if data and len(run) >= min(TEXT_MIN_RUN, len(data)) else None
+
+
+def pe_header(is_dll):
+    """Validator for exe (is_dll False) or dll: a PE signature at e_lfanew and a known machine type."""
+    def validate(read, start):
+        dos_header = read(start, 64)
+        if len(dos_header) < 64:
+            return False
+        e_lfanew, = struct.unpack("<I", dos_header[0x3C:0x40])
+        if e_lfanew < 64 or e_lfanew > 16 * 1024 * 1024:
+            return False
+        coff = read(start + e_lfanew, 24)
+        if len(coff) < 24 or coff[:4] != b'PE\x00\x00':
+            return False
+        machine, num_sections = struct.unpack("<HH", coff[4:8])
+        optional_size, characteristics = struct.unpack("<HH", coff[20:24])
+        if machine not in PE_MACHINES or not 0 < num_sections <= 96 or optional_size < 2:
+            return False
+        if bool(characteristics & IMAGE_FILE_DLL) != is_dll:
+            return False
+        magic = read(start + e_lfanew + 24, 2)
+        return magic in (b'\x0b\x01', b'\x0b\x02')
+    return validate
+
+
+def bmp_header(read, start):
+    """Plausible BITMAPFILEHEADER and DIB header fields."""
+    header = read(start, 30)
+    if len(header) < 30:
+        return False
+    file_size, reserved, pixel_offset, dib_size = struct.unpack("<IIII", header[2:18])
+    if reserved or dib_size not in BMP_DIB_SIZES:
+        return False
+    if not 14 + dib_size <= pixel_offset < file_size:
+        return False
+    if dib_size == 12:
+        width, height, planes, bit_count = struct.unpack("<HHHH", header[18:26])
+    else:
+        width, height, planes, bit_count = struct.unpack("<iiHH", header[18:30])
+    return planes == 1 and bit_count in BMP_BIT_COUNTS and width > 0 and height != 0
+
+
+def png_ihdr(read, start):
+    """An IHDR chunk with valid fields and CRC right after the signature."""
+    chunk = read(start + 8, 25)
+    if len(chunk) < 25:
+        return False
+    length, chunk_type = struct.unpack(">I4s", chunk[:8])
+    if length != 13 or chunk_type != b'IHDR':
+        return False
+    width, height, depth, color_type, compression, filter_method, interlace = struct.unpack(">IIBBBBB", chunk[8:21])
+    if not (0 < width < 2 ** 31 and 0 < height < 2 ** 31):
+        return False
+    if depth not in PNG_BIT_DEPTHS or color_type not in PNG_COLOR_TYPES:
+        return False
+    if compression or filter_method or interlace > 1:
+        return False
+    crc, = struct.unpack(">I", chunk[21:25])
+    return zlib.crc32(chunk[4:21]) == crc
+
+
+def jpeg_app0(read, start):
+    """A JFIF/JFXX APP0 segment follows the SOI marker."""
+    segment = read(start + 4, 7)
+    if len(segment) < 7:
+        return False
+    length, = struct.unpack(">H", segment[:2])
+    return length >= 8 and segment[2:7] in (b'JFIF\x00', b'JFXX\x00')
+
+
+def zip_entry(first_name=None):
+    """Validator for a ZIP local file header, optionally requiring the first entry's name prefix.
+
+    Office files, JARs and EPUBs share the ZIP header; their conventional
+    first entry tells them apart without reading the central directory.
+    """
+    def validate(read, start):
+        header = read(start, 30)
+        if len(header) < 30:
+            return False
+        version, flags, method = struct.unpack("<HHH", header[4:10])
+        name_len, = struct.unpack("<H", header[26:28])
+        if version > 100 or method not in ZIP_METHODS or not 0 < name_len <= 1024:
+            return False
+        name = read(start + 30, name_len)
+        if len(name) < name_len or not _is_text(name):
+            return False
+        return first_name is None or any(name.startswith(prefix) for prefix in first_name)
+    return validate
+
+
+def riff_form(form_type):
+    """Validator for a RIFF container whose form type (WAVE, AVI , WEBP) must match."""
+    def validate(read, start):
+        header = read(start, 12)
+        return len(header) == 12 and header[8:12] == form_type and struct.unpack("<I", header[4:8])[0] >= 4
+    return validate
+
+
+def gzip_header(read, start):
+    """Deflate method and no reserved flag bits."""
+    header = read(start, 10)
+    return len(header) == 10 and header[2] == 8 and not header[3] & 0xE0
+
+
+def id3_header(read, start):
+    """ID3v2.2-2.4 tag header with a syncsafe size."""
+    header = read(start, 10)
+    if len(header) < 10:
+        return False
+    major, revision, flags = header[3], header[4], header[5]
+    return 2 <= major <= 4 and revision != 0xFF and not flags & 0x0F and all(byte < 0x80 for byte in header[6:10])
+
+
+def sqlite_header(read, start):
+    """Power-of-two page size and the fixed payload fractions of the database header."""
+    header = read(start, 24)
+    if len(header) < 24:
+        return False
+    page_size, = struct.unpack(">H", header[16:18])
+    if page_size == 1:
+        page_size = 65536
+    return page_size >= 512 and not page_size & (page_size - 1) and header[21:24] == b'\x40\x20\x20'
+
+
+def class_header(read, start):
+    """Java class file major version (Mach-O fat binaries share CAFEBABE but carry a small count)."""
+    header = read(start, 8)
+    return len(header) == 8 and 45 <= struct.unpack(">H", header[6:8])[0] <= 80
+
+
+def psd_header(read, start):
+    header = read(start, 14)
+    if len(header) < 14:
+        return False
+    version, = struct.unpack(">H", header[4:6])
+    channels, = struct.unpack(">H", header[12:14])
+    return version in (1, 2) and header[6:12] == b'\x00' * 6 and 1 <= channels <= 56
+
+
+def tiff_header(read, start):
+    """First IFD offset points past the 8-byte header."""
+    header = read(start, 8)
+    if len(header) < 8:
+        return False
+    order = "<" if header[:2] == b'II' else ">"
+    return struct.unpack(order + "I", header[4:8])[0] >= 8
+
+
+def tar_magic(read, start):
+    """POSIX ('ustar\\x0000') or GNU ('ustar  \\x00') magic."""
+    return read(start, 8) in (b'ustar\x0000', b'ustar  \x00')
+
+
+def iso_descriptor(read, start):
+    """A volume descriptor: known type byte before 'CD001' and version 1 after it."""
+    if start < 1:
+        return False
+    descriptor = read(start - 1, 7)
+    return len(descriptor) == 7 and descriptor[0] in (0, 1, 2, 3, 0xFF) and descriptor[6] == 1
+
+
+def json_start(read, start):
+    """'{' followed by optional whitespace and a key or the closing brace, in clean text."""
+    text = _read_text(read, start)
+    return text is not None and text[1:].lstrip(b' \t\r\n')[:1] in (b'"', b'}')
+
+
+def text_with(markers):
+    """Validator for a text format: clean text that contains one of markers near the header."""
+    def validate(read, start):
+        text = _read_text(read, start)
+        return text is not None and any(marker in text for marker in markers)
+    return validate
+
+
+HIT_VALIDATORS = {
+    "exe": pe_header(is_dll=False),
+    "dll": pe_header(is_dll=True),
+    "bmp": bmp_header,
+    "png": png_ihdr,
+    "jpg": jpeg_app0,
+    "zip": zip_entry(),
+    "docx": zip_entry((b'[Content_Types].xml', b'_rels/', b'docProps/', b'word/')),
+    "xlsx": zip_entry((b'[Content_Types].xml', b'_rels/', b'docProps/', b'xl/')),
+    "jar": zip_entry((b'META-INF/',)),
+    "epub": zip_entry((b'mimetype',)),
+    "wav": riff_form(b'WAVE'),
+    "avi": riff_form(b'AVI '),
+    "webp": riff_form(b'WEBP'),
+    "gz": gzip_header,
+    "tar.gz": gzip_header,
+    "mp3": id3_header,
+    "sqlite": sqlite_header,
+    "class": class_header,
+    "psd": psd_header,
+    "tiff": tiff_header,
+    "tar": tar_magic,
+    "iso": iso_descriptor,
+    "json": json_start,
+    "xml": text_with((b'?>',)),
+    "html": text_with((b'>',)),
+    "css": text_with((b'*/', b'{', b':')),
+    "js": text_with((b'\n',)),
+    "py": text_with((b'import ', b'def ', b'python', b'class ')),
+}
+
+
+def validate_hit(read, file_type, start, validators=None):
+    """True if the hit at start passes the validator for file_type (or there is none)."""
+    validator = (HIT_VALIDATORS if validators is None else validators).get(file_type)
+    if validator is None:
+        return True
+    try:
+        return validator(read, start)
+    except struct.error:
+        return False
@@ -0,0 +1,75 @@
+"""Hash sets of known files (NSRL RDS, hashdeep, md5sum/sha1sum/sha256sum lists).
+
+Carves whose MD5, SHA-1 or SHA-256 is in the set are stock OS and
+application files nobody needs to review. KnownFiles.load takes the first
+32, 40 or 64 digit hex token of every line, which covers NSRLFile.txt
+("SHA-1","MD5",...), hashdeep output, *sum output and plain digest lists.
+Only the algorithms that actually occur in the set are computed for a carve.
+"""
+import hashlib
+import re
+
+DIGEST_ALGORITHMS = {32: "md5", 40: "sha1", 64: "sha256"}
+
+_HEX_TOKEN = re.compile(rb'(?<![0-9A-Fa-f])(?:[0-9A-Fa-f]{64}|[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})(?![0-9A-Fa-f])')
+
+
+class MultiHasher:
+    """hashlib-style object feeding every update() to one hasher per algorithm."""
+
+    def __init__(self, algorithms):
+        self.hashers = {name: hashlib.new(name) for name in algorithms}
+
+    def update(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def digest(self, name):
+        return self.hashers[name].digest()
+
+    def hexdigest(self, name):
+        return self.hashers[name].hexdigest()
+
+
+class KnownFiles:
+    """Digests of known files, kept as raw bytes per algorithm."""
+
+    def __init__(self):
+        self.digests = {name: set() for name in DIGEST_ALGORITHMS.values()}
+
+    @classmethod
+    def load(cls, paths):
+        """KnownFiles holding the digests listed in every file of paths."""
+        known = cls()
+        for path in paths:
+            known.add_file(path)
+        return known
+
+    def add(self, hex_digest):
+        digest = bytes.fromhex(hex_digest.decode() if isinstance(hex_digest, bytes) else hex_digest)
+        self.digests[DIGEST_ALGORITHMS[len(digest) * 2]].add(digest)
+
+    def add_file(self, path):
+        with open(path, "rb") as hash_set:
+            for line in hash_set:
+                token = _HEX_TOKEN.search(line)
+                if token:
+                    self.add(token.group())
+
+    @property
+    def algorithms(self):
+        return [name for name, digests in self.digests.items() if digests]
+
+    def hasher(self, extra=()):
+        """MultiHasher for the algorithms in the set, plus any in extra (e.g. "sha256" for a ContentStore)."""
+        return MultiHasher(dict.fromkeys(self.algorithms + list(extra)))
+
+    def match(self, hasher):
+        """Name of the first algorithm whose digest of hasher's data is known, or None."""
+        for name in self.algorithms:
+            if hasher.digest(name) in self.digests[name]:
+                return name
+        return None
+
+    def __len__(self):
+        return sum(len(digests) for digests in self.digests.values())
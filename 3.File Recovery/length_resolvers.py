@@ -0,0 +1,179 @@
+"""Work out how long a carved file really is from its own structure.
+
+Every resolver takes read(offset, size) -> bytes and the absolute offset of
+the header, and returns the file length in bytes, or None when the structure
+does not parse so the caller can fall back to scanning for a footer.
+"""
+import struct
+
+# Upper bound on chunk/record walks, so corrupt data cannot loop forever
+MAX_RECORDS = 1_000_000
+
+
+def png_length(read, start):
+    """Walk PNG chunks (length, type, data, CRC) until IEND."""
+    pos = start + 8
+    for _ in range(MAX_RECORDS):
+        chunk = read(pos, 8)
+        if len(chunk) < 8:
+            return None
+        length, chunk_type = struct.unpack(">I4s", chunk)
+        if length > 0x7FFFFFFF or not chunk_type.isalpha():
+            return None
+        pos += 12 + length
+        if chunk_type == b'IEND':
+            return pos - start
+    return None
+
+
+def _zip_scan_eocd(read, start, block_size=1024 * 1024):
+    """Find the end-of-central-directory record that belongs to the archive at start."""
+    pos = start
+    tail = b''
+    while True:
+        block = read(pos, block_size)
+        if not block:
+            return None
+        data = tail + block
+        base = pos - len(tail)
+        found = data.find(b'PK\x05\x06')
+        while found >= 0:
+            record = read(base + found, 22)
+            if len(record) == 22:
+                cd_size, cd_offset, comment_len = struct.unpack("<IIH", record[12:22])
+                # The central directory must end right where this record starts
+                if cd_offset + cd_size == base + found - start:
+                    return base + found + 22 + comment_len - start
+            found = data.find(b'PK\x05\x06', found + 1)
+        tail = data[-3:]
+        pos += len(block)
+
+
+def zip_length(read, start):
+    """Walk local headers and the central directory to the end-of-central-directory record.
+
+    Entries written with a data descriptor do not store their size up front,
+    so those archives fall back to searching for a matching EOCD record.
+    """
+    pos = start
+    for _ in range(MAX_RECORDS):
+        signature = read(pos, 4)
+        if signature == b'PK\x03\x04':
+            header = read(pos, 30)
+            if len(header) < 30:
+                return None
+            flags, = struct.unpack("<H", header[6:8])
+            compressed_size, = struct.unpack("<I", header[18:22])
+            name_len, extra_len = struct.unpack("<HH", header[26:30])
+            if flags & 0x08 or compressed_size == 0xFFFFFFFF:
+                return _zip_scan_eocd(read, start)
+            pos += 30 + name_len + extra_len + compressed_size
+        elif signature == b'PK\x01\x02':
+            header = read(pos, 46)
+            if len(header) < 46:
+                return None
+            name_len, extra_len, comment_len = struct.unpack("<HHH", header[28:34])
+            pos += 46 + name_len + extra_len + comment_len
+        elif signature == b'PK\x06\x06':  # ZIP64 end of central directory record
+            record_size = read(pos + 4, 8)
+            if len(record_size) < 8:
+                return None
+            pos += 12 + struct.unpack("<Q", record_size)[0]
+        elif signature == b'PK\x06\x07':  # ZIP64 end of central directory locator
+            pos += 20
+        elif signature == b'PK\x05\x06':
+            record = read(pos, 22)
+            if len(record) < 22:
+                return None
+            comment_len, = struct.unpack("<H", record[20:22])
+            return pos + 22 + comment_len - start
+        else:
+            return None
+    return None
+
+
+def pe_length(read, start):
+    """Size of a PE image on disk: the furthest section, header or certificate table."""
+    dos_header = read(start, 64)
+    if len(dos_header) < 64:
+        return None
+    e_lfanew, = struct.unpack("<I", dos_header[0x3C:0x40])
+    if e_lfanew < 64 or e_lfanew > 16 * 1024 * 1024:
+        return None
+
+    coff = read(start + e_lfanew, 24)
+    if len(coff) < 24 or coff[:4] != b'PE\x00\x00':
+        return None
+    num_sections, = struct.unpack("<H", coff[6:8])
+    optional_size, = struct.unpack("<H", coff[20:22])
+
+    optional = read(start + e_lfanew + 24, optional_size)
+    if len(optional) < optional_size or optional_size < 2:
+        return None
+    magic, = struct.unpack("<H", optional[:2])
+    if magic not in (0x10B, 0x20B):
+        return None
+
+    section_table = e_lfanew + 24 + optional_size
+    end = section_table + 40 * num_sections
+    sections = read(start + section_table, 40 * num_sections)
+    if len(sections) < 40 * num_sections:
+        return None
+    for index in range(num_sections):
+        raw_size, raw_pointer = struct.unpack("<II", sections[index * 40 + 16:index * 40 + 24])
+        if raw_size:
+            end = max(end, raw_pointer + raw_size)
+
+    # The certificate table (data directory 4) is addressed by file offset and sits past the sections
+    directories = 96 if magic == 0x10B else 112
+    security = directories + 4 * 8
+    if len(optional) >= security + 8:
+        cert_offset, cert_size = struct.unpack("<II", optional[security:security + 8])
+        if cert_offset and cert_size:
+            end = max(end, cert_offset + cert_size)
+    return end
+
+
+def sqlite_length(read, start):
+    """page_size * page_count from the database header, when the in-header page count is valid."""
+    header = read(start, 100)
+    if len(header) < 100:
+        return None
+    page_size, = struct.unpack(">H", header[16:18])
+    if page_size == 1:
+        page_size = 65536
+    if page_size < 512 or page_size & (page_size - 1):
+        return None
+    change_counter, page_count = struct.unpack(">II", header[24:32])
+    version_valid_for, = struct.unpack(">I", header[92:96])
+    if not page_count or change_counter != version_valid_for:
+        return None
+    return page_size * page_count
+
+
+def riff_length(form_type):
+    """Resolver for a RIFF container whose form type (WAVE, AVI , WEBP) must match."""
+    def resolve(read, start):
+        header = read(start, 12)
+        if len(header) < 12 or header[8:12] != form_type:
+            return None
+        size, = struct.unpack("<I", header[4:8])
+        # Chunks are word aligned, so an odd size carries a pad byte
+        return 8 + size + (size & 1)
+    return resolve
+
+
+LENGTH_RESOLVERS = {
+    "png": png_length,
+    "zip": zip_length,
+    "docx": zip_length,
+    "xlsx": zip_length,
+    "jar": zip_length,
+    "epub": zip_length,
+    "exe": pe_length,
+    "dll": pe_length,
+    "sqlite": sqlite_length,
+    "wav": riff_length(b'WAVE'),
+    "avi": riff_length(b'AVI '),
+    "webp": riff_length(b'WEBP'),
+}
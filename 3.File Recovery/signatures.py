@@ -0,0 +1,93 @@
+# Signatures for various file types, shared by every recovery front end.
+# Each entry is [header, ..., end marker]: carving anchors on the first
+# element and, without a structure resolver, stops after the last one.
+# A single-element entry has no end marker (see signature_footer).
+file_signatures = {
+    "jpg": [b'\xff\xd8\xff\xe0', b'\xff\xd8\xff\xe1', b'\xff\xd9'],  # JPEG files
+    "pdf": [b'%PDF-', b'%%EOF'],  # PDF files
+    "png": [b'\x89PNG\r\n\x1a\n', b'\x49\x45\x4e\x44\xae\x42\x60\x82'],  # PNG files
+    "gif": [b'GIF87a', b'GIF89a'],  # GIF files
+    "mp3": [b'\x49\x44\x33', b'\xff\xf3'],  # MP3 files
+    "zip": [b'PK\x03\x04', b'PK\x05\x06', b'PK\x07\x08'],  # ZIP files
+    "rar": [b'Rar!\x1a\x07\x00', b'Rar!\x1a\x07\x01'],  # RAR files
+    "7z": [b'7z\xbc\xaf\x27\x1c'],  # 7z archive files
+    "doc": [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],  # Microsoft Office pre-2007 files
+    "docx": [b'PK\x03\x04'],  # Microsoft Office 2007+ files (ZIP container)
+    "xls": [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],  # Microsoft Excel pre-2007 files
+    "xlsx": [b'PK\x03\x04'],  # Microsoft Excel 2007+ files (ZIP container)
+    "exe": [b'MZ'],  # Executable files
+    "dll": [b'MZ'],  # Dynamic Link Libraries (same signature as EXE)
+    "bmp": [b'BM'],  # Bitmap image files
+    "wav": [b'RIFF', b'WAVE'],  # WAV audio files
+    "avi": [b'RIFF', b'AVI '],  # AVI video files
+    "mov": [b'\x00\x00\x00\x14ftypqt'],  # MOV video files
+    "mp4": [b'\x00\x00\x00\x18ftypmp4'],  # MP4 video files
+    "flv": [b'FLV\x01'],  # Flash video files
+    "webp": [b'RIFF', b'WEBP'],  # WEBP image files
+    "iso": [b'\x43\x44\x30\x30\x31'],  # ISO disc image files
+    "tar": [b'ustar'],  # TAR archive files
+    "gz": [b'\x1f\x8b'],  # Gzip compressed files
+    "json": [b'{', b'[' ],  # JSON files (starts with "{" or "[")
+    "xml": [b'<?xml'],  # XML files
+    "html": [b'<!DOCTYPE html', b'<html'],  # HTML files
+    "css": [b'/*', b'@import'],  # CSS files
+    "js": [b'//', b'function', b'var'],  # JavaScript files
+    "py": [b'#', b'import ', b'def '],  # Python files
+    "txt": [b''],  # Plain text files (no specific signature)
+    "sqlite": [b'SQLite format 3\x00'],  # SQLite database files
+    "tar.gz": [b'\x1f\x8b\x08'],  # Tarball gzip files
+    "class": [b'\xca\xfe\xba\xbe'],  # Java class files
+    "jar": [b'PK\x03\x04'],  # Java archive files
+    "psd": [b'8BPS'],  # Photoshop files
+    "tiff": [b'II*\x00', b'MM\x00*'],  # TIFF image files
+    "epub": [b'PK\x03\x04'],  # EPUB files (ZIP container)
+}
+
+
+def signature_footer(signature):
+    """End marker of signature, or None when its only marker is the header."""
+    return signature[-1] if len(signature) > 1 and signature[-1] != signature[0] else None
+
+
+class SignatureTable:
+    """Signatures compiled into flat tuples indexed by type ID (the position of the type in the dict).
+
+    headers holds every distinct non-empty header once and header_types the
+    IDs of the types that share it (zip/docx/xlsx/jar/epub, exe/dll, ...);
+    type_header is the index in headers of each type's header, or None for
+    types without one (txt); footers holds each type's signature_footer.
+    Built once per process for file_signatures.
+    """
+
+    def __init__(self, signatures):
+        self.types = tuple(signatures)
+        self.type_ids = {file_type: type_id for type_id, file_type in enumerate(self.types)}
+        self.footers = tuple(signature_footer(signature) for signature in signatures.values())
+        header_ids = {}
+        header_types = []
+        type_header = []
+        for type_id, signature in enumerate(signatures.values()):
+            header = signature[0]
+            if not header:
+                type_header.append(None)
+                continue
+            if header not in header_ids:
+                header_ids[header] = len(header_types)
+                header_types.append([])
+            header_types[header_ids[header]].append(type_id)
+            type_header.append(header_ids[header])
+        self.headers = tuple(header_ids)
+        self.header_types = tuple(tuple(type_ids) for type_ids in header_types)
+        self.type_header = tuple(type_header)
+
+    def header(self, file_type):
+        """Header of file_type, or None if it has none to search for."""
+        header_id = self.type_header[self.type_ids[file_type]]
+        return None if header_id is None else self.headers[header_id]
+
+    def footer(self, file_type):
+        """End marker of file_type, or None if it has none."""
+        return self.footers[self.type_ids[file_type]]
+
+
+SIGNATURE_TABLE = SignatureTable(file_signatures)
@@ -0,0 +1,132 @@
+"""Regression tests for allocation_map on small synthetic ext and FAT images."""
+import struct
+
+import pytest
+
+from allocation_map import EXT_BG_BLOCK_UNINIT, EXT_RO_COMPAT_GDT_CSUM, _bit_runs, _merge, unallocated_extents
+from fs_geometry import EXT_MAGIC, EXT_SUPERBLOCK_OFFSET
+
+SECTOR = 512
+EXT_BLOCK = 1024
+
+
+def reader(image):
+    return lambda offset, size: bytes(image[offset:offset + size])
+
+
+def free_runs(first_free_offsets, unit):
+    """Merged (start, end) byte runs of the units starting at each offset."""
+    return _merge((offset, offset + unit) for offset in sorted(first_free_offsets))
+
+
+def ext_image(blocks, allocated, flags=0, ro_compat=0):
+    """One block group of 1 KiB blocks; bitmap in block 3, with a bit set per allocated block."""
+    image = bytearray(4 * EXT_BLOCK)
+    superblock = EXT_SUPERBLOCK_OFFSET
+    struct.pack_into("<IIIIIIII", image, superblock + 4, blocks, 0, 0, 0, 1, 0, 0, 8192)
+    struct.pack_into("<H", image, superblock + 56, EXT_MAGIC)
+    struct.pack_into("<II", image, superblock + 96, 0, ro_compat)
+    descriptor = 2 * EXT_BLOCK
+    struct.pack_into("<I", image, descriptor, 3)
+    struct.pack_into("<H", image, descriptor + 0x12, flags)
+    for block in allocated:
+        bit = block - 1  # the group starts at first_data_block 1
+        image[3 * EXT_BLOCK + bit // 8] |= 1 << bit % 8
+    return image
+
+
+def fat_image(fat_type, clusters, allocated, reserved_nibble=False):
+    """Boot sector and one FAT for clusters of one sector each; allocated entries are end-of-chain."""
+    entry_bits = {"fat12": 12, "fat16": 16, "fat32": 32}[fat_type]
+    reserved = 32 if fat_type == "fat32" else 1
+    root_entries = 0 if fat_type == "fat32" else 512
+    fat_size = -(-(clusters + 2) * entry_bits // 8 // SECTOR) + 1
+    total = reserved + fat_size + root_entries * 32 // SECTOR + clusters
+
+    boot = bytearray(SECTOR)
+    boot[0:11] = b'\xeb\x3c\x90MSDOS5.0'
+    struct.pack_into("<HBHBHHBH", boot, 11, SECTOR, 1, reserved, 1, root_entries,
+                     total if total < 0x10000 else 0, 0xF8, 0 if fat_type == "fat32" else fat_size)
+    struct.pack_into("<II", boot, 32, total if total >= 0x10000 else 0, fat_size)
+    boot[510:512] = b'\x55\xaa'
+
+    table = bytearray(fat_size * SECTOR)
+    for cluster in range(2, clusters + 2):
+        value = (1 << entry_bits) - 1 if cluster in allocated else 0
+        if fat_type == "fat12":
+            pair, = struct.unpack_from("<H", table, cluster * 3 // 2)
+            pair = (pair & 0x000F) | value << 4 if cluster & 1 else (pair & 0xF000) | value
+            struct.pack_into("<H", table, cluster * 3 // 2, pair)
+        elif fat_type == "fat16":
+            struct.pack_into("<H", table, cluster * 2, value)
+        else:
+            if cluster in allocated:
+                value = 0x0FFFFFFF
+            elif reserved_nibble:
+                value = 0xF0000000  # only the reserved high nibble set: still free
+            struct.pack_into("<I", table, cluster * 4, value)
+
+    image = boot + bytearray((reserved - 1) * SECTOR) + table
+    data_offset = (reserved + fat_size + root_entries * 32 // SECTOR) * SECTOR
+    return image, data_offset
+
+
+def test_bit_runs_reads_lsb_first_and_stops_at_count():
+    # 0b11110010: bits 0, 2 and 3 clear; then a zero byte
+    assert list(_bit_runs(b'\xf2\x00', 12)) == [(0, 1), (2, 3), (3, 4), (8, 12)]
+
+
+def test_merge_joins_neighbours_within_gap():
+    assert _merge([(0, 10), (10, 20), (25, 30), (100, 110)], gap=5) == [(0, 30), (100, 110)]
+    assert _merge([(0, 10), (5, 8), (12, 12)]) == [(0, 10)]
+
+
+def test_ext_free_blocks_from_bitmap():
+    blocks = 2048
+    allocated = set(range(1, 40)) | {100, 101, 500}
+    image = ext_image(blocks, allocated)
+    source_size = blocks * EXT_BLOCK + 4096
+
+    result = unallocated_extents(reader(image), source_size, merge_gap=0)
+
+    expected = free_runs([block * EXT_BLOCK for block in range(1, blocks) if block not in allocated]
+                         + [blocks * EXT_BLOCK], EXT_BLOCK)
+    expected[-1] = (expected[-1][0], source_size)
+    assert result.filesystem == "ext"
+    assert result.extents == expected
+
+
+def test_ext_uninitialised_group_is_scanned_whole():
+    blocks = 2048
+    image = ext_image(blocks, set(range(1, blocks)), EXT_BG_BLOCK_UNINIT, EXT_RO_COMPAT_GDT_CSUM)
+
+    result = unallocated_extents(reader(image), blocks * EXT_BLOCK, merge_gap=0)
+
+    assert result.extents == [(EXT_BLOCK, blocks * EXT_BLOCK)]
+
+
+@pytest.mark.parametrize("fat_type, clusters", [("fat12", 1000), ("fat16", 5000), ("fat32", 70000)])
+def test_fat_free_clusters(fat_type, clusters):
+    allocated = set(range(2, 12)) | {50, 51, 52, clusters}
+    image, data_offset = fat_image(fat_type, clusters, allocated, reserved_nibble=fat_type == "fat32")
+    fs_end = data_offset + clusters * SECTOR
+
+    result = unallocated_extents(reader(image), fs_end, merge_gap=0)
+
+    expected = free_runs([data_offset + (cluster - 2) * SECTOR
+                          for cluster in range(2, clusters + 2) if cluster not in allocated], SECTOR)
+    assert result.filesystem == fat_type
+    assert result.extents == expected
+
+
+def test_space_past_the_filesystem_counts_as_free_and_small_gaps_merge():
+    image, data_offset = fat_image("fat16", 5000, set(range(2, 5002)) - {10, 12})
+    fs_end = data_offset + 5000 * SECTOR
+
+    result = unallocated_extents(reader(image), fs_end + 8192, merge_gap=SECTOR)
+
+    assert result.extents == [(data_offset + 8 * SECTOR, data_offset + 11 * SECTOR), (fs_end, fs_end + 8192)]
+
+
+def test_unknown_filesystem():
+    assert unallocated_extents(reader(bytearray(64 * 1024)), 64 * 1024) is None
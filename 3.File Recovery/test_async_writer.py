@@ -0,0 +1,87 @@
+"""Regression tests for async_writer.WriterPool, including hosts without os.pwrite (Windows)."""
+import os
+import threading
+
+import pytest
+
+from async_writer import WriterPool
+from benchmark import make_image
+from carve_session import session_file_name
+from carver import carve_device
+from signatures import file_signatures
+
+
+def finishes(function, timeout=20):
+    """Run function on a thread; returns (finished in time, exception it raised or None)."""
+    outcome = []
+
+    def run():
+        try:
+            function()
+        except Exception as e:
+            outcome.append(e)
+        else:
+            outcome.append(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return bool(outcome), outcome[0] if outcome else None
+
+
+def write_files(pool, folder, count=6):
+    expected = {}
+    for index in range(count):
+        name = str(folder / f"out_{index}.bin")
+        chunks = [bytes([index]) * 1000, memoryview(b"middle" * index), bytes(range(256)) * index]
+        with pool.open(name) as output:
+            for chunk in chunks:
+                output.write(chunk)
+        expected[name] = b"".join(bytes(chunk) for chunk in chunks)
+    return expected
+
+
+@pytest.mark.parametrize("has_pwrite", [True, False])
+def test_outputs_are_written_whole(tmp_path, monkeypatch, has_pwrite):
+    if not has_pwrite:
+        monkeypatch.delattr(os, "pwrite", raising=False)
+    with WriterPool(threads=3, max_pending=4096) as pool:
+        expected = write_files(pool, tmp_path)
+        pool.drain()
+        assert all(pool.written(name) for name in expected)
+
+    for name, data in expected.items():
+        with open(name, "rb") as written:
+            assert written.read() == data
+
+
+def test_writer_failure_is_raised_instead_of_hanging(tmp_path, monkeypatch):
+    def broken(output, offset, data):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(WriterPool, "_write_extent", staticmethod(broken))
+    pool = WriterPool(threads=2)
+    write_files(pool, tmp_path)
+
+    finished, error = finishes(pool.drain)
+    assert finished and isinstance(error, RuntimeError)
+    finished, error = finishes(pool.close)
+    assert finished and isinstance(error, RuntimeError)
+
+
+def test_journaled_carve_without_pwrite_completes(tmp_path, monkeypatch):
+    monkeypatch.delattr(os, "pwrite", raising=False)
+    image = str(tmp_path / "synthetic.img")
+    planted = make_image(image, 4, 3, ["jpg", "png"], files_per_type=3)
+    out = tmp_path / "out"
+    out.mkdir()
+    session_path = str(out / session_file_name(image, ["jpg", "png"]))
+    recovered = []
+
+    finished, error = finishes(lambda: recovered.append(
+        carve_device(image, ["jpg", "png"], file_signatures, str(out), block_size=1024 * 1024,
+                     session_path=session_path, writer_threads=2)))
+
+    assert finished and error is None
+    assert recovered == [{"jpg": 3, "png": 3}]
+    assert len(planted) == 6
@@ -0,0 +1,27 @@
+"""Regression tests for block_map on a small synthetic image, including hosts without os.pwrite (Windows)."""
+import os
+import random
+
+import pytest
+
+from block_map import BlockMap, build_block_map, classify_blocks
+
+BLOCK = 4096
+
+
+@pytest.mark.parametrize("has_pwrite", [True, False])
+def test_map_matches_classify_blocks_across_windows(tmp_path, monkeypatch, has_pwrite):
+    if not has_pwrite:
+        monkeypatch.delattr(os, "pwrite", raising=False)
+    rng = random.Random(3)
+    data = bytes(8 * BLOCK) + rng.randbytes(8 * BLOCK) + b'plain text line\n' * (4 * BLOCK // 16) + b'tail'
+    image, map_path = tmp_path / "synthetic.img", str(tmp_path / "synthetic.map")
+    image.write_bytes(data)
+
+    totals = build_block_map(str(image), map_path, BLOCK, window_size=3 * BLOCK)
+
+    classes, codes = classify_blocks(data, BLOCK)
+    with BlockMap(map_path) as block_map:
+        assert block_map.classes == classes
+        assert bytes(block_map.mapped[-block_map.blocks:]) == codes
+        assert block_map.summary() == totals
@@ -0,0 +1,115 @@
+"""Regression tests for carve_session and the journaled resume of carver.carve_device."""
+import hashlib
+import os
+import threading
+
+import pytest
+
+from benchmark import make_image
+from carve_session import CarveSession, SessionMismatch, session_file_name
+from carver import carve_device
+from signatures import file_signatures
+
+TYPES = ["jpg", "png", "zip"]
+
+
+def carved_digests(folder):
+    digests = set()
+    for name in os.listdir(folder):
+        if not name.endswith((".sqlite", "-wal", "-shm")):
+            with open(os.path.join(folder, name), "rb") as carve:
+                digests.add(hashlib.sha256(carve.read()).hexdigest())
+    return digests
+
+
+@pytest.fixture(scope="module")
+def image(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("image") / "synthetic.img")
+    return path, make_image(path, 8, 7, TYPES, files_per_type=4)
+
+
+def test_session_file_name_depends_on_drive_types_and_mode_only():
+    name = session_file_name("/dev/sdb", ["png", "jpg"])
+
+    assert name == session_file_name("/dev/sdb", ["jpg", "png"])
+    assert name.startswith("recovery_session_") and name.endswith(".sqlite")
+    assert len({name, session_file_name("/dev/sdc", ["jpg", "png"]), session_file_name("/dev/sdb", ["jpg"]),
+                session_file_name("/dev/sdb", ["jpg", "png"], "index")}) == 4
+
+
+def test_only_hits_committed_with_the_watermark_survive(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    session = CarveSession(path, "disk.img", TYPES)
+    session.record_hit("jpg", 100, 600, "jpg_0.jpg")
+    session.record_hit("png", 700, None, None)
+    session.advance(1000)
+    session.record_hit("jpg", 2000, 2500, "jpg_1.jpg")  # never committed: lies past the watermark
+    session.close()
+
+    session = CarveSession(path, "disk.img", reversed(TYPES))
+    assert session.watermark == 1000 and not session.complete
+    assert session.hits() == [(1, "jpg", 100, 600, "jpg_0.jpg"), (2, "png", 700, None, None)]
+    assert session.recovered_counts() == {"jpg": 1}
+    assert session.busy_until() == {"jpg": 600}
+    session.finish(4096)
+    session.close()
+
+    session = CarveSession.open_existing(path)
+    assert session.complete and session.watermark == 4096 and session.drive == "disk.img"
+    session.close()
+
+
+def test_mismatched_journal_raises_until_restarted(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    session = CarveSession(path, "disk.img", TYPES)
+    session.record_hit("jpg", 0, 10, "jpg_0.jpg")
+    session.advance(10)
+    session.close()
+
+    for drive, file_types, mode in (("other.img", TYPES, "carve"), ("disk.img", ["jpg"], "carve"),
+                                    ("disk.img", TYPES, "index")):
+        with pytest.raises(SessionMismatch):
+            CarveSession(path, drive, file_types, mode)
+
+    session = CarveSession(path, "disk.img", ["jpg"], restart=True)
+    assert session.watermark == 0 and session.hits() == []
+    session.close()
+    with pytest.raises(FileNotFoundError):
+        CarveSession.open_existing(str(tmp_path / "missing.sqlite"))
+
+
+def test_stopped_run_resumes_to_the_same_carves(image, tmp_path):
+    path, planted = image
+    whole, resumed = tmp_path / "whole", tmp_path / "resumed"
+    whole.mkdir()
+    resumed.mkdir()
+    carve_device(path, TYPES, file_signatures, str(whole))
+
+    stop_event = threading.Event()
+    found = []
+
+    def stop_after_three(message):
+        if "Found" in message:
+            found.append(message)
+            if len(found) == 3:
+                stop_event.set()
+
+    session_path = str(resumed / session_file_name(path, TYPES))
+    carve_device(path, TYPES, file_signatures, str(resumed), stop_event=stop_event, log_callback=stop_after_three,
+                 session_path=session_path, block_size=1024 * 1024, writer_threads=0)
+    assert len(carved_digests(resumed)) < len(planted)
+    carve_device(path, TYPES, file_signatures, str(resumed), session_path=session_path)
+
+    assert carved_digests(resumed) == carved_digests(whole) == {entry.sha256 for entry in planted}
+
+
+def test_finished_or_mismatched_journal_starts_a_fresh_run(image, tmp_path):
+    path, planted = image
+    session_path = str(tmp_path / "journal.sqlite")
+
+    first = carve_device(path, TYPES, file_signatures, str(tmp_path), session_path=session_path)
+    again = carve_device(path, TYPES, file_signatures, str(tmp_path), session_path=session_path)
+    other = carve_device(path, ["png"], file_signatures, str(tmp_path), session_path=session_path)
+
+    assert first == again == {file_type: 4 for file_type in TYPES}
+    assert other == {"png": 4}
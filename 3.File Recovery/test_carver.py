@@ -0,0 +1,164 @@
+"""Regression tests for carver's parallel scan and carve_device on synthetic images."""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import carver
+from async_writer import WriterPool
+from benchmark import make_image
+from carve_session import CarveSession
+from carver import (RANGES_IN_FLIGHT, CarveSource, carve_device, carve_hit, compile_matcher, extract_hits, map_image,
+                    scan_mapped, scan_parallel)
+from content_store import ContentStore
+from known_files import KnownFiles
+from hit_validators import validate_hit
+from signatures import file_signatures
+
+TYPES = ["jpg", "png", "zip"]
+RANGE_SIZE = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def image(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("image") / "synthetic.img")
+    return path, make_image(path, 4, 11, TYPES, files_per_type=4)
+
+
+def header_and_footer(file_type):
+    matcher = compile_matcher(file_signatures, [file_type])
+    return matcher.headers[file_type], matcher.footers[file_type]
+
+
+def reject(read, start):
+    return False
+
+
+def serial_hits(path, validators=None):
+    with open(path, "rb") as fileD:
+        mapped = map_image(fileD)
+        try:
+            hits = list(scan_mapped(mapped, compile_matcher(file_signatures, TYPES), RANGE_SIZE))
+            return [(location, file_type, validate_hit(lambda offset, size: mapped[offset:offset + size],
+                                                       file_type, location, validators))
+                    for location, file_type in hits]
+        finally:
+            mapped.close()
+
+
+@pytest.mark.parametrize("validators", [None, {"zip": reject}])
+def test_parallel_hits_are_validated_in_order(image, validators):
+    path, _ = image
+
+    hits = list(scan_parallel(path, file_signatures, TYPES, 2, RANGE_SIZE, range_size=RANGE_SIZE, validate=True,
+                              validators=validators))
+
+    assert hits == serial_hits(path, validators)
+    assert all(valid == (validators is None or file_type != "zip") for _, file_type, valid in hits)
+
+
+def test_parallel_scan_keeps_few_ranges_in_flight(image, monkeypatch):
+    path, _ = image
+    submitted, collected, in_flight = [], [], []
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            submitted.append(args[3])
+            in_flight.append(len(submitted) - len(collected))
+            return super().submit(*args, **kwargs)
+
+    monkeypatch.setattr(carver, "ProcessPoolExecutor", CountingExecutor)
+    list(scan_parallel(path, file_signatures, TYPES, 2, RANGE_SIZE, range_size=RANGE_SIZE,
+                       progress=collected.append))
+
+    assert len(submitted) == len(collected) == 4 * 1024 * 1024 // RANGE_SIZE
+    assert max(in_flight) == 2 * RANGES_IN_FLIGHT
+
+
+def test_parallel_carve_matches_serial(image, tmp_path):
+    path, planted = image
+    serial, parallel = tmp_path / "serial", tmp_path / "parallel"
+    serial.mkdir()
+    parallel.mkdir()
+
+    expected = carve_device(path, TYPES, file_signatures, str(serial))
+
+    assert carve_device(path, TYPES, file_signatures, str(parallel), workers=2) == expected
+    assert expected == {file_type: 4 for file_type in TYPES} and len(planted) == 12
+    assert sorted(p.name for p in parallel.iterdir()) == sorted(p.name for p in serial.iterdir())
+
+
+@pytest.mark.parametrize("writer_threads", [0, 2])
+def test_stopped_carve_is_not_stored(image, tmp_path, writer_threads):
+    path, planted = image
+    png = next(entry for entry in planted if entry.file_type == "png")
+    header, footer = header_and_footer("png")
+    stop_event = threading.Event()
+    stop_event.set()
+    store = ContentStore(str(tmp_path))
+    writer = WriterPool(writer_threads) if writer_threads else None
+
+    with CarveSource(path, writer=writer) as source:
+        result = carve_hit(source, "png", png.offset, header, footer, str(tmp_path / "png_0.png"),
+                           stop_event=stop_event, store=store)
+    store.close()
+
+    assert result.path is None and result.sha256 is None
+    assert os.listdir(tmp_path) == ["manifest.csv"]
+    assert (tmp_path / "manifest.csv").read_text().strip() == ",".join(ContentStore.MANIFEST_FIELDS)
+
+
+@pytest.mark.parametrize("file_type", ["jpg", "png"])
+@pytest.mark.parametrize("io_mode", ["buffered", "fadvise"])
+def test_known_file_is_skipped(image, tmp_path, monkeypatch, file_type, io_mode):
+    path, planted = image
+    first, second = [entry for entry in planted if entry.file_type == file_type][:2]
+    header, footer = header_and_footer(file_type)
+    known = KnownFiles()
+    known.add(first.sha256)
+    opened = []
+    open_output = carver.open_output
+
+    def recording_open_output(file_name, *args):
+        opened.append(file_name)
+        return open_output(file_name, *args)
+
+    monkeypatch.setattr(carver, "open_output", recording_open_output)
+
+    with CarveSource(path, io_mode) as source:
+        skipped = carve_hit(source, file_type, first.offset, header, footer, str(tmp_path / "a"), known=known)
+        kept = carve_hit(source, file_type, second.offset, header, footer, str(tmp_path / "b"), known=known)
+
+    assert skipped.known == "sha256" and skipped.path is None
+    assert kept.path == str(tmp_path / "b") and kept.end == second.offset + second.size
+    if io_mode == "buffered":
+        assert opened == [None, None, kept.path]  # hashed first, so a known file is never written
+    assert os.listdir(tmp_path) == ["b"]
+
+
+def test_stopped_extraction_leaves_the_hit_unextracted(image, tmp_path):
+    path, planted = image
+    index_path = str(tmp_path / "index.sqlite")
+    carve_device(path, TYPES, file_signatures, str(tmp_path), session_path=index_path, index_only=True)
+    out = tmp_path / "out"
+    out.mkdir()
+    stop_event = threading.Event()
+    extracting = []
+
+    def stop_at_second(message):
+        if "Extracting" in message:
+            extracting.append(message)
+            if len(extracting) == 2:
+                stop_event.set()
+
+    assert sum(extract_hits(index_path, file_signatures, str(out), stop_event=stop_event,
+                            log_callback=stop_at_second).values()) == 1
+    index = CarveSession.open_existing(index_path)
+    paths = [path for _, _, _, _, path in index.hits()]
+    index.close()
+    assert paths[0] is not None and paths[1:] == [None] * (len(planted) - 1)
+    assert os.listdir(out) == [os.path.basename(paths[0])]
+
+    assert extract_hits(index_path, file_signatures, str(out)) == {file_type: 4 for file_type in TYPES}
+    assert len(os.listdir(out)) == len(planted)
@@ -0,0 +1,98 @@
+"""Regression tests for length_resolvers on synthetic files embedded between unrelated bytes."""
+import io
+import random
+import sqlite3
+import struct
+import zipfile
+
+import pytest
+
+from benchmark import build_sample
+from length_resolvers import LENGTH_RESOLVERS, pe_length, png_length, riff_length, sqlite_length, zip_length
+from signatures import file_signatures
+
+LEAD = 4096
+
+
+def embedded(sample, trailer=b'PK\x05\x06' + bytes(64)):
+    """read() over sample at offset LEAD, with random bytes before it and a decoy EOCD after it."""
+    data = random.Random(1).randbytes(LEAD) + sample + trailer
+    return lambda offset, size: data[offset:offset + size]
+
+
+@pytest.mark.parametrize("file_type", sorted(LENGTH_RESOLVERS))
+def test_resolvers_measure_benchmark_samples(file_type):
+    if file_type == "sqlite" and not hasattr(sqlite3.Connection, "serialize"):
+        pytest.skip("sqlite3 cannot serialize a database here")
+    sample = build_sample(file_type, file_signatures[file_type], bytes(range(256)) * 3 + b'\x01')
+
+    assert LENGTH_RESOLVERS[file_type](embedded(sample), LEAD) == len(sample)
+
+
+def test_png_stops_at_iend_and_rejects_garbage():
+    sample = build_sample("png", file_signatures["png"], b'pixels')
+
+    assert png_length(embedded(sample), LEAD) == len(sample)
+    assert png_length(embedded(sample[:8] + b'\x00\x00\x00\x0d1HDR'), LEAD) is None
+    assert png_length(embedded(sample[:-12], trailer=b''), LEAD) is None
+
+
+def test_zip_with_data_descriptors_finds_its_own_eocd():
+    archive = io.BytesIO()
+
+    class Unseekable(io.RawIOBase):
+        # zipfile writes data descriptors when it cannot seek back to the local header
+        def writable(self):
+            return True
+
+        def write(self, data):
+            return archive.write(data)
+
+    with zipfile.ZipFile(Unseekable(), "w", zipfile.ZIP_DEFLATED) as zipped:
+        zipped.writestr("a.txt", b'first entry ' * 50)
+        zipped.writestr("b.txt", b'second entry ' * 50)
+    sample = archive.getvalue()
+    assert struct.unpack("<H", sample[6:8])[0] & 0x08
+
+    assert zip_length(embedded(sample), LEAD) == len(sample)
+
+
+def test_zip_with_archive_comment():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("a.txt", b'data')
+        zipped.comment = b'archive comment'
+
+    assert zip_length(embedded(archive.getvalue()), LEAD) == len(archive.getvalue())
+
+
+def test_pe_length_includes_certificate_table():
+    sample = bytearray(build_sample("exe", file_signatures["exe"], bytes(1024)))
+    e_lfanew, = struct.unpack_from("<I", sample, 0x3C)
+    security = e_lfanew + 24 + 96 + 4 * 8
+    struct.pack_into("<II", sample, security, len(sample), 256)
+    sample += b'\x01' * 256
+
+    assert pe_length(embedded(bytes(sample)), LEAD) == len(sample)
+    sample[e_lfanew:e_lfanew + 4] = b'XX\x00\x00'
+    assert pe_length(embedded(bytes(sample)), LEAD) is None
+
+
+def test_sqlite_needs_a_valid_in_header_page_count():
+    header = bytearray(100)
+    header[:16] = file_signatures["sqlite"][0]
+    struct.pack_into(">H", header, 16, 4096)
+    struct.pack_into(">II", header, 24, 7, 3)
+    struct.pack_into(">I", header, 92, 7)
+
+    assert sqlite_length(embedded(bytes(header)), LEAD) == 3 * 4096
+    struct.pack_into(">I", header, 92, 6)  # written by a version that did not maintain the count
+    assert sqlite_length(embedded(bytes(header)), LEAD) is None
+
+
+def test_riff_pads_odd_sizes_and_checks_the_form_type():
+    payload = b'WAVE' + b'x' * 7
+    sample = b'RIFF' + struct.pack("<I", len(payload)) + payload + b'\x00'
+
+    assert riff_length(b'WAVE')(embedded(sample), LEAD) == len(sample)
+    assert riff_length(b'AVI ')(embedded(sample), LEAD) is None
@@ -0,0 +1,222 @@
+"""Readers that carve a raw device without flooding the page cache.
+
+"direct" opens the device with O_DIRECT and reads into a page-aligned buffer
+in whole aligned blocks, so nothing is cached at all. "fadvise" uses normal
+reads but tells the kernel to drop every range right after it is read
+(posix_fadvise DONTNEED). "buffered" is a plain open(). When a mode is not
+supported by the platform or the filesystem, the next one down is used.
+
+Windows raw volumes and disks (\\\\.\\C:, \\\\.\\PhysicalDrive0) only accept
+sector-aligned reads and report no size through seek, so whatever the mode
+they are read through SectorReader, and source_length asks the driver for
+their size.
+"""
+import mmap
+import os
+
+IO_MODES = ("buffered", "fadvise", "direct")
+
+# Covers both 512-byte and 4K-sector devices
+DIRECT_ALIGNMENT = 4096
+
+# Windows device namespace prefix of raw volume and disk paths
+RAW_DEVICE_PREFIX = "\\\\.\\"
+IOCTL_DISK_GET_LENGTH_INFO = 0x7405C
+
+
+def is_raw_device(drive):
+    """True for a Windows raw volume or disk path such as \\\\.\\C:."""
+    return os.name == "nt" and str(drive).startswith(RAW_DEVICE_PREFIX)
+
+
+class AlignedReader:
+    """File-like read/seek that only ever reads whole DIRECT_ALIGNMENT blocks.
+
+    Reads are widened to aligned offsets and lengths, landing in an anonymous
+    mmap (always page aligned), and the requested bytes are sliced out.
+    Subclasses fill the buffer in _read_aligned and report the size in length().
+    """
+
+    pos = 0
+    buffer = None
+
+    def _pread(self, offset, size):
+        aligned_start = offset - offset % DIRECT_ALIGNMENT
+        skip = offset - aligned_start
+        length = -(-(skip + size) // DIRECT_ALIGNMENT) * DIRECT_ALIGNMENT
+        if self.buffer is None or len(self.buffer) < length:
+            if self.buffer is not None:
+                self.buffer.close()
+            self.buffer = mmap.mmap(-1, length)
+        count = self._read_aligned(memoryview(self.buffer)[:length], aligned_start)
+        return self.buffer[skip:max(min(count, skip + size), skip)]
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.length() - self.pos
+        data = self._pread(self.pos, size)
+        self.pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            offset += self.length()
+        elif whence == os.SEEK_CUR:
+            offset += self.pos
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def _close_buffer(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+
+class DirectReader(AlignedReader):
+    """AlignedReader over an O_DIRECT descriptor."""
+
+    def __init__(self, drive):
+        self.name = drive
+        self.fd = os.open(drive, os.O_RDONLY | os.O_DIRECT)
+        try:
+            # Some filesystems (tmpfs, many FUSE mounts) accept the flag but reject the read
+            self._pread(0, DIRECT_ALIGNMENT)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _read_aligned(self, view, offset):
+        return os.preadv(self.fd, [view], offset)
+
+    def length(self):
+        return os.lseek(self.fd, 0, os.SEEK_END)
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        self._close_buffer()
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SectorReader(AlignedReader):
+    """AlignedReader over a Windows raw volume or disk, sized with IOCTL_DISK_GET_LENGTH_INFO."""
+
+    def __init__(self, drive):
+        self.name = drive
+        self.fileD = open(drive, "rb", buffering=0)
+        try:
+            self.size = _device_length(self.fileD)
+        except OSError:
+            self.fileD.close()
+            raise
+
+    def _read_aligned(self, view, offset):
+        # The device rejects reads that run past its last sector
+        view = view[:max(min(len(view), self.size - offset), 0)]
+        if not view:
+            return 0
+        self.fileD.seek(offset)
+        return self.fileD.readinto(view)
+
+    def length(self):
+        return self.size
+
+    def fileno(self):
+        return self.fileD.fileno()
+
+    def close(self):
+        self._close_buffer()
+        self.fileD.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _device_length(fileD):
+    """Size in bytes of the Windows volume or disk open as fileD."""
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+    length = ctypes.c_longlong()
+    returned = wintypes.DWORD()
+    device_io_control = ctypes.windll.kernel32.DeviceIoControl
+    device_io_control.argtypes = [wintypes.HANDLE, wintypes.DWORD, wintypes.LPVOID, wintypes.DWORD,
+                                  wintypes.LPVOID, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD), wintypes.LPVOID]
+    device_io_control.restype = wintypes.BOOL
+    if not device_io_control(msvcrt.get_osfhandle(fileD.fileno()), IOCTL_DISK_GET_LENGTH_INFO, None, 0,
+                             ctypes.byref(length), ctypes.sizeof(length), ctypes.byref(returned), None):
+        raise ctypes.WinError()
+    return length.value
+
+
+def source_length(fileD):
+    """Size in bytes of a source opened with open_source (image file, block device or raw Windows device)."""
+    if isinstance(fileD, AlignedReader):
+        return fileD.length()
+    return os.lseek(fileD.fileno(), 0, os.SEEK_END)
+
+
+class FadviseReader:
+    """Buffered reads that drop each range from the page cache once it has been read."""
+
+    def __init__(self, drive):
+        self.name = drive
+        self.fileD = open(drive, "rb", buffering=0)
+        os.posix_fadvise(self.fileD.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def read(self, size=-1):
+        offset = self.fileD.tell()
+        data = self.fileD.read(size)
+        if data:
+            os.posix_fadvise(self.fileD.fileno(), offset, len(data), os.POSIX_FADV_DONTNEED)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.fileD.seek(offset, whence)
+
+    def tell(self):
+        return self.fileD.tell()
+
+    def fileno(self):
+        return self.fileD.fileno()
+
+    def close(self):
+        self.fileD.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_source(drive, io_mode="buffered"):
+    """Open drive for reading with the requested caching behaviour (see IO_MODES)."""
+    if io_mode not in IO_MODES:
+        raise ValueError(f"Unknown I/O mode {io_mode!r}, expected one of {IO_MODES}")
+    if is_raw_device(drive):
+        return SectorReader(drive)
+    if io_mode == "direct" and hasattr(os, "O_DIRECT"):
+        try:
+            return DirectReader(drive)
+        except OSError:
+            io_mode = "fadvise"
+    if io_mode in ("direct", "fadvise") and hasattr(os, "posix_fadvise"):
+        return FadviseReader(drive)
+    return open(drive, "rb")